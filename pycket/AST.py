@@ -12,6 +12,9 @@ class AST(object):
 
     simple = False
 
+    # the class name, set for all subclasses in interpreter.py
+    shape_tag = "AST"
+
     def defined_vars(self): return {}
 
     def interpret(self, env, cont):
@@ -25,6 +28,11 @@ class AST(object):
     def interpret_simple(self, env):
         raise NotImplementedError("abstract base class")
 
+    def interpret_direct(self, env):
+        """ Evaluate the AST with recursive calls instead of continuations,
+        only allowed if direct_depth(self) >= 0 (see interpreter.py) """
+        return self.interpret_simple(env)
+
     def set_surrounding_lambda(self, lam):
         from pycket.interpreter import Lambda
         assert isinstance(lam, Lambda)
@@ -32,6 +40,14 @@ class AST(object):
         for child in self.direct_children():
             child.set_surrounding_lambda(lam)
 
+    def location(self):
+        """ Short source location of the lambda the AST is in, see
+        Lambda.srcloc """
+        lam = self.surrounding_lambda
+        if lam is None:
+            return "<module>"
+        return lam.srcloc()
+
     def set_should_enter(self):
         """ Set the should_enter field and returns whether or not the field was
         already set. The field is only actually mutated when it was originally
@@ -1,9 +1,42 @@
 from rpython.rlib import jit
+from rpython.rlib.listsort import make_timsort_class
+
+# The call graph keeps its strongly connected components up to date while
+# calls are added, with the dynamic topological sort of Pearce and Kelly:
+# the components are numbered in a topological order of the graph. A call
+# that goes from a lower to a higher number needs no work. Otherwise only
+# the components numbered in between are searched, and if the call closed a
+# cycle, the components on it are merged into one recursive component.
+# Otherwise the searched components are renumbered.
+
+class Component(object):
+    def __init__(self, lam, order):
+        self.members = [lam]
+        self.order = order
+        # the components called from and calling into this one
+        self.succ = {}
+        self.pred = {}
+        self.recursive = False
+
+BaseSorter = make_timsort_class()
+
+class ComponentSorter(BaseSorter):
+    def lt(self, a, b):
+        return a.order < b.order
+
+IntSorter = make_timsort_class()
+
+def _sorted_by_order(components):
+    ComponentSorter(components).sort()
+    return components
 
 class CallGraph(object):
     def __init__(self):
         self.calls     = {}
         self.recursive = {}
+        # lambda -> Component
+        self.components = {}
+        self.next_order = 0
 
     def register_call(self, lam, calling_app, cont, env):
         if jit.we_are_jitted():
@@ -21,59 +54,137 @@ class CallGraph(object):
             lam_in_subdct = lam in subdct
         cont_ast = cont.get_next_executed_ast()
         config = env.pycketconfig()
-        is_recursive = False
         if not lam_in_subdct:
             subdct[lam] = None
-            if self.is_recursive(calling_lam, lam):
-                is_recursive = True
+            self.add_call(calling_lam, lam)
+            if self.is_recursive(calling_lam):
                 if config.log_callgraph:
                     print "enabling jitting", calling_lam.tostring()
                 calling_lam.enable_jitting()
         # It is possible to have multiple consuming continuations for a given
         # function body. This will attempt to mark them all.
         same_lambda = cont_ast and cont_ast.surrounding_lambda is calling_lam
-        if same_lambda:
-            if lam_in_subdct: # did not call is_recursive yet
-                is_recursive = self.is_recursive(calling_lam, lam)
-            if is_recursive:
-                if cont_ast.set_should_enter() and config.log_callgraph:
-                    print "jitting downrecursion", cont_ast.tostring()
+        if same_lambda and self.is_recursive(calling_lam):
+            if cont_ast.set_should_enter() and config.log_callgraph:
+                print "jitting downrecursion", cont_ast.tostring()
+
+    def is_recursive(self, lam):
+        """ Is `lam` part of a cycle of calls? """
+        return lam in self.recursive
 
-    def is_recursive(self, lam, starting_from=None):
-        # quatratic in theory, hopefully not very bad in practice
-        if lam in self.recursive:
-            return True
-        if starting_from is None:
-            starting_from = lam
-        reachable = self.calls.get(starting_from, None)
-        if reachable is None:
-            return False
-        todo = []
-        for key in reachable:
-            todo.append((key, Path(starting_from, None)))
-        visited = {}
+    def component(self, lam):
+        component = self.components.get(lam, None)
+        if component is None:
+            component = Component(lam, self.next_order)
+            self.next_order += 1
+            self.components[lam] = component
+        return component
+
+    def add_call(self, calling_lam, lam):
+        source = self.component(calling_lam)
+        target = self.component(lam)
+        if source is target:
+            if calling_lam is lam and not source.recursive:
+                self._mark_recursive(source)
+            return
+        if target in source.succ:
+            return
+        source.succ[target] = None
+        target.pred[source] = None
+        if source.order < target.order:
+            return
+        # the new call goes against the order, search between the two
+        forward = self._search(target, source.order, True)
+        backward = self._search(source, target.order, False)
+        cycle = source in forward
+        # renumber: the components reaching the source first, then the ones
+        # reachable from the target, each group in its old order
+        backward_list = _sorted_by_order(backward.keys())
+        forward_list = []
+        for component in forward:
+            if component not in backward:
+                forward_list.append(component)
+        forward_list = _sorted_by_order(forward_list)
+        orders = [component.order for component in backward_list]
+        orders.extend([component.order for component in forward_list])
+        IntSorter(orders).sort()
+        i = 0
+        for component in backward_list:
+            component.order = orders[i]
+            i += 1
+        for component in forward_list:
+            component.order = orders[i]
+            i += 1
+        if cycle:
+            # the components on a path from the target to the source
+            cycle_list = []
+            for component in backward_list:
+                if component in forward:
+                    cycle_list.append(component)
+            self._merge(cycle_list)
+
+    def _search(self, start, bound, forward):
+        """ The components reachable from `start` (or reaching `start`, if not
+        `forward`) without leaving the orders up to `bound` (or from `bound`)
+        """
+        visited = {start: None}
+        todo = [start]
         while todo:
-            current, path = todo.pop()
-            if current is lam:
-                self.recursive[lam] = None
-                # all the lambdas in the path are recursive too
-                while path:
-                    self.recursive[path.node] = None
-                    path = path.prev
-                return True
-            if current in visited:
-                continue
-            reachable = self.calls.get(current, None)
-            if reachable:
-                for key in reachable:
-                    todo.append((key, Path(current, path)))
-            visited[current] = None
-        return False
+            component = todo.pop()
+            if forward:
+                neighbours = component.succ
+            else:
+                neighbours = component.pred
+            for other in neighbours:
+                if other in visited:
+                    continue
+                if forward and other.order > bound:
+                    continue
+                if not forward and other.order < bound:
+                    continue
+                visited[other] = None
+                todo.append(other)
+        return visited
 
-class Path(object):
-    def __init__(self, node, prev):
-        self.node = node
-        self.prev = prev
+    def _merge(self, cycle_list):
+        # keep the largest component, it has the last order of the cycle
+        merged = cycle_list[0]
+        for component in cycle_list:
+            if len(component.members) > len(merged.members):
+                merged = component
+        merged.order = cycle_list[-1].order
+        in_cycle = {}
+        for component in cycle_list:
+            in_cycle[component] = None
+        for component in cycle_list:
+            if component is merged:
+                continue
+            if not component.recursive:
+                self._mark_recursive(component)
+            for lam in component.members:
+                self.components[lam] = merged
+                merged.members.append(lam)
+            for other in component.succ:
+                del other.pred[component]
+                if other not in in_cycle:
+                    merged.succ[other] = None
+                    other.pred[merged] = None
+            for other in component.pred:
+                if other in in_cycle:
+                    continue
+                del other.succ[component]
+                merged.pred[other] = None
+                other.succ[merged] = None
+        for component in cycle_list:
+            if component is not merged:
+                if component in merged.succ:
+                    del merged.succ[component]
+                if component in merged.pred:
+                    del merged.pred[component]
+        if not merged.recursive:
+            self._mark_recursive(merged)
 
-    def __repr__(self):
-        return "%s -> %s" % (self.node, self.prev)
+    def _mark_recursive(self, component):
+        component.recursive = True
+        for lam in component.members:
+            self.recursive[lam] = None
@@ -25,6 +25,12 @@ pycketoption_descr = OptionDescription(
                default=True, cmdline="--type-size-specialization"),
     BoolOption("prune_env", "prune environment",
                default=True, cmdline="--prune-env"),
+    BoolOption("superinstructions", "fuse a few common AST shapes into single nodes",
+               default=False, cmdline="--superinstructions"),
+    BoolOption("direct_let", "evaluate lets with simple, capture-free rhss without continuations",
+               default=False, cmdline="--direct-let"),
+    BoolOption("count_calls", "count the calls and loop iterations of lambdas and call sites",
+               default=False, cmdline="--count-calls"),
 ])
 
 def get_testing_config(**overrides):
@@ -47,12 +53,18 @@ def compute_executable_suffix(config):
         res.append("-no-strategies")
     if not config.type_size_specialization:
         res.append("-no-type-size-specialization")
+    if config.superinstructions:
+        res.append("-superinstructions")
+    if config.direct_let:
+        res.append("-direct-let")
     if config.fuse_conts:
         res.append("-fuse-conts")
     if config.track_header:
         res.append("-track-header")
     if config.log_callgraph:
         res.append("-log")
+    if config.count_calls:
+        res.append("-count-calls")
     return "".join(res)
 
 
@@ -65,6 +77,9 @@ def compute_executable_suffix(config):
 exposed_options = ['strategies',
                    'type_size_specialization',
                    'prune_env',
+                   'superinstructions',
+                   'direct_let',
+                   'count_calls',
 ]
 
 def expose_options(config):
@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Report of the hot lambdas and call sites of a program.
+#
+# With the count_calls translation option (--count-calls), every Lambda
+# counts how often it is called and how often a loop header inside it is
+# reached, and every App counts how often it is executed (see
+# W_Closure.call_with_extra_info, App.interpret and count_loop). Without the
+# option, the counting code is removed at translation time. At exit the
+# counts are collected from the ASTs of all the loaded modules and printed,
+# sorted, with the source locations of the lambdas.
+#
+from pycket.interpreter import App, Lambda
+
+REPORT_SIZE = 30
+
+def _location(lam):
+    if lam is None:
+        return "<module level>"
+    return lam.srcloc()
+
+def _top(items, count):
+    """ The `count` items with the largest counts, largest first """
+    items = items[:]
+    result = []
+    for i in range(min(count, len(items))):
+        largest = i
+        for j in range(i + 1, len(items)):
+            if items[j][0] > items[largest][0]:
+                largest = j
+        items[i], items[largest] = items[largest], items[i]
+        result.append(items[i])
+    return result
+
+def collect_counts(module_env):
+    """ The counted lambdas and call sites of all the modules, as lists of
+    (count, description) """
+    lambdas = []
+    apps = []
+    for module in module_env.modules.values():
+        todo = module.body[:]
+        while todo:
+            ast = todo.pop()
+            if isinstance(ast, Lambda):
+                if ast.call_count or ast.loop_count:
+                    lambdas.append((ast.call_count + ast.loop_count,
+                                    "%d calls, %d loop iterations: %s" % (
+                                        ast.call_count, ast.loop_count,
+                                        _location(ast))))
+            elif isinstance(ast, App):
+                if ast.call_count:
+                    apps.append((ast.call_count, "%d calls: %s in %s" % (
+                        ast.call_count, ast.tostring()[:60],
+                        _location(ast.surrounding_lambda))))
+            todo.extend(ast.direct_children())
+    return lambdas, apps
+
+def report_counts(module_env, count=REPORT_SIZE):
+    lambdas, apps = collect_counts(module_env)
+    print "hot lambdas:"
+    for n, description in _top(lambdas, count):
+        print "  %s" % description
+    print "hot call sites:"
+    for n, description in _top(apps, count):
+        print "  %s" % description
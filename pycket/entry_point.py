@@ -4,13 +4,21 @@
 # _____ Define and setup target ___
 
 def make_entry_point(pycketconfig=None):
-    from pycket.expand import load_json_ast_rpython, expand_to_ast, PermException, ModTable
-    from pycket.interpreter import interpret_one, ToplevelEnv, interpret_module
+    from pycket.expand import (load_json_ast_rpython, expand_to_ast,
+                               expand_code_to_ast, PermException, ModTable)
+    from pycket.interpreter import (interpret_one, ToplevelEnv, interpret_module,
+                                    ic_stats, shape_stats)
     from pycket.error import SchemeException
-    from pycket.option_helper import parse_args, ensure_json_ast
+    from pycket.option_helper import parse_args, ensure_json_ast, _run, _eval
+    from pycket.parallel_expand import expand_requires_parallel
+    from pycket.serve import Server
+    from pycket.jit_hints import load_jit_hints, save_jit_hints
+    from pycket.counters import report_counts
+    from pycket.profiler import sampler, DEFAULT_INTERVAL
     from pycket.values_string import W_String
 
     from rpython.rlib import jit
+    from rpython.rlib.rarithmetic import string_to_int
 
     def entry_point(argv):
         try:
@@ -27,21 +35,62 @@ def make_entry_point(pycketconfig=None):
         if retval != 0 or config is None:
             return retval
         args_w = [W_String.fromstr_utf8(arg) for arg in args]
-        module_name, json_ast = ensure_json_ast(config, names)
         modtable = ModTable()
-        if json_ast is None:
+        modtable.literals.report = config['literal-stats']
+        modtable.lazy = config['lazy']
+        modtable.inline = config['inline']
+        modtable.simplify = config['simplify']
+        modtable.simplify_stats = config['simplify-stats']
+        ic_stats.enabled = config['ic-stats']
+        shape_stats.enabled = config['shape-stats']
+        if 'cache-dir' in names:
+            modtable.use_cache_dir(names['cache-dir'])
+        if config['serve']:
+            return Server(pycketconfig, modtable).serve()
+        module_name, json_ast = ensure_json_ast(config, names, modtable.manifest)
+        if json_ast is None and config['mode'] is _eval:
+            ast = expand_code_to_ast(names['exprs'], modtable, config['stdlib'])
+        elif json_ast is None:
             ast = expand_to_ast(module_name, modtable)
         else:
+            if 'expand-jobs' in names:
+                jobs = string_to_int(names['expand-jobs'])
+                if jobs > 1:
+                    expand_requires_parallel(json_ast, modtable, jobs)
             ast = load_json_ast_rpython(json_ast, modtable)
+            if config['mode'] is _run:
+                modtable.record_requires(module_name, json_ast)
+        modtable.save_manifest()
         env = ToplevelEnv(pycketconfig)
         env.globalconfig.load(ast)
         env.commandline_arguments = args_w
+        if 'jit-hints' in names:
+            env.module_env.jit_hints = load_jit_hints(names['jit-hints'],
+                                                      modtable.ast_flags())
+        if 'profile' in names:
+            interval = DEFAULT_INTERVAL
+            if 'profile-interval' in names:
+                interval = string_to_int(names['profile-interval'])
+            sampler.enable(interval)
         env.module_env.add_module(module_name, ast)
         try:
             val = interpret_module(ast, env)
         finally:
             from pycket.prims.input_output import shutdown
             shutdown(env)
+            if 'jit-hints' in names:
+                save_jit_hints(names['jit-hints'], env.module_env,
+                               modtable.ast_flags())
+            if env.pycketconfig().count_calls:
+                report_counts(env.module_env)
+            if 'profile' in names:
+                sampler.write(names['profile'])
+            if config['lazy-stats']:
+                modtable.report_lazy()
+            if config['ic-stats']:
+                ic_stats.report()
+            if config['shape-stats']:
+                shape_stats.report()
         return 0
     return entry_point
 
@@ -70,6 +70,8 @@ class ModuleEnv(object):
         self.modules = {}
         self.current_module = None
         self.toplevel_env = toplevel_env
+        # jit_hints.JitHints applied to the modules when they are added
+        self.jit_hints = None
 
     def require(self, module_name):
         assert 0
@@ -80,6 +82,8 @@ class ModuleEnv(object):
         # note that `name` and `module.name` are different!
         assert isinstance(module, Module)
         self.modules[name] = module
+        if self.jit_hints is not None:
+            self.jit_hints.apply(name, module)
 
     @jit.elidable
     def _find_module(self, name):
@@ -125,11 +129,13 @@ class Version(object):
 
 class ToplevelEnv(Env):
     _immutable_fields_ = ["version?", "module_env"]
-    def __init__(self, pycketconfig=None):
+    def __init__(self, pycketconfig=None, module_env=None):
         from rpython.config.config import Config
         self.bindings = {}
         self.version = Version()
-        self.module_env = ModuleEnv(self)
+        if module_env is None:
+            module_env = ModuleEnv(self)
+        self.module_env = module_env
         self.commandline_arguments = []
         self.callgraph = CallGraph()
         self.globalconfig = GlobalConfig()
@@ -9,7 +9,7 @@ from rpython.rlib.rbigint import rbigint
 from rpython.rlib.objectmodel import specialize
 from rpython.rlib.rstring import ParseStringError, ParseStringOverflowError
 from rpython.rlib.rarithmetic import string_to_int
-from pycket import pycket_json
+from pycket import config, pycket_json
 from pycket.error import SchemeException
 from pycket.interpreter import *
 from pycket import values, values_string
@@ -17,6 +17,11 @@ from pycket import values_regex
 from pycket import vector
 from pycket import values_struct
 from pycket import values_hash
+from pycket import serialize
+from pycket.manifest import Manifest
+from pycket.literals import LiteralTable
+from pycket.inline import inline_module
+from pycket.simplify import simplify_module
 
 class ExpandException(SchemeException):
     pass
@@ -90,6 +95,93 @@ def expand_file(fname):
         raise ExpandException("Racket produced an error")
     return data
 
+#### ========================== Functions for talking to an expander server
+
+# A long running expander can be started with
+#
+#   racket -l pycket/expand -- --server <socket>
+#
+# If PYCKET_EXPANDER_SOCKET names its socket, expansion requests are sent
+# there instead of starting a new racket process for every module. There is
+# no default socket: whoever listens on it decides what code pycket runs, so
+# it has to be chosen explicitly. The protocol is one request per connection:
+#
+#   request:  "file <length>\n" <absolute path>
+#             "code <length>\n" <module source>
+#   response: "ok <length>\n" <json>
+#             "error <length>\n" <message>
+
+EXPANDER_SOCKET_VAR = "PYCKET_EXPANDER_SOCKET"
+
+def expander_socket_name():
+    """ The socket of the expander server, "" if none was configured """
+    name = os.environ.get(EXPANDER_SOCKET_VAR, None)
+    if name is None:
+        return ""
+    return name
+
+def _recv_line(sock):
+    line = []
+    while True:
+        c = sock.recv(1)
+        if not c:
+            raise ExpandException("Expander server closed the connection")
+        if c == "\n":
+            return "".join(line)
+        line.append(c)
+
+def _recv_exactly(sock, length):
+    data = []
+    remaining = length
+    while remaining > 0:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            raise ExpandException("Expander server closed the connection")
+        data.append(chunk)
+        remaining -= len(chunk)
+    return "".join(data)
+
+def expand_with_server(command, payload):
+    """ Send a request to the expander server. Returns None if there is no
+    server, so that the caller can start racket itself. """
+    from rpython.rlib import rsocket
+    name = expander_socket_name()
+    if not name or not os.access(name, os.F_OK):
+        return None
+    sock = rsocket.RSocket(rsocket.AF_UNIX, rsocket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(rsocket.UNIXAddress(name))
+        except rsocket.SocketError:
+            # stale socket file, no server listening
+            return None
+        try:
+            sock.sendall("%s %d\n%s" % (command, len(payload), payload))
+            header = _recv_line(sock)
+            parts = header.split(" ")
+            if len(parts) != 2:
+                raise ExpandException("Bad response from expander server: '%s'" % header)
+            try:
+                length = string_to_int(parts[1])
+            except ParseStringError:
+                raise ExpandException("Bad response from expander server: '%s'" % header)
+            data = _recv_exactly(sock, length)
+        except rsocket.SocketError, e:
+            raise ExpandException("Lost connection to expander server: %s" % e.get_msg())
+    finally:
+        sock.close()
+    if parts[0] != "ok":
+        raise ExpandException("Racket produced an error and said '%s'" % data)
+    return data
+
+def _lang_line(stdlib):
+    return "#lang s-exp pycket%s" % (" #:stdlib" if stdlib else "")
+
+def _write_file(fname, data):
+    f = streamio.open_file_as_stream(fname, "w")
+    f.write(data)
+    f.close()
+
 # Call the Racket expander and read its output from STDOUT rather than producing an
 # intermediate (possibly cached) file.
 def expand_file_rpython(rkt_file):
@@ -97,6 +189,9 @@ def expand_file_rpython(rkt_file):
     cmd = "racket %s --stdout \"%s\" 2>&1" % (fn, rkt_file)
     if not os.access(rkt_file, os.R_OK):
         raise ValueError("Cannot access file %s" % rkt_file)
+    data = expand_with_server("file", os.path.abspath(rkt_file))
+    if data is not None:
+        return data
     pipe = create_popen_file(cmd, "r")
     out = pipe.read()
     err = os.WEXITSTATUS(pipe.close())
@@ -106,25 +201,30 @@ def expand_file_rpython(rkt_file):
 
 def expand_file_cached(rkt_file, modtable):
     try:
-        json_file = ensure_json_ast_run(rkt_file)
+        json_file = ensure_json_ast_run(rkt_file, modtable.manifest)
     except PermException:
         return expand_to_ast(rkt_file, modtable)
-    return load_json_ast_rpython(json_file, modtable)
+    module = load_json_ast_rpython(json_file, modtable)
+    modtable.record_requires(rkt_file, json_file)
+    return module
 
 # Expand and load the module without generating intermediate JSON files.
 def expand_to_ast(fname, modtable):
     data = expand_file_rpython(fname)
-    return _to_module(pycket_json.loads(data), modtable).assign_convert_module()
+    modtable.literals.begin_module()
+    module = _to_module_streaming(data, modtable)
+    modtable.literals.end_module(fname)
+    return modtable.convert_module(module)
 
 def expand(s, wrap=False, stdlib=False):
     data = expand_string(s)
     return pycket_json.loads(data)
 
-def expand_file_to_json(rkt_file, json_file):
+def expand_file_to_json(rkt_file, json_file, check_perm=True):
     from rpython.rlib.rfile import create_popen_file
     if not os.access(rkt_file, os.R_OK):
         raise ValueError("Cannot access file %s" % rkt_file)
-    if not os.access(rkt_file, os.W_OK):
+    if check_perm and not os.access(rkt_file, os.W_OK):
         # we guess that this means no permission to write the json file
         raise PermException(rkt_file)
     try:
@@ -134,6 +234,10 @@ def expand_file_to_json(rkt_file, json_file):
     except OSError:
         pass
     print "Expanding %s to %s" % (rkt_file, json_file)
+    data = expand_with_server("file", os.path.abspath(rkt_file))
+    if data is not None:
+        _write_file(json_file, data)
+        return json_file
     cmd = "racket %s --output \"%s\" \"%s\" 2>&1" % (
         fn,
         json_file, rkt_file)
@@ -154,18 +258,116 @@ def expand_code_to_json(code, json_file, stdlib=True, mcons=False, wrap=True):
         pass
     except OSError:
         pass
+    data = expand_with_server("code", _lang_line(stdlib) + code)
+    if data is not None:
+        _write_file(json_file, data)
+        return json_file
     cmd = "racket %s --output \"%s\" --stdin" % (
         fn,
         json_file)
     # print cmd
     pipe = create_popen_file(cmd, "w")
-    pipe.write("#lang s-exp pycket%s" % (" #:stdlib" if stdlib else ""))
+    pipe.write(_lang_line(stdlib))
     pipe.write(code)
     err = os.WEXITSTATUS(pipe.close())
     if err != 0:
         raise ExpandException("Racket produced an error we failed to record")
     return json_file
 
+# Run the shell command `cmd` with `data` on its stdin and return its exit
+# status and output. A second child process writes the input, so that
+# neither side blocks on a full pipe while the other waits for it.
+def _run_with_input(cmd, data):
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.dup2(stdin_read, 0)
+        os.dup2(stdout_write, 1)
+        os.dup2(stdout_write, 2)
+        for fd in [stdin_read, stdin_write, stdout_read, stdout_write]:
+            os.close(fd)
+        try:
+            os.execv("/bin/sh", ["/bin/sh", "-c", cmd])
+        finally:
+            os._exit(127)
+    os.close(stdin_read)
+    os.close(stdout_write)
+    writer = os.fork()
+    if writer == 0:
+        os.close(stdout_read)
+        written = 0
+        try:
+            while written < len(data):
+                written += os.write(stdin_write, data[written:])
+        finally:
+            # the process may have exited early, its output says why
+            os._exit(0)
+    os.close(stdin_write)
+    out = []
+    while True:
+        chunk = os.read(stdout_read, 65536)
+        if not chunk:
+            break
+        out.append(chunk)
+    os.close(stdout_read)
+    os.waitpid(writer, 0)
+    _, status = os.waitpid(pid, 0)
+    return status, "".join(out)
+
+# Expand the source code of a module, piping it through racket without any
+# intermediate files. The source goes to the stdin of racket rather than on
+# its command line, which limits the length of a single argument.
+def expand_code_rpython(source):
+    data = expand_with_server("code", source)
+    if data is not None:
+        return data
+    status, out = _run_with_input("racket %s --stdin --stdout" % fn, source)
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+        raise ExpandException("Racket produced an error and said '%s'" % out)
+    return out
+
+def expand_code_cached(source, modtable):
+    """ The json expansion of the module `source`. Expansions are kept by the
+    ModTable and, if there is one, in the cache directory, keyed by the
+    source code. """
+    data = modtable.expansions.get(source, None)
+    if data is not None:
+        return data
+    manifest = modtable.manifest
+    if manifest is not None:
+        json_file = manifest.lookup(manifest.code_path(source))
+        if json_file is not None:
+            try:
+                data = readfile_rpython(json_file)
+            except OSError:
+                pass
+    if data is None:
+        data = expand_code_rpython(source)
+        if manifest is not None:
+            json_file = manifest.code_path(source) + ".json"
+            tmp = "%s.%d" % (json_file, os.getpid())
+            try:
+                manifest.ensure_cache_dir()
+                _write_file(tmp, data)
+                os.rename(tmp, json_file)
+            except OSError:
+                pass
+    modtable.expansions[source] = data
+    return data
+
+# Expand and load the code given with -e
+def expand_code_to_ast(code, modtable, stdlib=True):
+    source = _lang_line(stdlib) + code
+    data = expand_code_cached(source, modtable)
+    modtable.literals.begin_module()
+    module = _to_module_streaming(data, modtable)
+    modtable.literals.end_module("-e")
+    if modtable.manifest is not None:
+        path = modtable.manifest.code_path(source)
+        modtable.record_requires(path, path + ".json")
+    return modtable.convert_module(module)
+
 
 def needs_update(file_name, json_name):
     try:
@@ -181,13 +383,28 @@ def needs_update(file_name, json_name):
 def _json_name(file_name):
     return file_name + '.json'
 
-def ensure_json_ast_run(file_name):
+def ensure_json_ast_run(file_name, manifest=None):
+    if manifest is not None:
+        return ensure_json_ast_manifest(file_name, manifest)
     json = _json_name(file_name)
     if needs_update(file_name, json):
         return expand_file_to_json(file_name, json)
     else:
         return json
 
+# With a manifest the json files live in the cache directory and are checked
+# by content rather than modification time, see manifest.py
+def ensure_json_ast_manifest(file_name, manifest):
+    json = manifest.lookup(file_name)
+    if json is not None:
+        return json
+    json = manifest.json_name(file_name)
+    try:
+        manifest.ensure_cache_dir()
+    except OSError:
+        raise PermException(manifest.cache_dir)
+    return expand_file_to_json(file_name, json, check_perm=False)
+
 def ensure_json_ast_load(file_name):
     return ensure_json_ast_run(file_name)
 
@@ -206,8 +423,58 @@ def load_json_ast(fname):
     return _to_module(pycket_json.loads(data), modtable).assign_convert_module()
 
 def load_json_ast_rpython(fname, modtable):
+    modtable.literals.begin_module()
+    module = _load_json_ast(fname, modtable)
+    modtable.literals.end_module(fname)
+    return modtable.convert_module(module)
+
+def _load_json_ast(fname, modtable):
+    cache = _ast_cache_name(fname)
+    if not needs_update(fname, cache):
+        module = load_ast_cache(cache, modtable)
+        if module is not None:
+            return module
     data = readfile_rpython(fname)
-    return _to_module(pycket_json.loads(data), modtable).assign_convert_module()
+    module = _to_module_streaming(data, modtable)
+    write_ast_cache(cache, module, modtable)
+    return module
+
+# The binary AST cache sits next to the json file. It stores the module before
+# assignment conversion, which is redone after loading, and is only used by
+# runs with the same ast flags as the one that wrote it.
+def _ast_cache_name(json_name):
+    return json_name + '.ast'
+
+def load_ast_cache(cache, modtable):
+    try:
+        data = readfile_rpython(cache)
+    except OSError:
+        return None
+    table = modtable.table.copy()
+    modules = modtable.modules.copy()
+    depth = len(modtable.current_modules)
+    try:
+        return serialize.deserialize_module(data, modtable)
+    except serialize.DeserializationError:
+        # stale or corrupt cache, fall back to the json file
+        modtable.table = table
+        modtable.modules = modules
+        del modtable.current_modules[depth:]
+        del modtable.requires[depth + 1:]
+        return None
+
+def write_ast_cache(cache, module, modtable):
+    try:
+        data = serialize.serialize_module(module, modtable.ast_flags())
+    except serialize.SerializationError:
+        # the module contains literals we cannot serialize
+        return
+    tmp = cache + '.tmp'
+    try:
+        _write_file(tmp, data)
+        os.rename(tmp, cache)
+    except OSError:
+        pass
 
 def parse_ast(json_string):
     json = pycket_json.loads(json_string)
@@ -288,22 +555,251 @@ def _to_module(json, modtable):
             for (k, _v) in v["config"].value_object().iteritems():
                 config[k] = _v.value_string()
 
-        lang = [_to_require(l, modtable) for l in [v["language"].value_string()] if l != ""]
+        lang = _lang_require(v["language"].value_string(), modtable)
         return Module(v["module-name"].value_string(),
                       lang + [_to_ast(x, modtable) for x in v["body-forms"].value_array()],
                       config)
     else:
         assert 0
 
+def _to_module_streaming(data, modtable):
+    """ Like _to_module(pycket_json.loads(data), modtable), but converts the
+    body forms one by one while parsing, so that the json tree of only a single
+    form is alive at any time. """
+    decoder = pycket_json.OwnJSONDecoder(data)
+    try:
+        name = None
+        lang = None
+        config = {}
+        body = None
+        body_pos = -1
+        decoder.start_object()
+        while True:
+            key = decoder.next_key()
+            if key is None:
+                break
+            if key == "module-name":
+                name = decoder.decode_value().value_string()
+            elif key == "language":
+                lang = _lang_require(decoder.decode_value().value_string(), modtable)
+            elif key == "config":
+                for (k, _v) in decoder.decode_value().value_object().iteritems():
+                    config[k] = _v.value_string()
+            elif key == "body-forms" and lang is not None:
+                body = _to_body_streaming(decoder, modtable)
+            elif key == "body-forms":
+                # the language has to be required before the body is converted
+                body_pos = decoder.pos
+                decoder.skip_value()
+            else:
+                decoder.skip_value()
+        i = decoder.skip_whitespace(decoder.pos)
+        if i < len(data):
+            raise ValueError("Extra data: char %d - %d" % (i, len(data) - 1))
+        if name is None or (body is None and body_pos == -1):
+            raise ExpandException("Incomplete module in json")
+        if lang is None:
+            lang = []
+        if body is None:
+            decoder.pos = body_pos
+            body = _to_body_streaming(decoder, modtable)
+        return Module(name, lang + body, config)
+    finally:
+        decoder.close()
+
+def _lang_require(lang, modtable):
+    if lang == "":
+        return []
+    return [_to_require(lang, modtable)]
+
+def _to_body_streaming(decoder, modtable):
+    body = []
+    decoder.start_array()
+    while decoder.next_element():
+        if modtable.lazy:
+            body.append(_to_form_lazy(decoder, modtable))
+        else:
+            body.append(_to_ast(decoder.decode_value(), modtable))
+    return body
+
+# In lazy mode the bodies of the lambdas that a module defines at the module
+# level are kept as json text and converted when the lambda is first called,
+# see LazyBody. Bodies containing set! are converted right away, since the
+# module's assignment conversion has to know about the module variables they
+# mutate, and so are bodies containing #%variable-reference, which refers to
+# the module being loaded.
+
+def _to_form_lazy(decoder, modtable):
+    i = decoder.skip_whitespace(decoder.pos)
+    if decoder.ll_chars[i] != '{':
+        return _to_ast(decoder.decode_value(), modtable)
+    obj = {}
+    rhs_pos = -1
+    decoder.start_object()
+    while True:
+        key = decoder.next_key()
+        if key is None:
+            break
+        if key == "define-values-body":
+            rhs_pos = decoder.pos
+            decoder.skip_value()
+        else:
+            obj[key] = decoder.decode_value()
+    if rhs_pos == -1:
+        return _to_ast(pycket_json.JsonObject(obj), modtable)
+    end = decoder.pos
+    decoder.pos = rhs_pos
+    rhs = _to_rhs_lazy(decoder, modtable)
+    decoder.pos = end
+    return _to_define_values(obj, rhs)
+
+def _to_rhs_lazy(decoder, modtable):
+    start = decoder.skip_whitespace(decoder.pos)
+    kind = None
+    if decoder.ll_chars[start] == '{':
+        decoder.start_object()
+        while True:
+            key = decoder.next_key()
+            if key is None:
+                break
+            if key == "lambda" or key == "case-lambda":
+                kind = key
+            decoder.skip_value()
+        decoder.pos = start
+    if kind is None:
+        return _to_ast(decoder.decode_value(), modtable)
+    if kind == "lambda":
+        return CaseLambda([_to_lambda_lazy(decoder, modtable)])
+    lams = []
+    decoder.start_object()
+    while True:
+        key = decoder.next_key()
+        if key is None:
+            break
+        if key == "case-lambda":
+            decoder.start_array()
+            while decoder.next_element():
+                lams.append(_to_lambda_lazy(decoder, modtable))
+        else:
+            decoder.skip_value()
+    return CaseLambda(lams)
+
+def _to_lambda_lazy(decoder, modtable):
+    obj = {}
+    body = None
+    decoder.start_object()
+    while True:
+        key = decoder.next_key()
+        if key is None:
+            break
+        if key == "body":
+            body = decoder.value_text()
+        else:
+            obj[key] = decoder.decode_value()
+    if body is None or body.find('"set!"') >= 0 or body.find('"variable-reference"') >= 0:
+        if body is not None:
+            obj["body"] = pycket_json.loads(body)
+        return to_lambda(obj, modtable)
+    fmls, rest = to_formals(obj["lambda"])
+    pos, sourcefile, line = get_srcloc(obj)
+    return make_lambda(fmls, rest, [modtable.lazy_body(body)], pos, sourcefile,
+                       line)
+
+def lazy_body_to_ast(lazy):
+    """ Converts the body of a lambda whose conversion was deferred, called
+    the first time the lambda is called """
+    lam = lazy.surrounding_lambda
+    modtable = lazy.modtable
+    modtable.lazy_converted += 1
+    json = pycket_json.loads(lazy.json)
+    body = [_to_ast(x, modtable) for x in json.value_array()]
+    eager = make_lambda(lam.formals, lam.rest, body, lam.srcpos, lam.srcfile,
+                        lam.srcline)
+    if eager.frees.elems:
+        # cannot happen at the module level
+        raise SchemeException("lazily converted lambda has free variables")
+    eager = eager.assign_convert(variable_set(), None)
+    ast = Begin.make(eager.body)
+    ast.set_surrounding_lambda(lam)
+    return ast
+
 # A table listing all the module files that have been loaded.
 # A module need only be loaded once.
 # Modules (aside from builtins like #%kernel) are listed in the table
 # as paths to their implementing files which are assumed to be normalized.
 class ModTable(object):
 
-    def __init__(self):
+    def __init__(self, manifest=None):
         self.table = {}
+        # the modules whose loading is finished
+        self.modules = {}
         self.current_modules = []
+        # the files required by each module on the stack, the first entry
+        # collects the requires of the toplevel module
+        self.requires = [[]]
+        self.manifest = manifest
+        # source code given with -e -> its json expansion
+        self.expansions = {}
+        self.literals = LiteralTable()
+        # convert the bodies of module level lambdas on their first call
+        self.lazy = False
+        self.lazy_lambdas = 0
+        self.lazy_converted = 0
+        # inline small lambdas before the modules are converted
+        self.inline = False
+        # fold constants and remove dead code before the conversion
+        self.simplify = False
+        self.simplify_stats = False
+
+    def use_cache_dir(self, cache_dir):
+        self.manifest = Manifest(os.path.abspath(cache_dir))
+        self.manifest.load()
+
+    def save_manifest(self):
+        if self.manifest is not None:
+            self.manifest.save()
+
+    def ast_flags(self):
+        """ The options that change the shape of the converted ASTs, to be
+        recorded next to data that refers to that shape """
+        flags = []
+        if self.lazy:
+            flags.append("lazy")
+        if self.inline:
+            flags.append("inline")
+        if self.simplify:
+            flags.append("simplify")
+        if config.superinstructions:
+            flags.append("superinstructions")
+        if config.direct_let:
+            flags.append("direct-let")
+        return ",".join(flags)
+
+    def convert_module(self, module):
+        if self.inline:
+            module = inline_module(module)
+        if self.simplify:
+            module = simplify_module(module, self.simplify_stats)
+        return module.assign_convert_module()
+
+    def lazy_body(self, json):
+        self.lazy_lambdas += 1
+        return LazyBody(json, self)
+
+    def report_lazy(self):
+        print "lazy lambdas: %d, %d never materialized" % (
+            self.lazy_lambdas, self.lazy_lambdas - self.lazy_converted)
+
+    def add_require(self, fname):
+        if fname.startswith("#%"):
+            return
+        requires = self.requires[-1]
+        if fname not in requires:
+            requires.append(fname)
+
+    def record_requires(self, fname, json_file):
+        if self.manifest is not None:
+            self.manifest.record(fname, json_file, self.requires[-1])
 
     def add_module(self, fname):
         #print "Adding module '%s'\n\t\tbecause of '%s'" % (fname, self.current_module or "")
@@ -314,11 +810,13 @@ class ModTable(object):
 
     def push(self, fname):
         self.current_modules.append(fname)
+        self.requires.append([])
 
     def pop(self):
         if not self.current_modules:
             raise SchemeException("No current module")
         self.current_modules.pop()
+        self.requires.pop()
 
     def current_mod(self):
         if not self.current_modules:
@@ -329,16 +827,19 @@ class ModTable(object):
         return fname.startswith("#%") or fname in self.table
 
 def _to_require(fname, modtable):
+    modtable.add_require(fname)
     if modtable.has_module(fname):
-        return Quote(values.w_void)
+        return AlreadyRequired(fname, modtable.modules.get(fname, None))
     modtable.add_module(fname)
     modtable.push(fname)
     module = expand_file_cached(fname, modtable)
     modtable.pop()
+    modtable.modules[fname] = module
     return Require(fname, module)
 
 def get_srcloc(o):
     pos = o["position"].value_int() if "position" in o else -1
+    line = o["line"].value_int() if "line" in o else -1
     source = o["source"] if "source" in o else None
     if source and source.is_object:
         v = source.value_object()
@@ -350,13 +851,20 @@ def get_srcloc(o):
             assert 0
     else:
         sourcefile = None
-    return (pos, sourcefile)
+    return (pos, sourcefile, line)
+
+def _to_define_values(obj, rhs):
+    binders = obj["define-values"].value_array()
+    display_names = obj["define-values-names"].value_array()
+    fmls = [values.W_Symbol.make(x.value_string()) for x in binders]
+    disp_syms = [values.W_Symbol.make(x.value_string()) for x in display_names]
+    return DefineValues(fmls, rhs, disp_syms)
 
 def to_lambda(o, modtable):
     fmls, rest = to_formals(o["lambda"])
-    pos, sourcefile = get_srcloc(o)
+    pos, sourcefile, line = get_srcloc(o)
     return make_lambda(fmls, rest, [_to_ast(x, modtable) for x in o["body"].value_array()],
-                       pos, sourcefile)
+                       pos, sourcefile, line)
 
 
 def _to_ast(json, modtable):
@@ -422,12 +930,7 @@ def _to_ast(json, modtable):
                                         _to_ast(obj["wcm-val"], modtable),
                                         _to_ast(obj["wcm-body"], modtable))
         if "define-values" in obj:
-            binders = obj["define-values"].value_array()
-            display_names = obj["define-values-names"].value_array()
-            fmls = [values.W_Symbol.make(x.value_string()) for x in binders]
-            disp_syms = [values.W_Symbol.make(x.value_string()) for x in display_names]
-            body = _to_ast(obj["define-values-body"], modtable)
-            return DefineValues(fmls, body, disp_syms)
+            return _to_define_values(obj, _to_ast(obj["define-values-body"], modtable))
         if "letrec-bindings" in obj:
             body = [_to_ast(x, modtable) for x in obj["letrec-body"].value_array()]
             bindings = obj["letrec-bindings"].value_array()
@@ -467,9 +970,9 @@ def _to_ast(json, modtable):
         if "test" in obj:
             return If.make_let_converted(_to_ast(obj["test"], modtable), _to_ast(obj["then"], modtable), _to_ast(obj["else"], modtable))
         if "quote" in obj:
-            return Quote(to_value(obj["quote"]))
+            return Quote(modtable.literals.intern(to_value(obj["quote"])))
         if "quote-syntax" in obj:
-            return QuoteSyntax(to_value(obj["quote-syntax"]))
+            return QuoteSyntax(modtable.literals.intern(to_value(obj["quote-syntax"])))
         if "source-name" in obj:
             srcname = obj["source-name"].value_string()
             modname = obj["module"].value_string() if "module" in obj else None
@@ -548,7 +1051,8 @@ def to_value(json):
         if "char" in obj:
             return values.W_Character.make(unichr(int(obj["char"].value_string())))
         if "hash-keys" in obj and "hash-vals" in obj:
-            return values_hash.W_EqualHashTable(
+            return values_hash.W_ImmutableHashTable.make(
+                    values_hash.EQUAL_KIND,
                     [to_value(i) for i in obj["hash-keys"].value_array()],
                     [to_value(i) for i in obj["hash-vals"].value_array()])
         if "regexp" in obj:
@@ -0,0 +1,329 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Persistent maps as hash array mapped tries, for the immutable hash tables
+# (see W_ImmutableHashTable in values_hash.py).
+#
+# A map is never changed, assoc and dissoc return a new map that shares all
+# the nodes that are not on the path to the changed key, so they take time
+# and memory logarithmic in the size of the map.
+#
+# The nodes follow the compressed layout of Steindorfer and Vinju (CHAMP):
+# every node has a bitmap of the hash fragments that are stored in the node
+# itself and one of those that lead to a subnode, and compact lists of the
+# entries and of the subnodes. Keys with the same hash (of HASH_BITS bits)
+# are kept in a collision node. A subnode that is left with a single entry
+# by dissoc is inlined into its parent.
+#
+# make_persistent_map creates the classes for one type of keys, given its
+# hash and equality functions, which must not call back into Racket code.
+#
+BITS = 5
+MASK = (1 << BITS) - 1
+HASH_BITS = 30
+
+def _fold_hash(h):
+    return (h ^ (h >> 15)) & ((1 << HASH_BITS) - 1)
+
+def _popcount(x):
+    # for bitmaps of up to 32 bits
+    x = x - ((x >> 1) & 0x55555555)
+    x = (x & 0x33333333) + ((x >> 2) & 0x33333333)
+    x = (x + (x >> 4)) & 0x0f0f0f0f
+    return (x + (x >> 8) + (x >> 16) + (x >> 24)) & 0x3f
+
+def _index(bitmap, bit):
+    """ The position of the entry for `bit` in the compact list of `bitmap` """
+    return _popcount(bitmap & (bit - 1))
+
+def _bit(hash, shift):
+    return 1 << ((hash >> shift) & MASK)
+
+def _insert(lst, i, x):
+    result = lst[:i]
+    result.append(x)
+    result.extend(lst[i:])
+    return result
+
+def _remove(lst, i):
+    result = lst[:i]
+    result.extend(lst[i + 1:])
+    return result
+
+def _replace(lst, i, x):
+    result = lst[:]
+    result[i] = x
+    return result
+
+
+def make_persistent_map(name, hash_key, eq_key):
+    """ NOT_RPYTHON """
+
+    class Node(object):
+        _attrs_ = []
+        _settled_ = True
+
+        def get(self, key, hash, shift, default):
+            raise NotImplementedError("abstract base class")
+
+        def assoc(self, key, hash, val, shift):
+            """ The node with `key` mapped to `val`, and whether `key` is new
+            """
+            raise NotImplementedError("abstract base class")
+
+        def dissoc(self, key, hash, shift):
+            """ The node without `key`, the node itself if it has no `key` """
+            raise NotImplementedError("abstract base class")
+
+        def single(self):
+            """ Does the node hold exactly one entry and no subnodes? """
+            raise NotImplementedError("abstract base class")
+
+        def single_entry(self):
+            raise NotImplementedError("abstract base class")
+
+        def add_items(self, items):
+            raise NotImplementedError("abstract base class")
+
+        def add_candidates(self, hash, shift, items):
+            """ Add the entries with `hash` to `items` """
+            raise NotImplementedError("abstract base class")
+
+    class BitmapNode(Node):
+        _attrs_ = ["datamap", "nodemap", "hashes", "keys", "vals", "nodes"]
+        _immutable_fields_ = ["datamap", "nodemap", "hashes[*]", "keys[*]",
+                              "vals[*]", "nodes[*]"]
+
+        def __init__(self, datamap, nodemap, hashes, keys, vals, nodes):
+            self.datamap = datamap
+            self.nodemap = nodemap
+            self.hashes = hashes
+            self.keys = keys
+            self.vals = vals
+            self.nodes = nodes
+
+        def get(self, key, hash, shift, default):
+            bit = _bit(hash, shift)
+            if self.datamap & bit:
+                i = _index(self.datamap, bit)
+                if self.hashes[i] == hash and eq_key(self.keys[i], key):
+                    return self.vals[i]
+                return default
+            if self.nodemap & bit:
+                node = self.nodes[_index(self.nodemap, bit)]
+                return node.get(key, hash, shift + BITS, default)
+            return default
+
+        def assoc(self, key, hash, val, shift):
+            bit = _bit(hash, shift)
+            if self.datamap & bit:
+                i = _index(self.datamap, bit)
+                k = self.keys[i]
+                h = self.hashes[i]
+                if h == hash and eq_key(k, key):
+                    if self.vals[i] is val and k is key:
+                        return self, False
+                    return BitmapNode(self.datamap, self.nodemap, self.hashes,
+                                      _replace(self.keys, i, key),
+                                      _replace(self.vals, i, val),
+                                      self.nodes), False
+                # both entries move down into a new subnode
+                node = merge(k, h, self.vals[i], key, hash, val, shift + BITS)
+                j = _index(self.nodemap, bit)
+                return BitmapNode(self.datamap ^ bit, self.nodemap | bit,
+                                  _remove(self.hashes, i),
+                                  _remove(self.keys, i),
+                                  _remove(self.vals, i),
+                                  _insert(self.nodes, j, node)), True
+            if self.nodemap & bit:
+                j = _index(self.nodemap, bit)
+                node = self.nodes[j]
+                new_node, added = node.assoc(key, hash, val, shift + BITS)
+                if new_node is node:
+                    return self, added
+                return BitmapNode(self.datamap, self.nodemap, self.hashes,
+                                  self.keys, self.vals,
+                                  _replace(self.nodes, j, new_node)), added
+            i = _index(self.datamap, bit)
+            return BitmapNode(self.datamap | bit, self.nodemap,
+                              _insert(self.hashes, i, hash),
+                              _insert(self.keys, i, key),
+                              _insert(self.vals, i, val),
+                              self.nodes), True
+
+        def dissoc(self, key, hash, shift):
+            bit = _bit(hash, shift)
+            if self.datamap & bit:
+                i = _index(self.datamap, bit)
+                if self.hashes[i] != hash or not eq_key(self.keys[i], key):
+                    return self
+                return BitmapNode(self.datamap ^ bit, self.nodemap,
+                                  _remove(self.hashes, i),
+                                  _remove(self.keys, i),
+                                  _remove(self.vals, i),
+                                  self.nodes)
+            if self.nodemap & bit:
+                j = _index(self.nodemap, bit)
+                node = self.nodes[j]
+                new_node = node.dissoc(key, hash, shift + BITS)
+                if new_node is node:
+                    return self
+                if not new_node.single():
+                    return BitmapNode(self.datamap, self.nodemap, self.hashes,
+                                      self.keys, self.vals,
+                                      _replace(self.nodes, j, new_node))
+                # inline the last entry of the subnode
+                h, k, v = new_node.single_entry()
+                i = _index(self.datamap, bit)
+                return BitmapNode(self.datamap | bit, self.nodemap ^ bit,
+                                  _insert(self.hashes, i, h),
+                                  _insert(self.keys, i, k),
+                                  _insert(self.vals, i, v),
+                                  _remove(self.nodes, j))
+            return self
+
+        def single(self):
+            datamap = self.datamap
+            return (self.nodemap == 0 and datamap != 0 and
+                    datamap & (datamap - 1) == 0)
+
+        def single_entry(self):
+            return self.hashes[0], self.keys[0], self.vals[0]
+
+        def add_items(self, items):
+            for i in range(len(self.keys)):
+                items.append((self.keys[i], self.vals[i]))
+            for node in self.nodes:
+                node.add_items(items)
+
+        def add_candidates(self, hash, shift, items):
+            bit = _bit(hash, shift)
+            if self.datamap & bit:
+                i = _index(self.datamap, bit)
+                if self.hashes[i] == hash:
+                    items.append((self.keys[i], self.vals[i]))
+            elif self.nodemap & bit:
+                node = self.nodes[_index(self.nodemap, bit)]
+                node.add_candidates(hash, shift + BITS, items)
+
+    class CollisionNode(Node):
+        _attrs_ = ["hash", "keys", "vals"]
+        _immutable_fields_ = ["hash", "keys[*]", "vals[*]"]
+
+        def __init__(self, hash, keys, vals):
+            self.hash = hash
+            self.keys = keys
+            self.vals = vals
+
+        def find(self, key):
+            for i in range(len(self.keys)):
+                if eq_key(self.keys[i], key):
+                    return i
+            return -1
+
+        def get(self, key, hash, shift, default):
+            if hash != self.hash:
+                return default
+            i = self.find(key)
+            if i < 0:
+                return default
+            return self.vals[i]
+
+        def assoc(self, key, hash, val, shift):
+            if hash != self.hash:
+                # the collision node moves one level down
+                node = BitmapNode(0, _bit(self.hash, shift), [], [], [], [self])
+                new_node, added = node.assoc(key, hash, val, shift)
+                return new_node, added
+            i = self.find(key)
+            if i < 0:
+                keys = self.keys[:]
+                keys.append(key)
+                vals = self.vals[:]
+                vals.append(val)
+                return CollisionNode(hash, keys, vals), True
+            return CollisionNode(hash, _replace(self.keys, i, key),
+                                 _replace(self.vals, i, val)), False
+
+        def dissoc(self, key, hash, shift):
+            if hash != self.hash:
+                return self
+            i = self.find(key)
+            if i < 0:
+                return self
+            if len(self.keys) == 2:
+                j = 1 - i
+                return BitmapNode(_bit(hash, shift), 0, [hash],
+                                  [self.keys[j]], [self.vals[j]], [])
+            return CollisionNode(hash, _remove(self.keys, i),
+                                 _remove(self.vals, i))
+
+        def single(self):
+            return False
+
+        def single_entry(self):
+            assert 0, "unreachable"
+
+        def add_items(self, items):
+            for i in range(len(self.keys)):
+                items.append((self.keys[i], self.vals[i]))
+
+        def add_candidates(self, hash, shift, items):
+            if hash == self.hash:
+                self.add_items(items)
+
+    def merge(key1, hash1, val1, key2, hash2, val2, shift):
+        """ A node with the two entries, whose hashes agree below `shift` """
+        if hash1 == hash2:
+            return CollisionNode(hash1, [key1, key2], [val1, val2])
+        bit1 = _bit(hash1, shift)
+        bit2 = _bit(hash2, shift)
+        if bit1 == bit2:
+            node = merge(key1, hash1, val1, key2, hash2, val2, shift + BITS)
+            return BitmapNode(0, bit1, [], [], [], [node])
+        if bit1 < bit2:
+            return BitmapNode(bit1 | bit2, 0, [hash1, hash2], [key1, key2],
+                              [val1, val2], [])
+        return BitmapNode(bit1 | bit2, 0, [hash2, hash1], [key2, key1],
+                          [val2, val1], [])
+
+    class PersistentMap(object):
+        _attrs_ = _immutable_fields_ = ["root", "size"]
+
+        def __init__(self, root, size):
+            self.root = root
+            self.size = size
+
+        def get(self, key, default):
+            hash = _fold_hash(hash_key(key))
+            return self.root.get(key, hash, 0, default)
+
+        def assoc(self, key, val):
+            hash = _fold_hash(hash_key(key))
+            root, added = self.root.assoc(key, hash, val, 0)
+            if root is self.root:
+                return self
+            return PersistentMap(root, self.size + (1 if added else 0))
+
+        def dissoc(self, key):
+            hash = _fold_hash(hash_key(key))
+            root = self.root.dissoc(key, hash, 0)
+            if root is self.root:
+                return self
+            return PersistentMap(root, self.size - 1)
+
+        def items(self):
+            items = []
+            self.root.add_items(items)
+            return items
+
+        def candidates(self, key):
+            """ The entries whose keys hash like `key`, for callers that
+            need to compare the keys in some other way than eq_key """
+            items = []
+            self.root.add_candidates(_fold_hash(hash_key(key)), 0, items)
+            return items
+
+    PersistentMap.__name__ = name
+    PersistentMap.EMPTY = PersistentMap(BitmapNode(0, 0, [], [], [], []), 0)
+    return PersistentMap
@@ -555,15 +555,40 @@ class W_InterposeHashTable(values_hash.W_HashTable):
     def hash_keys(self):
         return get_base_object(self.inner).hash_keys()
 
+    def unsupported(self, name):
+        return SchemeException("%s: not supported on chaperoned or impersonated hash tables" % name)
+
     @label
     def hash_set(self, key, val, env, cont):
-        raise NotImplementedError("abstract method")
+        raise self.unsupported("hash-set!")
+
+    @label
+    def hash_remove(self, key, env, cont):
+        raise self.unsupported("hash-remove!")
 
     @label
     def hash_ref(self, key, env, cont):
         after = self.post_ref_cont(key, env, cont)
         return self.ref_proc.call([self.inner, key], env, after)
 
+    # hash-count and the positions of hash-iterate-* do not go through the
+    # handlers. The keys and values do, which would need CPS.
+
+    def length(self):
+        return self.inner.length()
+
+    def next_position(self, i):
+        return self.inner.next_position(i)
+
+    def get_item(self, i):
+        raise self.unsupported("hash-iterate-key/value")
+
+    def hash_copy(self):
+        raise self.unsupported("hash-copy")
+
+    def hash_clear(self):
+        raise self.unsupported("hash-clear!")
+
 @continuation
 def imp_hash_table_ref_cont(ht, old, env, cont, _vals):
     from pycket.interpreter import return_value
@@ -0,0 +1,301 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Inlining of small lambdas at known call sites.
+#
+# Calling a closure allocates an environment for its arguments and a
+# continuation for its body, which costs more than the body of small helpers
+# like (define (id x) x). This pass replaces the calls of such lambdas by a
+# copy of their body. The parameters are bound by a let around the copy, or
+# replaced by the argument if it is a constant or a variable that is never
+# assigned.
+#
+# A lambda is inlined at a call if
+#   - it is bound by a define-values of the module or by a let (not a
+#     letrec), and its variable is never assigned,
+#   - it has a single case without rest argument, taking as many arguments
+#     as the call passes,
+#   - it does not refer to itself, and
+#   - its body has at most INLINE_MAX_SIZE AST nodes and contains neither
+#     with-continuation-mark nor #%variable-reference nor lazily converted
+#     lambda bodies.
+#
+# Only calls in the original code are inlined, never the calls in a copy, so
+# mutually recursive lambdas are unfolded at most once. At the module level
+# a call is only inlined after the definition of the lambda. Lambda bodies
+# that are converted lazily (see expand._to_form_lazy) are left alone.
+#
+# The pass works on the module before assign_convert_module, which then
+# computes the environment structures of the copies, and the copied lambdas
+# and those surrounding a copy set its surrounding_lambda as for any other
+# code. The copies start out with should_enter unset, the JIT marks them
+# like the rest of the code. Expanded code has a distinct name for every
+# binding, so the copies cannot capture variables of the call site.
+#
+from pycket.interpreter import (App, Begin, Begin0, CaseLambda, CellRef,
+                                DefineValues, Gensym, If, Lambda, LazyBody,
+                                Let, Letrec, LexicalVar, Module, ModuleVar,
+                                Quote, QuoteSyntax, SetBang, ToplevelVar,
+                                VariableReference, WithContinuationMark,
+                                make_lambda, make_let)
+
+INLINE_MAX_SIZE = 20
+
+def _inlinable_lambda(rhs):
+    """ The Lambda of `rhs` if it is small enough to be inlined, or None """
+    if not isinstance(rhs, CaseLambda) or len(rhs.lams) != 1:
+        return None
+    if rhs.recursive_sym is not None:
+        return None
+    lam = rhs.lams[0]
+    if lam.rest:
+        return None
+    size = 0
+    todo = lam.body[:]
+    while todo:
+        ast = todo.pop()
+        if (isinstance(ast, WithContinuationMark) or
+                isinstance(ast, VariableReference) or
+                isinstance(ast, LazyBody)):
+            return None
+        size += 1
+        if size > INLINE_MAX_SIZE:
+            return None
+        todo.extend(ast.direct_children())
+    return lam
+
+def _refers_to(lam, sym):
+    """ Does `lam` use the module variable `sym`? """
+    todo = lam.body[:]
+    while todo:
+        ast = todo.pop()
+        if (isinstance(ast, ModuleVar) and ast.srcmod is None and
+                ast.srcsym is sym):
+            return True
+        todo.extend(ast.direct_children())
+    return False
+
+def _assigned_vars(body):
+    """ The names of all the variables that are set! somewhere in `body` """
+    assigned = {}
+    todo = body[:]
+    while todo:
+        ast = todo.pop()
+        if isinstance(ast, SetBang):
+            var = ast.var
+            if isinstance(var, ModuleVar):
+                assigned[var.srcsym] = None
+            else:
+                assigned[var.sym] = None
+        todo.extend(ast.direct_children())
+    return assigned
+
+def _same(new, old):
+    for i in range(len(new)):
+        if new[i] is not old[i]:
+            return False
+    return True
+
+
+class ASTVisitor(object):
+    # build new nodes even if no child changed
+    copy = False
+
+    def visit(self, ast):
+        raise NotImplementedError("abstract base class")
+
+def _map_children(ast, visitor):
+    """ `ast` with every child replaced by visitor.visit(child). Returns `ast`
+    itself if no child changed, unless the visitor copies. """
+    copy = visitor.copy
+    if isinstance(ast, App):
+        rator = visitor.visit(ast.rator)
+        rands = [visitor.visit(rand) for rand in ast.rands]
+        if copy or rator is not ast.rator or not _same(rands, ast.rands):
+            return App.make(rator, rands)
+    elif isinstance(ast, Lambda):
+        body = [visitor.visit(b) for b in ast.body]
+        if copy or not _same(body, ast.body):
+            return make_lambda(ast.formals, ast.rest, body, ast.srcpos,
+                               ast.srcfile, ast.srcline)
+    elif isinstance(ast, CaseLambda):
+        lams = []
+        for lam in ast.lams:
+            new_lam = visitor.visit(lam)
+            assert isinstance(new_lam, Lambda)
+            lams.append(new_lam)
+        if copy or not _same(lams, ast.lams):
+            return CaseLambda(lams, ast.recursive_sym)
+    elif isinstance(ast, Let):
+        rhss = [visitor.visit(rhs) for rhs in ast.rhss]
+        body = [visitor.visit(b) for b in ast.body]
+        if copy or not _same(rhss, ast.rhss) or not _same(body, ast.body):
+            return Let(ast.args, ast.counts, rhss, body)
+    elif isinstance(ast, Letrec):
+        rhss = [visitor.visit(rhs) for rhs in ast.rhss]
+        body = [visitor.visit(b) for b in ast.body]
+        if copy or not _same(rhss, ast.rhss) or not _same(body, ast.body):
+            return Letrec(ast.args, ast.counts, rhss, body)
+    elif isinstance(ast, Begin):
+        body = [visitor.visit(b) for b in ast.body]
+        if copy or not _same(body, ast.body):
+            return Begin.make(body)
+    elif isinstance(ast, Begin0):
+        first = visitor.visit(ast.first)
+        body = visitor.visit(ast.body)
+        if copy or first is not ast.first or body is not ast.body:
+            return Begin0(first, body)
+    elif isinstance(ast, If):
+        tst = visitor.visit(ast.tst)
+        thn = visitor.visit(ast.thn)
+        els = visitor.visit(ast.els)
+        if copy or tst is not ast.tst or thn is not ast.thn or els is not ast.els:
+            return If(tst, thn, els)
+    elif isinstance(ast, SetBang):
+        var = visitor.visit(ast.var)
+        rhs = visitor.visit(ast.rhs)
+        if copy or var is not ast.var or rhs is not ast.rhs:
+            return SetBang(var, rhs)
+    elif isinstance(ast, WithContinuationMark):
+        key = visitor.visit(ast.key)
+        value = visitor.visit(ast.value)
+        body = visitor.visit(ast.body)
+        if copy or key is not ast.key or value is not ast.value or body is not ast.body:
+            return WithContinuationMark(key, value, body)
+    elif isinstance(ast, DefineValues):
+        rhs = visitor.visit(ast.rhs)
+        if copy or rhs is not ast.rhs:
+            return DefineValues(ast.names, rhs, ast.display_names)
+    elif not copy:
+        pass
+    # leaves, only copied
+    elif isinstance(ast, LexicalVar):
+        return LexicalVar(ast.sym)
+    elif isinstance(ast, CellRef):
+        return CellRef(ast.sym)
+    elif isinstance(ast, ModuleVar):
+        return ModuleVar(ast.sym, ast.srcmod, ast.srcsym)
+    elif isinstance(ast, ToplevelVar):
+        return ToplevelVar(ast.sym)
+    elif isinstance(ast, QuoteSyntax):
+        return QuoteSyntax(ast.w_val)
+    elif isinstance(ast, Quote):
+        return Quote(ast.w_val)
+    return ast
+
+
+class Copier(ASTVisitor):
+    """ Copies the body of an inlined lambda, replacing its parameters """
+    copy = True
+
+    def __init__(self, subst):
+        # parameter name -> Quote or LexicalVar
+        self.subst = subst
+
+    def visit(self, ast):
+        if isinstance(ast, LexicalVar):
+            new = self.subst.get(ast.sym, None)
+            if new is not None:
+                ast = new
+        elif isinstance(ast, CellRef):
+            new = self.subst.get(ast.sym, None)
+            if new is not None:
+                # assigned parameters are always bound by a let
+                assert isinstance(new, LexicalVar)
+                return CellRef(new.sym)
+        return _map_children(ast, self)
+
+
+class Inliner(ASTVisitor):
+    def __init__(self, module):
+        self.assigned = _assigned_vars(module.body)
+        # candidates bound by define-values and by lets in scope
+        self.module_lambdas = {}
+        self.let_lambdas = {}
+        for form in module.body:
+            if not isinstance(form, DefineValues) or len(form.names) != 1:
+                continue
+            sym = form.names[0]
+            lam = _inlinable_lambda(form.rhs)
+            if (lam is not None and sym not in self.assigned and
+                    not _refers_to(lam, sym)):
+                self.module_lambdas[sym] = lam
+        # the module variables defined so far and whether the code being
+        # visited runs when the module is instantiated
+        self.defined = {}
+        self.toplevel = True
+        self.inlined = 0
+
+    def inline_module(self, module):
+        body = []
+        for form in module.body:
+            body.append(self.visit(form))
+            if isinstance(form, DefineValues):
+                for sym in form.names:
+                    self.defined[sym] = None
+        return Module(module.name, body, module.config)
+
+    def callee(self, rator):
+        if isinstance(rator, ModuleVar):
+            if rator.srcmod is None and (not self.toplevel or
+                                         rator.srcsym in self.defined):
+                return self.module_lambdas.get(rator.srcsym, None)
+        elif isinstance(rator, LexicalVar):
+            return self.let_lambdas.get(rator.sym, None)
+        return None
+
+    def visit(self, ast):
+        if isinstance(ast, App):
+            lam = self.callee(ast.rator)
+            if lam is not None and len(lam.formals) == len(ast.rands):
+                rands = [self.visit(rand) for rand in ast.rands]
+                return self.inline_call(lam, rands)
+        elif isinstance(ast, Lambda):
+            toplevel = self.toplevel
+            self.toplevel = False
+            result = _map_children(ast, self)
+            self.toplevel = toplevel
+            return result
+        elif isinstance(ast, Let):
+            added = []
+            j = 0
+            for i in range(len(ast.rhss)):
+                if ast.counts[i] == 1:
+                    sym = ast.args.elems[j]
+                    lam = _inlinable_lambda(ast.rhss[i])
+                    if lam is not None and sym not in self.assigned:
+                        self.let_lambdas[sym] = lam
+                        added.append(sym)
+                j += ast.counts[i]
+            result = _map_children(ast, self)
+            for sym in added:
+                del self.let_lambdas[sym]
+            return result
+        return _map_children(ast, self)
+
+    def inline_call(self, lam, rands):
+        self.inlined += 1
+        subst = {}
+        varss = []
+        rhss = []
+        for i in range(len(lam.formals)):
+            formal = lam.formals[i]
+            rand = rands[i]
+            if formal not in self.assigned and (
+                    isinstance(rand, Quote) or
+                    (isinstance(rand, LexicalVar) and rand.sym not in self.assigned)):
+                subst[formal] = rand
+            else:
+                fresh = Gensym.gensym("inline_")
+                varss.append([fresh])
+                rhss.append(rand)
+                subst[formal] = LexicalVar(fresh)
+        copier = Copier(subst)
+        body = [copier.visit(b) for b in lam.body]
+        return make_let(varss, rhss, body)
+
+
+def inline_module(module):
+    """ `module` with the calls of small lambdas replaced by their bodies,
+    before assign_convert_module """
+    return Inliner(module).inline_module(module)
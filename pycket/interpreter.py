@@ -7,6 +7,7 @@ from pycket.cont              import Cont, nil_continuation, label
 from pycket.env               import SymList, ConsEnv, ToplevelEnv
 from pycket.arity             import Arity
 from pycket                   import config
+from pycket.profiler          import sampler
 
 from rpython.rlib             import jit, debug, objectmodel
 from rpython.rlib.objectmodel import r_dict, compute_hash, specialize
@@ -396,6 +397,18 @@ class Module(object):
         new_body = [b.assign_convert(local_muts, None) for b in self.body]
         return Module(self.name, new_body, self.config)
 
+    def reset_vars(self):
+        """ Before the module and the ones it requires are instantiated again,
+        forget the values cached by the ModuleVars in its body. """
+        todo = self.body[:]
+        while todo:
+            ast = todo.pop()
+            if isinstance(ast, ModuleVar):
+                if not ast.is_primitive():
+                    ast.reset()
+            else:
+                todo.extend(ast.direct_children())
+
     def tostring(self):
         return "(module %s %s)"%(self.name," ".join([s.tostring() for s in self.body]))
 
@@ -442,16 +455,44 @@ class Require(AST):
     def assign_convert(self, vars, env_structure):
         return self
 
-    # Interpret the module and add it to the module environment
     def interpret_simple(self, env):
-        top = env.toplevel_env()
-        top.module_env.add_module(self.modname, self.module)
-        self.module.interpret_mod(top)
+        instantiate_module(self.modname, self.module, env)
         return values.w_void
 
     def _tostring(self):
         return "(require %s)"%self.modname
 
+class AlreadyRequired(Quote):
+    """ A require of a module that was already loaded. Evaluates to void like
+    any other quoted void, but remembers the module name so that serialized
+    ASTs can redo the require when they are loaded in a different order.
+
+    `module` is the loaded module, if loading it was finished. A process that
+    runs several programs (see serve.py) shares the loaded modules between
+    them, so the module might not be instantiated yet in the current
+    environment. """
+    _immutable_fields_ = ["modname", "module"]
+
+    def __init__(self, modname, module=None):
+        Quote.__init__(self, values.w_void)
+        self.modname = modname
+        self.module = module
+
+    def interpret_simple(self, env):
+        if self.module is not None:
+            instantiate_module(self.modname, self.module, env)
+        return values.w_void
+
+# Interpret the module and add it to the module environment, unless it was
+# instantiated in this environment already
+def instantiate_module(modname, module, env):
+    top = env.toplevel_env()
+    module_env = top.module_env
+    if modname in module_env.modules:
+        return
+    module_env.add_module(modname, module)
+    module.interpret_mod(top)
+
 empty_vals = values.Values.make([])
 
 def jump(env, cont):
@@ -613,9 +654,57 @@ class WithContinuationMark(AST):
     def interpret(self, env, cont):
         return self.key, env, WCMKeyCont(self, env, cont)
 
+class InlineCacheStats(object):
+    """ Hit rates of the inline caches of the App nodes, see
+    App.lambda_index. The App nodes only count when enabled. """
+    _immutable_fields_ = ["enabled?"]
+
+    def __init__(self):
+        self.enabled = False
+        self.sites = []
+
+    def report(self, count=10):
+        hits = misses = polymorphic = megamorphic = 0
+        for app in self.sites:
+            hits += app.ic_hits
+            misses += app.ic_misses
+            if app.ic_misses > 2:
+                megamorphic += 1
+            elif app.ic_caselam2 is not None:
+                polymorphic += 1
+        print "inline caches: %d sites, %d hits, %d misses" % (
+            len(self.sites), hits, misses)
+        print "%d sites polymorphic, %d megamorphic" % (polymorphic, megamorphic)
+        # the sites with the most misses
+        sites = self.sites[:]
+        for i in range(min(count, len(sites))):
+            worst = i
+            for j in range(i + 1, len(sites)):
+                if sites[j].ic_misses > sites[worst].ic_misses:
+                    worst = j
+            sites[i], sites[worst] = sites[worst], sites[i]
+            app = sites[i]
+            if app.ic_misses <= 1:
+                break
+            print "%d hits, %d misses: %s" % (
+                app.ic_hits, app.ic_misses, app.tostring()[:100])
+
+ic_stats = InlineCacheStats()
+
 class App(AST):
     _immutable_fields_ = ["rator", "rands[*]", "env_structure"]
 
+    # inline cache: the last two case-lambdas called at this site, and the
+    # index of the case that takes the arguments
+    ic_caselam1 = None
+    ic_index1 = 0
+    ic_caselam2 = None
+    ic_index2 = 0
+    ic_hits = 0
+    ic_misses = 0
+    # with the count_calls option, see counters.py
+    call_count = 0
+
     def __init__ (self, rator, rands, env_structure=None):
         assert rator.simple
         for r in rands:
@@ -624,6 +713,38 @@ class App(AST):
         self.rands = rands
         self.env_structure = env_structure
 
+    def lambda_index(self, caselam, args):
+        """ The index of the case of `caselam` that takes `args`, or -1 if
+        there is none. Looks the case-lambda up in the inline cache first,
+        and enters it there on a miss. Only used by the interpreter for
+        case-lambdas with several cases, the JIT promotes the case-lambda and
+        unrolls the dispatch instead. """
+        nargs = len(args)
+        if self.ic_caselam1 is caselam:
+            index = self.ic_index1
+        elif self.ic_caselam2 is caselam:
+            index = self.ic_index2
+        else:
+            index = -1
+        # the arguments passed by apply and friends can differ in number
+        if index >= 0 and caselam.lams[index].matches(nargs):
+            if ic_stats.enabled:
+                self.ic_hits += 1
+            return index
+        if ic_stats.enabled:
+            if self.ic_misses == 0:
+                ic_stats.sites.append(self)
+            self.ic_misses += 1
+        for i in range(len(caselam.lams)):
+            if caselam.lams[i].matches(nargs):
+                # the older entry makes room
+                self.ic_caselam2 = self.ic_caselam1
+                self.ic_index2 = self.ic_index1
+                self.ic_caselam1 = caselam
+                self.ic_index1 = i
+                return i
+        return -1
+
     @staticmethod
     def make(rator, rands, env_structure=None):
         if isinstance(rator, ModuleVar) and rator.is_primitive():
@@ -637,6 +758,8 @@ class App(AST):
                         return SimplePrimApp1(rator, rands, env_structure, w_prim)
                     if w_prim.simple2 and len(rands) == 2:
                         return SimplePrimApp2(rator, rands, env_structure, w_prim)
+                    if config.superinstructions:
+                        return PrimApp(rator, rands, env_structure, w_prim)
         return App(rator, rands, env_structure)
 
     @staticmethod
@@ -687,6 +810,8 @@ class App(AST):
     # are simple.
     @jit.unroll_safe
     def interpret(self, env, cont):
+        if config.count_calls:
+            self.call_count += 1
         rator = self.rator
         if (not env.pycketconfig().callgraph and
                 isinstance(rator, ModuleVar) and
@@ -759,6 +884,34 @@ class SimplePrimApp2(App):
         result = self.run(env)
         return return_multi_vals_direct(result, env, cont)
 
+# ____________________________________________________________
+# Superinstructions: nodes for a few common shapes of ASTs, that do the work
+# of several nodes in one step. The set is fixed (PrimApp, IfSimplePrimApp2
+# and LetSimple1), they are chosen by the make functions of the general nodes
+# when the tree is converted, if the superinstructions option is enabled (it
+# is off by default). Use --shape-stats to find out which shapes a program
+# executes most.
+
+class PrimApp(App):
+    """ A call of a primitive that is not simple, skips looking up the
+    primitive """
+    _immutable_fields_ = ['w_prim']
+
+    def __init__(self, rator, rands, env_structure, w_prim):
+        App.__init__(self, rator, rands, env_structure)
+        self.w_prim = w_prim
+
+    @jit.unroll_safe
+    def interpret(self, env, cont):
+        if config.count_calls:
+            self.call_count += 1
+        if not env.pycketconfig().callgraph:
+            self.set_should_enter() # to jit downrecursion
+        args_w = [None] * len(self.rands)
+        for i, rand in enumerate(self.rands):
+            args_w[i] = rand.interpret_simple(env)
+        return self.w_prim.call_with_extra_info(args_w, env, cont, self)
+
 class SequencedBodyAST(AST):
     _immutable_fields_ = ["body[*]", "counting_asts[*]"]
     def __init__(self, body, counts_needed=-1):
@@ -840,6 +993,12 @@ class Begin(SequencedBodyAST):
     def interpret(self, env, cont):
         return self.make_begin_cont(env, cont)
 
+    @jit.unroll_safe
+    def interpret_direct(self, env):
+        for i in range(len(self.body) - 1):
+            self.body[i].interpret_direct(env)
+        return self.body[-1].interpret_direct(env)
+
     def _tostring(self):
         return "(begin %s)" % (" ".join([e.tostring() for e in self.body]))
 
@@ -986,6 +1145,11 @@ class ModuleVar(Var):
         assert isinstance(v, values.W_Cell)
         v.set_val(w_val)
 
+    def reset(self):
+        # forget the cached value, the module is instantiated again
+        self.modenv = None
+        self.w_value = None
+
 
 # class ModCellRef(Var):
 #     _immutable_fields_ = ["sym", "srcmod", "srcsym", "modvar"]
@@ -1066,6 +1230,12 @@ class If(AST):
         self.thn = thn
         self.els = els
 
+    @staticmethod
+    def make(tst, thn, els):
+        if config.superinstructions and isinstance(tst, SimplePrimApp2):
+            return IfSimplePrimApp2(tst, thn, els)
+        return If(tst, thn, els)
+
     @staticmethod
     def make_let_converted(tst, thn, els):
         if tst.simple:
@@ -1085,11 +1255,18 @@ class If(AST):
         else:
             return self.thn, env, cont
 
+    def interpret_direct(self, env):
+        w_val = self.tst.interpret_simple(env)
+        if w_val is values.w_false:
+            return self.els.interpret_direct(env)
+        else:
+            return self.thn.interpret_direct(env)
+
     def assign_convert(self, vars, env_structure):
         sub_env_structure = env_structure
-        return If(self.tst.assign_convert(vars, env_structure),
-                  self.thn.assign_convert(vars, sub_env_structure),
-                  self.els.assign_convert(vars, sub_env_structure))
+        return If.make(self.tst.assign_convert(vars, env_structure),
+                       self.thn.assign_convert(vars, sub_env_structure),
+                       self.els.assign_convert(vars, sub_env_structure))
 
     def direct_children(self):
         return [self.tst, self.thn, self.els]
@@ -1103,11 +1280,28 @@ class If(AST):
     def _tostring(self):
         return "(if %s %s %s)" % (self.tst.tostring(), self.thn.tostring(), self.els.tostring())
 
-def make_lambda(formals, rest, body, srcpos, srcfile):
+class IfSimplePrimApp2(If):
+    """ An if testing a call of a simple binary primitive, like (< i n) """
+    _immutable_fields_ = ["prim_tst"]
+
+    def __init__ (self, tst, thn, els):
+        If.__init__(self, tst, thn, els)
+        assert isinstance(tst, SimplePrimApp2)
+        self.prim_tst = tst
+
+    def interpret(self, env, cont):
+        w_val = check_one_val(self.prim_tst.run(env))
+        if w_val is values.w_false:
+            return self.els, env, cont
+        else:
+            return self.thn, env, cont
+
+def make_lambda(formals, rest, body, srcpos, srcfile, srcline=-1):
     args = SymList(formals + ([rest] if rest else []))
     frees = SymList(free_vars_lambda(body, args).keys())
     args = SymList(args.elems, frees)
-    return Lambda(formals, rest, args, frees, body, srcpos, srcfile)
+    return Lambda(formals, rest, args, frees, body, srcpos, srcfile,
+                  srcline=srcline)
 
 
 def free_vars_lambda(body, args):
@@ -1220,10 +1414,14 @@ class Lambda(SequencedBodyAST):
                           "frees", "enclosing_env_structure", 'env_structure'
                           ]
     simple = True
-    def __init__ (self, formals, rest, args, frees, body, srcpos, srcfile, enclosing_env_structure=None, env_structure=None):
+    # with the count_calls option, see counters.py
+    call_count = 0
+    loop_count = 0
+    def __init__ (self, formals, rest, args, frees, body, srcpos, srcfile, enclosing_env_structure=None, env_structure=None, srcline=-1):
         SequencedBodyAST.__init__(self, body)
         self.srcpos = srcpos
         self.srcfile = srcfile
+        self.srcline = srcline
         self.formals = formals
         self.rest = rest
         self.args = args
@@ -1236,6 +1434,23 @@ class Lambda(SequencedBodyAST):
     def enable_jitting(self):
         self.body[0].set_should_enter()
 
+    def srcloc(self):
+        """ <file>:<line> of the lambda, without the directory of the file.
+        Unlike tostring it stays short for large lambdas and does not change
+        with the code around the lambda, as needed by the names of the JIT
+        loops and the profiles """
+        srcfile = self.srcfile
+        if not srcfile:
+            return "?"
+        start = srcfile.rfind("/") + 1
+        assert start >= 0
+        srcfile = srcfile[start:]
+        if self.srcline >= 0:
+            return "%s:%d" % (srcfile, self.srcline)
+        if self.srcpos >= 0:
+            return "%s@%d" % (srcfile, self.srcpos)
+        return srcfile
+
     # returns n for fixed arity, -(n+1) for arity-at-least n
     # my kingdom for Either
     def get_arity(self):
@@ -1270,7 +1485,8 @@ class Lambda(SequencedBodyAST):
             cells = [Cell(LexicalVar(v, self.args)) for v in new_lets]
             new_body = [Let(sub_env_structure, [1] * len(new_lets), cells, new_body)]
         return Lambda(self.formals, self.rest, self.args, self.frees, new_body,
-                      self.srcpos, self.srcfile, env_structure, sub_env_structure)
+                      self.srcpos, self.srcfile, env_structure, sub_env_structure,
+                      self.srcline)
 
     def direct_children(self):
         return self.body[:]
@@ -1293,6 +1509,12 @@ class Lambda(SequencedBodyAST):
         result = free_vars_lambda(self.body, self.args)
         return result
 
+    def matches(self, nargs):
+        fmls_len = len(self.formals)
+        if self.rest:
+            return fmls_len <= nargs
+        return fmls_len == nargs
+
     def match_args(self, args):
         fmls_len = len(self.formals)
         args_len = len(args)
@@ -1356,6 +1578,51 @@ class Lambda(SequencedBodyAST):
                 self.body[0].tostring() if len(self.body) == 1 else
                 " ".join([b.tostring() for b in self.body]))
 
+class LazyBody(AST):
+    """ The body of a lambda that is kept as json text until the lambda is
+    called for the first time (see expand._to_form_lazy). The lambda only
+    ever sees this node as its body, interpreting it continues with the
+    converted body. """
+    _immutable_fields_ = ["modtable", "converted?"]
+
+    def __init__(self, json, modtable):
+        self.json = json
+        self.modtable = modtable
+        self.converted = None
+
+    def interpret(self, env, cont):
+        converted = self.converted
+        if converted is None:
+            converted = self.convert()
+        return converted, env, cont
+
+    @jit.dont_look_inside
+    def convert(self):
+        # parses json, which the tracer should never see
+        from pycket.expand import lazy_body_to_ast
+        converted = lazy_body_to_ast(self)
+        self.converted = converted
+        self.json = None
+        return converted
+
+    def assign_convert(self, vars, env_structure):
+        # the body is assignment converted when it is converted
+        return self
+
+    def direct_children(self):
+        if self.converted is None:
+            return []
+        return [self.converted]
+
+    def _mutated_vars(self):
+        # bodies that use set! are never lazy
+        return variable_set()
+
+    def _tostring(self):
+        if self.converted is None:
+            return "#<lazy body>"
+        return self.converted.tostring()
+
 class CombinedAstAndIndex(AST):
     _immutable_fields_ = ["ast", "index"]
 
@@ -1536,6 +1803,16 @@ class Let(SequencedBodyAST):
             remove_num_envs = [0] * (len(rhss) + 1)
         self.remove_num_envs = remove_num_envs
 
+    @staticmethod
+    def make(args, counts, rhss, body, remove_num_envs=None):
+        if config.superinstructions:
+            if len(rhss) == 1 and counts[0] == 1 and rhss[0].simple:
+                return LetSimple1(args, counts, rhss, body, remove_num_envs)
+        if config.direct_let:
+            if _direct_rhss(counts, rhss, MAX_DIRECT_DEPTH):
+                return LetDirect(args, counts, rhss, body, remove_num_envs)
+        return Let(args, counts, rhss, body, remove_num_envs)
+
     def replace_innermost_with_app(self, newsym, rator, rands):
         assert len(self.body) == 1
         body = self.body[0]
@@ -1572,6 +1849,23 @@ class Let(SequencedBodyAST):
         return self.rhss[0], env, LetCont.make(
                 None, self, 0, env, cont)
 
+    @jit.unroll_safe
+    def _direct_env(self, env):
+        """ The environment of the body, with the rhss evaluated directly """
+        env = self._prune_env(env, 0)
+        vals_w = [None] * len(self.rhss)
+        for i in range(len(self.rhss)):
+            vals_w[i] = check_one_val(self.rhss[i].interpret_direct(env))
+            env = self._prune_env(env, i + 1)
+        return ConsEnv.make(vals_w, env)
+
+    @jit.unroll_safe
+    def interpret_direct(self, env):
+        env = self._direct_env(env)
+        for i in range(len(self.body) - 1):
+            self.body[i].interpret_direct(env)
+        return self.body[-1].interpret_direct(env)
+
     def direct_children(self):
         return self.rhss + self.body
         #return self.body + self.rhss
@@ -1622,8 +1916,8 @@ class Let(SequencedBodyAST):
         body_env_structure = env_structures[len(self.rhss)]
 
         new_body = [b.assign_convert(new_vars, body_env_structure) for b in self.body]
-        result = Let(sub_env_structure, self.counts, new_rhss, new_body, remove_num_envs)
-        return result
+        return Let.make(sub_env_structure, self.counts, new_rhss, new_body,
+                        remove_num_envs)
 
     def _compute_remove_num_envs(self, new_vars, sub_env_structure):
         if not config.prune_env:
@@ -1713,6 +2007,66 @@ class Let(SequencedBodyAST):
         result.append(")")
         return "".join(result)
 
+class LetSimple1(Let):
+    """ A let binding one variable to a simple expression, evaluates it
+    without a LetCont """
+
+    def interpret(self, env, cont):
+        env = self._prune_env(env, 0)
+        w_val = check_one_val(self.rhss[0].interpret_simple(env))
+        env = ConsEnv.make1(w_val, self._prune_env(env, 1))
+        return self.make_begin_cont(env, cont)
+
+class LetDirect(Let):
+    """ A let whose rhss are made of simple expressions, ifs, lets and begins
+    only (no calls of closures), evaluates them with interpret_direct instead
+    of LetConts """
+
+    def interpret(self, env, cont):
+        return self.make_begin_cont(self._direct_env(env), cont)
+
+# ____________________________________________________________
+# Direct evaluation: ifs, lets and begins that only contain simple
+# expressions (variables, constants, lambdas and calls of simple primitives)
+# cannot capture the continuation, and need no continuation marks. They are
+# evaluated with recursive interpret_direct calls, up to a bounded depth, if
+# the direct_let option is enabled. Calls of closures, even known ones, are
+# never evaluated directly: the callee's body is not analysed.
+
+MAX_DIRECT_DEPTH = 16
+
+def direct_depth(ast, limit):
+    """ The nesting depth of `ast` if it can be evaluated with
+    interpret_direct, -1 if not or if it is deeper than `limit` """
+    if ast.simple:
+        return 0
+    if limit == 0:
+        return -1
+    if isinstance(ast, If):
+        return _max_direct_depth([ast.thn, ast.els], limit - 1)
+    if isinstance(ast, Let):
+        if not _direct_rhss(ast.counts, ast.rhss, limit - 1):
+            return -1
+        return _max_direct_depth(ast.body, limit - 1)
+    if isinstance(ast, Begin):
+        return _max_direct_depth(ast.body, limit - 1)
+    return -1
+
+def _max_direct_depth(asts, limit):
+    result = 0
+    for ast in asts:
+        depth = direct_depth(ast, limit)
+        if depth < 0:
+            return -1
+        result = max(result, depth + 1)
+    return result
+
+def _direct_rhss(counts, rhss, limit):
+    for count in counts:
+        if count != 1:
+            return False
+    return _max_direct_depth(rhss, limit) >= 0
+
 class DefineValues(AST):
     _immutable_fields_ = ["names", "rhs", "display_names"]
     names = []
@@ -1761,13 +2115,80 @@ class DefineValues(AST):
             self.display_names, self.rhs.tostring())
 
 
+def _set_shape_tags(cls):
+    cls.shape_tag = cls.__name__
+    for subcls in cls.__subclasses__():
+        _set_shape_tags(subcls)
+
+def ast_shape(ast, depth=2):
+    """ The class of `ast` and of the simple children it evaluates itself, as
+    in If(SimplePrimApp2(LexicalVar Quote)) """
+    if depth == 0:
+        return ast.shape_tag
+    if isinstance(ast, If):
+        children = [ast.tst]
+    elif isinstance(ast, Let):
+        children = ast.rhss
+    elif isinstance(ast, SequencedBodyAST):
+        # the body is executed in later steps
+        children = []
+    else:
+        children = ast.direct_children()
+    parts = []
+    for child in children:
+        if child.simple:
+            parts.append(ast_shape(child, depth - 1))
+    if not parts:
+        return ast.shape_tag
+    return "%s(%s)" % (ast.shape_tag, " ".join(parts))
+
+class ShapeStats(object):
+    """ How often the interpreter executes AST nodes of every shape, to find
+    the candidates for superinstructions """
+    def __init__(self):
+        self.enabled = False
+        self.counts = {}
+
+    def record(self, ast):
+        self.counts[ast] = self.counts.get(ast, 0) + 1
+
+    def report(self, count=20):
+        shapes = {}
+        total = 0
+        for ast, n in self.counts.iteritems():
+            shape = ast_shape(ast)
+            shapes[shape] = shapes.get(shape, 0) + n
+            total += n
+        print "executed %d nodes of %d shapes" % (total, len(shapes))
+        items = shapes.items()
+        for i in range(min(count, len(items))):
+            most = i
+            for j in range(i + 1, len(items)):
+                if items[j][1] > items[most][1]:
+                    most = j
+            items[i], items[most] = items[most], items[i]
+            shape, n = items[i]
+            print "%d %d/1000 %s" % (n, n * 1000 / total, shape)
+
+shape_stats = ShapeStats()
+
+def count_loop(ast):
+    lam = ast.surrounding_lambda
+    if lam is not None:
+        lam.loop_count += 1
+
+def printable_location(ast):
+    """ The name of the JIT loops and merge points at `ast` in the logs,
+    <file>:<line> <class>, see pycket/jitlog.py """
+    return "%s %s" % (ast.location(), ast.shape_tag)
+
 def get_printable_location_two_state(green_ast, came_from):
     if green_ast is None:
         return 'Green_Ast is None'
     surrounding = green_ast.surrounding_lambda
     if surrounding is not None and green_ast is surrounding.body[0]:
-        return green_ast.tostring() + ' from ' + came_from.tostring()
-    return green_ast.tostring()
+        return printable_location(green_ast) + ' from ' + printable_location(came_from)
+    return printable_location(green_ast)
 
 driver_two_state = jit.JitDriver(reds=["env", "cont"],
                                  greens=["ast", "came_from"],
@@ -1778,6 +2199,10 @@ def inner_interpret_two_state(ast, env, cont):
     config = env.pycketconfig()
     while True:
         driver_two_state.jit_merge_point(ast=ast, came_from=came_from, env=env, cont=cont)
+        if sampler.enabled:
+            sampler.tick(ast, cont)
+        if not jit.we_are_jitted() and shape_stats.enabled:
+            shape_stats.record(ast)
         if config.track_header:
             came_from = ast if ast.should_enter else came_from
         else:
@@ -1792,20 +2217,28 @@ def inner_interpret_two_state(ast, env, cont):
         else:
             ast, env, cont = ast.interpret(env, cont)
         if ast.should_enter:
+            if config.count_calls:
+                count_loop(ast)
             driver_two_state.can_enter_jit(ast=ast, came_from=came_from, env=env, cont=cont)
 
 def get_printable_location_one_state(green_ast ):
     if green_ast is None:
         return 'Green_Ast is None'
-    return green_ast.tostring()
+    return printable_location(green_ast)
 driver_one_state = jit.JitDriver(reds=["env", "cont"],
                        greens=["ast"],
                        get_printable_location=get_printable_location_one_state)
 def inner_interpret_one_state(ast, env, cont):
     while True:
         driver_one_state.jit_merge_point(ast=ast, env=env, cont=cont)
+        if sampler.enabled:
+            sampler.tick(ast, cont)
+        if not jit.we_are_jitted() and shape_stats.enabled:
+            shape_stats.record(ast)
         ast, env, cont = ast.interpret(env, cont)
         if ast.should_enter:
+            if config.count_calls:
+                count_loop(ast)
             driver_one_state.can_enter_jit(ast=ast, env=env, cont=cont)
 
 def interpret_one(ast, env=None):
@@ -1850,3 +2283,5 @@ def interpret(asts):
     for a in asts:
         x = interpret_toplevel(a, env)
     return x
+
+_set_shape_tags(AST)
@@ -0,0 +1,155 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JIT hints that are kept from one run to the next.
+#
+# Which lambdas are jitted and which ASTs are loop headers (the should_enter
+# flag, set by Lambda.enable_jitting, CallGraph.register_call and the call
+# heuristics of App) is found out anew by every run, while the program warms
+# up. With --jit-hints <file>, pycket records the ASTs that have should_enter
+# set at exit, and sets the flag on the same ASTs of later runs when their
+# modules are loaded, before any code runs.
+#
+# An AST is identified by the lambda it is in and its position in a preorder
+# walk of the body of that lambda. Lambdas are identified by their source
+# position, and by their position among the lambdas of the module with the
+# same source position (macros can produce several). Bodies that are
+# converted lazily (--lazy) are not walked, as they may not exist yet when
+# the hints are applied. The hints of a module are only applied if the
+# module file still has the digest it had when they were recorded, and if the
+# options that change the shape of the ASTs (ModTable.ast_flags) are the same.
+#
+# The hints of the modules a run did not load are kept when the file is
+# written, so that several programs can share it. The file is a text file
+# with one tab separated line per module:
+#
+#   <path> <flags> <digest> <hint>*
+#
+# where every hint is <lambda>:<index>, <lambda> being "top" for ASTs outside
+# of any lambda and <source position>.<number> otherwise.
+#
+import os
+
+from rpython.rlib import streamio
+
+from pycket.interpreter import Lambda, LazyBody
+from pycket.manifest import file_digest
+
+TOPLEVEL_SCOPE = "top"
+
+class ASTWalker(object):
+    def visit(self, key, ast):
+        raise NotImplementedError("abstract base class")
+
+def walk_module(module, walker):
+    """ Call walker.visit(key, ast) for all the ASTs of `module` """
+    # next index in every lambda, and number of lambdas at every position
+    indexes = {}
+    positions = {}
+    todo = [(ast, TOPLEVEL_SCOPE) for ast in module.body]
+    todo.reverse()
+    while todo:
+        ast, scope = todo.pop()
+        index = indexes.get(scope, 0)
+        indexes[scope] = index + 1
+        walker.visit("%s:%d" % (scope, index), ast)
+        if isinstance(ast, LazyBody):
+            continue
+        if isinstance(ast, Lambda):
+            number = positions.get(ast.srcpos, 0)
+            positions[ast.srcpos] = number + 1
+            scope = "%d.%d" % (ast.srcpos, number)
+        children = ast.direct_children()
+        for i in range(len(children) - 1, -1, -1):
+            todo.append((children[i], scope))
+
+class HintCollector(ASTWalker):
+    def __init__(self):
+        self.hints = []
+
+    def visit(self, key, ast):
+        if ast.should_enter:
+            self.hints.append(key)
+
+class HintSetter(ASTWalker):
+    def __init__(self, hints):
+        self.hints = hints
+        self.count = 0
+
+    def visit(self, key, ast):
+        if key in self.hints:
+            ast.set_should_enter()
+            self.count += 1
+
+class JitHints(object):
+    def __init__(self, flags):
+        # the ast flags of this run
+        self.flags = flags
+        # module path -> (flags, digest, set of hints)
+        self.modules = {}
+
+    def apply(self, modname, module):
+        """ Set should_enter on the ASTs of `module` that had it set in the
+        recorded run, returns their number """
+        entry = self.modules.get(modname, None)
+        if entry is None:
+            return 0
+        flags, digest, hints = entry
+        if flags != self.flags or file_digest(modname) != digest:
+            return 0
+        setter = HintSetter(hints)
+        walk_module(module, setter)
+        return setter.count
+
+def load_jit_hints(fname, flags):
+    """ The hints recorded in `fname`, empty if it cannot be read. Only the
+    hints recorded with the same ast `flags` are applied. """
+    jit_hints = JitHints(flags)
+    try:
+        f = streamio.open_file_as_stream(fname)
+        data = f.readall()
+        f.close()
+    except OSError:
+        return jit_hints
+    for line in data.split("\n"):
+        fields = line.split("\t")
+        if len(fields) < 3:
+            continue
+        hints = {}
+        for i in range(3, len(fields)):
+            hints[fields[i]] = None
+        jit_hints.modules[fields[0]] = (fields[1], fields[2], hints)
+    return jit_hints
+
+def save_jit_hints(fname, module_env, flags):
+    """ Record the hints of all the modules of `module_env` in `fname`, with
+    the ast `flags` of this run. The hints loaded from it for modules this
+    run did not load are kept, other programs may share the file. """
+    lines = []
+    loaded = module_env.jit_hints
+    if loaded is not None:
+        for modname, entry in loaded.modules.iteritems():
+            if modname in module_env.modules:
+                continue
+            old_flags, digest, hints = entry
+            lines.append("\t".join([modname, old_flags, digest] +
+                                   hints.keys()))
+    for modname, module in module_env.modules.iteritems():
+        digest = file_digest(modname)
+        if not digest:
+            # code given with -e
+            continue
+        collector = HintCollector()
+        walk_module(module, collector)
+        if collector.hints:
+            lines.append("\t".join([modname, flags, digest] +
+                                   collector.hints))
+    tmp = "%s.%d" % (fname, os.getpid())
+    try:
+        f = streamio.open_file_as_stream(tmp, "w")
+        f.write("\n".join(lines))
+        f.write("\n")
+        f.close()
+        os.rename(tmp, fname)
+    except OSError:
+        pass
@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Summary of a JIT log per Racket source location.
+#
+# Run pycket with
+#
+#   PYPYLOG=jit-log-opt,jit-backend-counts:<log> pycket-c prog.rkt
+#
+# and then, with any Python (this is not part of the translated interpreter):
+#
+#   python pycket/jitlog.py <log>
+#
+# The names of the loops and of the merge points in the traces are the
+# source locations of the lambdas, <file>:<line> (see printable_location in
+# interpreter.py). The log is summarized per location:
+#
+#   loops     the loops and entry bridges whose entry is at the location
+#   bridges   the bridges out of guards at the location
+#   guards    the guards at the location in the optimized traces
+#   failures  how often the bridges out of guards at the location ran, the
+#             number of guard failures after the bridges were compiled
+#   entries   how often the loops at the location were entered
+#
+# A guard belongs to the location of the last merge point before it. Lambdas
+# with many bridges and failures are the ones the JIT does not compile well,
+# they are listed first.
+#
+from __future__ import print_function
+
+import re
+import sys
+
+REPORT_SIZE = 40
+
+_section_start = re.compile(r"^\[[0-9a-f]+\] \{([\w-]+)")
+_section_end = re.compile(r"^\[[0-9a-f]+\] ([\w-]+)\}")
+_loop_header = re.compile(r"^# Loop (\d+) \((.*)\) : ")
+_bridge_header = re.compile(r"^# bridge out of Guard (\S+)")
+_merge_point = re.compile(r"debug_merge_point\(.*'(.*)'\)")
+_guard = re.compile(r"guard_\w+\(.*descr=<Guard(\S+?)>")
+_bridge_count = re.compile(r"^bridge (\S+):(\d+)")
+_entry_count = re.compile(r"^entry (\d+):(\d+)")
+
+def _guard_number(s):
+    """ Guards are named in hex in the traces and in decimal in the counts """
+    if s.startswith("0x"):
+        return int(s, 16)
+    return int(s)
+
+def location_of(name):
+    """ The source location in the name of a loop or a merge point,
+    '<file>:<line> <class> from <file>:<line> <class>' """
+    name = name.split(" from ")[0]
+    if " " in name:
+        return name.rsplit(" ", 1)[0]
+    return name
+
+class LocationStats(object):
+    def __init__(self, location):
+        self.location = location
+        self.loops = 0
+        self.bridges = 0
+        self.guards = 0
+        self.failures = 0
+        self.entries = 0
+
+    def key(self):
+        return (self.failures, self.bridges, self.guards, self.loops)
+
+class JitLog(object):
+    def __init__(self):
+        # location -> LocationStats
+        self.stats = {}
+        # guard number -> location
+        self.guard_locations = {}
+        # loop number -> location
+        self.loop_locations = {}
+        self.bridge_counts = []
+        self.entry_counts = []
+
+    def get(self, location):
+        stats = self.stats.get(location, None)
+        if stats is None:
+            stats = self.stats[location] = LocationStats(location)
+        return stats
+
+    def parse(self, lines):
+        section = None
+        location = None
+        for line in lines:
+            line = line.rstrip("\n")
+            match = _section_start.match(line)
+            if match:
+                section = match.group(1)
+                location = None
+                continue
+            if _section_end.match(line):
+                section = None
+                continue
+            if section in ("jit-log-opt-loop", "jit-log-opt-bridge"):
+                location = self.parse_trace_line(line, location)
+            elif section == "jit-backend-counts":
+                self.parse_count_line(line)
+        self.add_counts()
+
+    def parse_trace_line(self, line, location):
+        """ Records `line` of a trace, returns the location of the next line
+        """
+        match = _merge_point.search(line)
+        if match:
+            return location_of(match.group(1))
+        match = _guard.search(line)
+        if match:
+            if location is not None:
+                self.guard_locations[_guard_number(match.group(1))] = location
+                self.get(location).guards += 1
+            return location
+        match = _loop_header.match(line)
+        if match:
+            location = location_of(match.group(2))
+            self.loop_locations[int(match.group(1))] = location
+            self.get(location).loops += 1
+            return location
+        match = _bridge_header.match(line)
+        if match:
+            location = self.guard_locations.get(_guard_number(match.group(1)))
+            if location is not None:
+                self.get(location).bridges += 1
+            return location
+        return location
+
+    def parse_count_line(self, line):
+        match = _bridge_count.match(line)
+        if match:
+            self.bridge_counts.append((_guard_number(match.group(1)),
+                                       int(match.group(2))))
+            return
+        match = _entry_count.match(line)
+        if match:
+            self.entry_counts.append((int(match.group(1)),
+                                      int(match.group(2))))
+
+    def add_counts(self):
+        for guard, count in self.bridge_counts:
+            location = self.guard_locations.get(guard)
+            if location is not None:
+                self.get(location).failures += count
+        for loop, count in self.entry_counts:
+            location = self.loop_locations.get(loop)
+            if location is not None:
+                self.get(location).entries += count
+        self.bridge_counts = []
+        self.entry_counts = []
+
+    def summary(self):
+        """ The LocationStats, the worst compiled locations first """
+        return sorted(self.stats.values(), key=LocationStats.key, reverse=True)
+
+def report(jitlog, count=REPORT_SIZE, out=sys.stdout):
+    columns = ("loops", "bridges", "guards", "failures", "entries")
+    out.write("%-40s %s\n" % ("location", " ".join(["%10s" % c for c in columns])))
+    for stats in jitlog.summary()[:count]:
+        numbers = " ".join(["%10d" % getattr(stats, c) for c in columns])
+        out.write("%-40s %s\n" % (stats.location, numbers))
+
+def main(argv):
+    if len(argv) != 2:
+        print("usage: %s <PYPYLOG file>" % argv[0])
+        return 2
+    jitlog = JitLog()
+    with open(argv[1]) as f:
+        jitlog.parse(f)
+    report(jitlog)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,164 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Interning of quoted literals while modules are loaded.
+#
+# Every occurrence of a literal in the expanded code used to get its own value
+# object. The LiteralTable maps each immutable literal to one canonical
+# object, so that identical flonums, bignums, quoted lists, vectors, etc.
+# appearing in the loaded modules are shared. Literals are interned bottom
+# up: the parts of a compound literal are canonical before the literal
+# itself is looked up, so compound literals can be compared shallowly.
+#
+# Fixnums, characters, strings, symbols and keywords already are interned by
+# their constructors. Quote nodes are not shared, since AST nodes carry per
+# node information (surrounding lambda, should_enter, ...).
+#
+from rpython.rlib.objectmodel import r_dict, compute_hash
+from rpython.rlib.rarithmetic import intmask
+
+from pycket import values, vector
+
+def _part_eq(w_a, w_b):
+    # parts are canonical, apart from numbers and characters that unboxed
+    # conses or vectors rebox on access
+    return w_a is w_b or w_a.eqv(w_b)
+
+def _part_hash(w_a):
+    return w_a.hash_eqv()
+
+def _combine(h1, h2):
+    return intmask((h1 * 1000003) ^ h2)
+
+def _literal_eq(w_a, w_b):
+    if w_a is w_b:
+        return True
+    if isinstance(w_a, values.W_Number):
+        return w_a.eqv(w_b)
+    if isinstance(w_a, values.W_Cons):
+        return (isinstance(w_b, values.W_Cons) and
+                _part_eq(w_a.car(), w_b.car()) and
+                _part_eq(w_a.cdr(), w_b.cdr()))
+    if isinstance(w_a, vector.W_Vector):
+        if not isinstance(w_b, vector.W_Vector):
+            return False
+        if w_a.length() != w_b.length():
+            return False
+        for i in range(w_a.length()):
+            if not _part_eq(w_a.ref(i), w_b.ref(i)):
+                return False
+        return True
+    if isinstance(w_a, values.W_IBox):
+        return (isinstance(w_b, values.W_IBox) and
+                _part_eq(w_a.value, w_b.value))
+    if isinstance(w_a, values.W_Bytes):
+        return (isinstance(w_b, values.W_Bytes) and
+                w_a.as_str() == w_b.as_str())
+    if isinstance(w_a, values.W_Path):
+        return isinstance(w_b, values.W_Path) and w_a.path == w_b.path
+    return False
+
+def _literal_hash(w_a):
+    if isinstance(w_a, values.W_Number):
+        return w_a.hash_eqv()
+    if isinstance(w_a, values.W_Cons):
+        return _combine(_part_hash(w_a.car()), _part_hash(w_a.cdr()))
+    if isinstance(w_a, vector.W_Vector):
+        h = w_a.length()
+        for i in range(w_a.length()):
+            h = _combine(h, _part_hash(w_a.ref(i)))
+        return h
+    if isinstance(w_a, values.W_IBox):
+        return _combine(17, _part_hash(w_a.value))
+    if isinstance(w_a, values.W_Bytes):
+        return compute_hash(w_a.as_str())
+    if isinstance(w_a, values.W_Path):
+        return compute_hash(w_a.path)
+    return compute_hash(w_a)
+
+def _internable(w_val):
+    if isinstance(w_val, values.W_Fixnum):
+        return False # memoized by W_Fixnum.make
+    if isinstance(w_val, values.W_Number):
+        return True
+    if isinstance(w_val, vector.W_Vector):
+        return w_val.immutable()
+    if isinstance(w_val, values.W_Bytes):
+        return w_val.immutable()
+    return (isinstance(w_val, values.W_Cons) or
+            isinstance(w_val, values.W_IBox) or
+            isinstance(w_val, values.W_Path))
+
+
+class LiteralTable(object):
+    def __init__(self):
+        self.table = r_dict(_literal_eq, _literal_hash)
+        self.report = False
+        # per module statistics, one entry for every module being loaded
+        self.totals = []
+        self.shared = []
+
+    def begin_module(self):
+        self.totals.append(0)
+        self.shared.append(0)
+
+    def end_module(self, name):
+        if not self.totals:
+            return
+        total = self.totals.pop()
+        shared = self.shared.pop()
+        if self.report and total:
+            percent = str(shared * 100 / total) + "%"
+            print "literals in %s: %d, %d shared (%s)" % (
+                name, total, shared, percent)
+
+    def _lookup(self, w_val):
+        if self.totals:
+            self.totals[-1] += 1
+        w_res = self.table.get(w_val, None)
+        if w_res is None:
+            self.table[w_val] = w_val
+            return w_val
+        if self.shared:
+            self.shared[-1] += 1
+        return w_res
+
+    def intern(self, w_val):
+        if not _internable(w_val):
+            return w_val
+        if isinstance(w_val, values.W_Cons):
+            return self._intern_list(w_val)
+        if isinstance(w_val, vector.W_Vector):
+            changed = False
+            elems = [None] * w_val.length()
+            for i in range(w_val.length()):
+                w_elem = w_val.ref(i)
+                elems[i] = self.intern(w_elem)
+                changed = changed or elems[i] is not w_elem
+            if changed:
+                w_val = vector.W_Vector.fromelements(elems, immutable=True)
+        elif isinstance(w_val, values.W_IBox):
+            w_content = self.intern(w_val.value)
+            if w_content is not w_val.value:
+                w_val = values.W_IBox(w_content)
+        return self._lookup(w_val)
+
+    def _intern_list(self, w_list):
+        # iterative along the cdrs, quoted lists can be long
+        spine = []
+        w_rest = w_list
+        while isinstance(w_rest, values.W_Cons):
+            spine.append(w_rest)
+            w_rest = w_rest.cdr()
+        w_tail = self.intern(w_rest)
+        changed = w_tail is not w_rest
+        for i in range(len(spine) - 1, -1, -1):
+            w_cons = spine[i]
+            w_car = w_cons.car()
+            w_new_car = self.intern(w_car)
+            if changed or not _part_eq(w_new_car, w_car):
+                w_cons = values.W_Cons.make(w_new_car, w_tail)
+                changed = True
+            w_tail = self._lookup(w_cons)
+            changed = changed or w_tail is not w_cons
+        return w_tail
@@ -0,0 +1,177 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Content-hash based manifest for the expansion cache.
+#
+# Every module file that was expanded has an entry with the md5 digest of its
+# contents, the json file holding its expansion and the files it requires
+# together with their digests at expansion time. An expansion is up to date
+# if the module and all of its (transitive) requires still have the recorded
+# contents. Modification times are never consulted, so copying or checking
+# out files does not invalidate the cache.
+#
+# The manifest is a text file with one tab separated line per module:
+#
+#   <path> <digest> <json file> [<required path> <digest>]*
+#
+# The json files in the cache directory are named after the digest of the
+# path of the module together with the digest of its contents. The expansion
+# holds the absolute paths of the modules it requires and its source
+# locations, so two files with the same contents in different directories
+# (two checkouts, or CI workers sharing the cache) must not share a json file.
+# Code given on the command line is recorded under a name derived from the
+# digest of the code, see Manifest.code_path.
+#
+import os
+
+from rpython.rlib import streamio
+from rpython.rlib.rmd5 import RMD5
+
+MANIFEST_NAME = "manifest"
+
+def file_digest(path):
+    """ The md5 digest of the contents of `path`, "" if it cannot be read """
+    try:
+        f = streamio.open_file_as_stream(path)
+        data = f.readall()
+        f.close()
+    except OSError:
+        return ""
+    return RMD5(data).hexdigest()
+
+class ManifestEntry(object):
+    _immutable_fields_ = ["digest", "json_file", "requires[*]", "digests[*]"]
+
+    def __init__(self, digest, json_file, requires, digests):
+        assert len(requires) == len(digests)
+        self.digest = digest
+        self.json_file = json_file
+        self.requires = requires
+        self.digests = digests
+
+    def tostring(self, path):
+        fields = [path, self.digest, self.json_file]
+        for i in range(len(self.requires)):
+            fields.append(self.requires[i])
+            fields.append(self.digests[i])
+        return "\t".join(fields)
+
+
+class Manifest(object):
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.entries = {}
+        self.dirty = False
+        # per run memo tables, files are hashed at most once
+        self._digests = {}
+        self._up_to_date = {}
+
+    def manifest_file(self):
+        return os.path.join(self.cache_dir, MANIFEST_NAME)
+
+    def load(self):
+        try:
+            f = streamio.open_file_as_stream(self.manifest_file())
+            data = f.readall()
+            f.close()
+        except OSError:
+            return
+        for line in data.split("\n"):
+            fields = line.split("\t")
+            if len(fields) < 3 or len(fields) % 2 == 0:
+                continue
+            requires = []
+            digests = []
+            i = 3
+            while i < len(fields):
+                requires.append(fields[i])
+                digests.append(fields[i + 1])
+                i += 2
+            self.entries[fields[0]] = ManifestEntry(fields[1], fields[2],
+                                                    requires, digests)
+
+    def save(self):
+        if not self.dirty:
+            return
+        lines = [entry.tostring(path) for path, entry in self.entries.iteritems()]
+        name = self.manifest_file()
+        tmp = "%s.%d" % (name, os.getpid())
+        try:
+            self.ensure_cache_dir()
+            f = streamio.open_file_as_stream(tmp, "w")
+            f.write("\n".join(lines))
+            f.write("\n")
+            f.close()
+            os.rename(tmp, name)
+        except OSError:
+            return
+        self.dirty = False
+
+    def ensure_cache_dir(self):
+        if not os.path.isdir(self.cache_dir):
+            os.mkdir(self.cache_dir)
+
+    def digest(self, path):
+        digest = self._digests.get(path, None)
+        if digest is None:
+            digest = file_digest(path)
+            self._digests[path] = digest
+        return digest
+
+    def json_name(self, path):
+        key = RMD5(path + "\0" + self.digest(path)).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def code_path(self, source):
+        """ The name under which the expansion of `source` is recorded, for
+        code that is not in a file (-e). Its digest is the one of a missing
+        file, so only the files it requires are checked. Relative requires
+        are resolved against the working directory, so it is part of the
+        name. """
+        key = RMD5(os.getcwd() + "\0" + source).hexdigest()
+        return os.path.join(self.cache_dir, "code-" + key)
+
+    def up_to_date(self, path):
+        """ Is the recorded expansion of `path` still valid? That is the case
+        if neither the file nor anything it requires changed. """
+        result = self._up_to_date.get(path, -1)
+        if result != -1:
+            return result == 1
+        # guard against cycles, they cannot be up to date
+        self._up_to_date[path] = 0
+        if self._check(path):
+            self._up_to_date[path] = 1
+            return True
+        return False
+
+    def _check(self, path):
+        entry = self.entries.get(path, None)
+        if entry is None:
+            return False
+        if self.digest(path) != entry.digest:
+            return False
+        for i in range(len(entry.requires)):
+            required = entry.requires[i]
+            if self.digest(required) != entry.digests[i]:
+                return False
+            if required in self.entries and not self.up_to_date(required):
+                return False
+        return os.access(entry.json_file, os.R_OK)
+
+    def lookup(self, path):
+        """ The json file for `path` if it is up to date, otherwise None """
+        if self.up_to_date(path):
+            return self.entries[path].json_file
+        return None
+
+    def record(self, path, json_file, requires):
+        digests = [self.digest(required) for required in requires]
+        entry = self.entries.get(path, None)
+        if (entry is not None and entry.digest == self.digest(path) and
+                entry.json_file == json_file and entry.requires == requires and
+                entry.digests == digests):
+            return
+        self.entries[path] = ManifestEntry(self.digest(path), json_file,
+                                           requires, digests)
+        self._up_to_date.clear()
+        self.dirty = True
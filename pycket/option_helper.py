@@ -40,6 +40,22 @@ def print_help(argv):
   -u <file>, --require-script <file> : Same as -t <file> -N <file> --
  Configuration options:
   --stdlib: Use Pycket's version of stdlib (only applicable for -e)
+  --cache-dir <dir> : Keep expanded modules in <dir>, checked by content
+  --expand-jobs <n> : Expand required modules with <n> racket processes
+  --literal-stats : Report how many literals of each module are shared
+  --jit-hints <file> : Mark the loops recorded in <file> before running, and
+                       record the loops of this run there at exit
+  --profile <file> : Sample the Racket level stacks, write them to <file> at
+                     exit in the folded format of flamegraph.pl
+  --profile-interval <n> : Take a sample every <n> interpreter steps
+  --lazy : Convert the bodies of module level functions when first called
+  --lazy-stats : Like --lazy, reports how many bodies were never converted
+  --inline : Inline small functions at the places they are called
+  --simplify : Fold constants and remove dead branches when loading modules
+  --simplify-stats : Like --simplify, reports the AST sizes before and after
+  --ic-stats : Report the hit rates of the inline caches of call sites at exit
+  --shape-stats : Report the most frequently executed AST shapes at exit
+  --serve : Run the programs given on stdin, one per line, in this process
  Meta options:
   --jit <jitargs> : Set RPython JIT options may be 'default', 'off',
                     or 'param=value,param=value' list
@@ -56,6 +72,15 @@ def parse_args(argv):
         'stdlib': False,
 #        'mcons': False,
         'mode': _run,
+        'literal-stats': False,
+        'lazy': False,
+        'lazy-stats': False,
+        'inline': False,
+        'simplify': False,
+        'simplify-stats': False,
+        'ic-stats': False,
+        'shape-stats': False,
+        'serve': False,
     }
     names = {
         # 'file': "",
@@ -84,6 +109,66 @@ def parse_args(argv):
         elif argv[i] == "--stdlib":
             config['stdlib'] = True
             i += 1
+        elif argv[i] == "--cache-dir":
+            if to <= i + 1:
+                print "missing argument after --cache-dir"
+                retval = 5
+                break
+            i += 1
+            names['cache-dir'] = argv[i]
+        elif argv[i] == "--jit-hints":
+            if to <= i + 1:
+                print "missing argument after --jit-hints"
+                retval = 5
+                break
+            i += 1
+            names['jit-hints'] = argv[i]
+        elif argv[i] == "--profile":
+            if to <= i + 1:
+                print "missing argument after --profile"
+                retval = 5
+                break
+            i += 1
+            names['profile'] = argv[i]
+        elif argv[i] == "--profile-interval":
+            # at most 9 digits, so that it fits a machine int
+            if (to <= i + 1 or not argv[i + 1].isdigit() or
+                    len(argv[i + 1]) > 9):
+                print "missing or bad argument after --profile-interval"
+                retval = 5
+                break
+            i += 1
+            names['profile-interval'] = argv[i]
+        elif argv[i] == "--literal-stats":
+            config['literal-stats'] = True
+        elif argv[i] == "--lazy":
+            config['lazy'] = True
+        elif argv[i] == "--lazy-stats":
+            config['lazy'] = True
+            config['lazy-stats'] = True
+        elif argv[i] == "--inline":
+            config['inline'] = True
+        elif argv[i] == "--simplify":
+            config['simplify'] = True
+        elif argv[i] == "--simplify-stats":
+            config['simplify'] = True
+            config['simplify-stats'] = True
+        elif argv[i] == "--ic-stats":
+            config['ic-stats'] = True
+        elif argv[i] == "--shape-stats":
+            config['shape-stats'] = True
+        elif argv[i] == "--serve":
+            config['serve'] = True
+            retval = 0
+        elif argv[i] == "--expand-jobs":
+            # at most 9 digits, so that it fits a machine int
+            if (to <= i + 1 or not argv[i + 1].isdigit() or
+                    len(argv[i + 1]) > 9):
+                print "missing or bad argument after --expand-jobs"
+                retval = 5
+                break
+            i += 1
+            names['expand-jobs'] = argv[i]
         elif argv[i] == "-e":
             if to <= i + 1:
                 print "missing argument after -e"
@@ -134,27 +219,20 @@ def parse_args(argv):
 
     return config, names, args, retval
 
-def _temporary_file():
-    from rpython.rlib.objectmodel import we_are_translated
-    if we_are_translated():
-        return os.tmpnam()
-    else:
-        import warnings
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            return os.tmpnam()
+# the name of the module given with -e, whose code is expanded in memory
+EVAL_MODULE_NAME = "-e"
 
-def ensure_json_ast(config, names):
+def ensure_json_ast(config, names, manifest=None):
     stdlib = config.get('stdlib', False)
     # mcons = config.get('mcons', False)
     # assert not mcons
 
     if config["mode"] is _eval:
         code = names['exprs']
-        if 'file' in names:
-            file_name = names['file']
-        else:
-            file_name = _temporary_file()
+        if 'file' not in names:
+            # see expand.expand_code_to_ast
+            return EVAL_MODULE_NAME, None
+        file_name = names['file']
         assert not file_name.endswith('.json')
         json_file = ensure_json_ast_eval(code, file_name, stdlib)
     elif config["mode"] is _run:
@@ -165,7 +243,7 @@ def ensure_json_ast(config, names):
             json_file = file_name
         else:
             try:
-                json_file = ensure_json_ast_run(file_name)
+                json_file = ensure_json_ast_run(os.path.abspath(file_name), manifest)
             except PermException:
                 json_file = None
     else:
@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Expanding a program on a cold cache used to run one racket process per
+# module, one after the other, as `_to_require` reached them. This pre-pass
+# walks the require graph starting from the main module's json and expands
+# all modules without an up to date expansion, keeping up to `jobs` racket
+# processes running at the same time. The AST construction that follows then
+# finds every expansion in the cache.
+#
+import os
+import time
+
+# seconds between two polls of the running racket processes
+POLL_INTERVAL = 0.005
+
+from rpython.rlib.rfloat import formatd
+from pycket import pycket_json
+from pycket.expand import (fn, readfile_rpython, needs_update, _json_name,
+                           expander_socket_name)
+
+class Job(object):
+    def __init__(self, rkt_file, json_file, pid, start):
+        self.rkt_file = rkt_file
+        self.json_file = json_file
+        self.pid = pid
+        self.start = start
+
+    def tmp_file(self):
+        return "%s.%d.tmp" % (self.json_file, self.pid)
+
+
+class ParallelExpander(object):
+    def __init__(self, modtable, jobs):
+        assert jobs > 0
+        self.manifest = modtable.manifest
+        self.jobs = jobs
+        self.seen = {}
+        self.pending = []
+        self.running = {}
+        self.expanded = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    def cached_json(self, rkt_file):
+        if self.manifest is not None:
+            return self.manifest.lookup(rkt_file)
+        json_file = _json_name(rkt_file)
+        if needs_update(rkt_file, json_file):
+            return None
+        return json_file
+
+    def json_target(self, rkt_file):
+        if self.manifest is not None:
+            return self.manifest.json_name(rkt_file)
+        if not os.access(rkt_file, os.W_OK):
+            # no place for the json, expand_file_cached expands it in memory
+            return None
+        return _json_name(rkt_file)
+
+    def requires_of(self, rkt_file, json_file):
+        if self.manifest is not None and self.manifest.lookup(rkt_file) is not None:
+            return self.manifest.entries[rkt_file].requires
+        return json_file_requires(json_file)
+
+    def add(self, requires):
+        for rkt_file in requires:
+            if rkt_file in self.seen:
+                continue
+            self.seen[rkt_file] = None
+            if not os.access(rkt_file, os.R_OK):
+                continue
+            json_file = self.cached_json(rkt_file)
+            if json_file is not None:
+                self.add(self.requires_of(rkt_file, json_file))
+            else:
+                self.pending.append(rkt_file)
+
+    def spawn(self, rkt_file):
+        json_file = self.json_target(rkt_file)
+        if json_file is None:
+            return
+        pid = os.fork()
+        if pid == 0:
+            tmp = "%s.%d.tmp" % (json_file, os.getpid())
+            cmd = "racket %s --output \"%s\" \"%s\" > /dev/null 2>&1" % (
+                fn, tmp, rkt_file)
+            try:
+                os.execv("/bin/sh", ["/bin/sh", "-c", cmd])
+            finally:
+                os._exit(127)
+        self.running[pid] = Job(rkt_file, json_file, pid, time.time())
+
+    def wait_any(self):
+        """ Wait until one of the running racket processes exits, returns its
+        pid and status. Only these pids are waited for, other children of the
+        process (e.g. of a --serve run) are left alone. """
+        while True:
+            for pid in self.running.keys():
+                done, status = os.waitpid(pid, os.WNOHANG)
+                if done == pid:
+                    return pid, status
+            time.sleep(POLL_INTERVAL)
+
+    def reap(self):
+        pid, status = self.wait_any()
+        job = self.running.pop(pid)
+        self.busy_time += time.time() - job.start
+        tmp = job.tmp_file()
+        ok = os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+        if ok:
+            try:
+                os.rename(tmp, job.json_file)
+            except OSError:
+                # racket exited normally without writing the expansion
+                ok = False
+        if ok:
+            self.expanded += 1
+            requires = self.requires_of(job.rkt_file, job.json_file)
+            if self.manifest is not None:
+                self.manifest.record(job.rkt_file, job.json_file, requires)
+            self.add(requires)
+        else:
+            # leave it to the sequential expansion to report the error
+            self.failed += 1
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def run(self, requires):
+        if self.manifest is not None:
+            try:
+                self.manifest.ensure_cache_dir()
+            except OSError:
+                return
+        self.add(requires)
+        while self.pending or self.running:
+            while self.pending and len(self.running) < self.jobs:
+                self.spawn(self.pending.pop(0))
+            if self.running:
+                self.reap()
+
+
+def json_file_requires(json_file):
+    try:
+        data = readfile_rpython(json_file)
+    except OSError:
+        return []
+    return json_requires(pycket_json.loads(data))
+
+def json_requires(json):
+    """ All the module files a module's json requires """
+    result = []
+    if json.is_object:
+        obj = json.value_object()
+        if "language" in obj and obj["language"].is_string:
+            _add_require(obj["language"].value_string(), result)
+    _collect_requires(json, result)
+    return result
+
+def _add_require(path, result):
+    if path and not path.startswith("#%") and path not in result:
+        result.append(path)
+
+def _collect_requires(json, result):
+    if json.is_object:
+        for key, value in json.value_object().iteritems():
+            if key == "require" and value.is_array:
+                for path in value.value_array():
+                    if path.is_string:
+                        _add_require(path.value_string(), result)
+            else:
+                _collect_requires(value, result)
+    elif json.is_array:
+        for value in json.value_array():
+            _collect_requires(value, result)
+
+def expand_requires_parallel(json_file, modtable, jobs):
+    """ Expand everything the module in `json_file` (transitively) requires
+    with up to `jobs` concurrent racket processes. """
+    socket = expander_socket_name()
+    if socket and os.access(socket, os.F_OK):
+        # a running expander server is cheaper than starting processes
+        return
+    start = time.time()
+    expander = ParallelExpander(modtable, jobs)
+    expander.run(json_file_requires(json_file))
+    if expander.expanded or expander.failed:
+        wall = time.time() - start
+        saved = max(0.0, expander.busy_time - wall)
+        # on stderr, not mixed into the output of the program
+        os.write(2, "Expanded %d modules with %d jobs in %ss (%ss saved)\n" % (
+            expander.expanded, jobs, formatd(wall, 'f', 2), formatd(saved, 'f', 2)))
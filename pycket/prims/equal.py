@@ -196,7 +196,7 @@ def eqp_logic(a, b):
         return a.value == b.value
     return False
 
-@expose("eq?", [values.W_Object] * 2)
+@expose("eq?", [values.W_Object] * 2, pure=True)
 def eqp(a, b):
     return values.W_Bool.make(eqp_logic(a, b))
 
@@ -237,7 +237,8 @@ def make_remove_extra_info(func):
     remove_extra_info.__name__ += func.__name__
     return remove_extra_info
 
-def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=False):
+def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=False,
+           pure=False):
     """
     n:          names that the function should be exposed under
     argstypes:  if None, the list of args is passed directly to the function
@@ -251,6 +252,9 @@ def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=Fal
                 do with it is to pass it into a w_value.call_with_extra_info as
                 the last argument. This will ensure that the call graph
                 information stays correct.
+    pure:       the function has no side effects, and the result only depends
+                on the arguments and has no identity, so that calls with
+                constant arguments can be folded (see simplify.py)
     """
     def wrapper(func):
         from pycket import values
@@ -258,6 +262,8 @@ def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=Fal
         name = names[0]
         if extra_info:
             assert not simple
+        if pure:
+            assert simple and not nyi
         call1 = call2 = None
         if nyi:
             def func_arg_unwrap(*args):
@@ -276,7 +282,8 @@ def expose(n, argstypes=None, simple=True, arity=None, nyi=False, extra_info=Fal
         if not extra_info:
             func_result_handling = make_remove_extra_info(func_result_handling)
         cls = values.W_Prim
-        p = cls(name, func_result_handling, _arity, call1, call2)
+        p = cls(name, func_result_handling, _arity, call1, call2,
+                func_arg_unwrap if pure else None)
         for nam in names:
             sym = values.W_Symbol.make(nam)
             if sym in prim_env:
@@ -35,14 +35,14 @@ from pycket.prims import vector
 from rpython.rlib import jit
 
 def make_pred(name, cls):
-    @expose(name, [values.W_Object], simple=True)
+    @expose(name, [values.W_Object], simple=True, pure=True)
     def predicate_(a):
         return values.W_Bool.make(isinstance(a, cls))
     predicate_.__name__ +=  cls.__name__
 
 def make_pred_eq(name, val):
     typ = type(val)
-    @expose(name, [values.W_Object], simple=True)
+    @expose(name, [values.W_Object], simple=True, pure=True)
     def pred_eq(a):
         return values.W_Bool.make(isinstance(a, typ) and a is val)
 
@@ -103,7 +103,7 @@ for args in [
         ("hash-eq?", values_hash.W_HashTable),
         ("hash-eqv?", values_hash.W_HashTable),
         ("hash-equal?", values_hash.W_HashTable),
-        ("hash-weak?", values_hash.W_HashTable)
+        ("hash-weak?", values_hash.W_WeakHashTable)
         ]:
     make_pred(*args)
 
@@ -636,7 +636,7 @@ def sem_peek_evt(s):
     return values.W_SemaphorePeekEvt(s)
 
 
-@expose("not", [values.W_Object])
+@expose("not", [values.W_Object], pure=True)
 def notp(a):
     return values.W_Bool.make(a is values.w_false)
 
@@ -678,11 +678,11 @@ def assq(a, b):
 def do_cons(a, b):
     return values.W_Cons.make(a,b)
 
-@expose("car", [values.W_Cons])
+@expose("car", [values.W_Cons], pure=True)
 def do_car(a):
     return a.car()
 
-@expose("cdr", [values.W_Cons])
+@expose("cdr", [values.W_Cons], pure=True)
 def do_cdr(a):
     return a.cdr()
 
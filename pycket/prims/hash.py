@@ -4,25 +4,33 @@ from pycket              import impersonators as imp
 from pycket              import values
 from pycket.values_hash  import (
     W_HashTable, W_EqvHashTable, W_EqualHashTable, W_EqHashTable,
-    w_missing)
+    W_ImmutableHashTable, W_WeakHashTable, EQ_KIND, EQV_KIND, EQUAL_KIND, equal_hash, w_missing)
 from pycket.cont         import continuation
 from pycket.error        import SchemeException
 from pycket.prims.expose import default, expose, procedure, define_nyi
 
+# The positions of hash-iterate-* are the positions of W_HashTable.get_item,
+# deleted entries are skipped with next_position.
+
+def _position(index):
+    if index < 0:
+        return values.w_false
+    return values.W_Fixnum.make(index)
+
 @expose("hash-iterate-first", [W_HashTable])
 def hash_iterate_first(ht):
-    if ht.length() == 0:
-        return values.w_false
-    return values.W_Fixnum.make(0)
+    return _position(ht.next_position(0))
 
 @expose("hash-iterate-next", [W_HashTable, values.W_Fixnum])
 def hash_iterate_next(ht, pos):
-    if ht.length()-1 == pos.value:
-        return values.w_false
-    return values.W_Fixnum.make(pos.value + 1)
+    if pos.value < 0:
+        raise SchemeException("hash-iterate-next: invalid position")
+    return _position(ht.next_position(pos.value + 1))
 
 def hash_iter_ref(ht, pos, key=False):
     n = pos.value
+    if n < 0:
+        raise SchemeException("hash-iterate-key: invalid position")
     try:
         w_key, w_val = ht.get_item(n)
         if key:
@@ -53,15 +61,11 @@ def hash_for_each(h, f, env, cont):
 @continuation
 def hash_for_each_cont(f, ht, index, env, cont, _vals):
     from pycket.interpreter import return_value
-    nextindex = index + 1
-    try:
-        w_key, w_value = ht.get_item(index)
-    except KeyError:
-        return return_value(values.w_void, env,
-                hash_for_each_cont(f, ht, nextindex, env, cont))
-    except IndexError:
+    index = ht.next_position(index)
+    if index < 0:
         return return_value(values.w_void, env, cont)
-    after = hash_for_each_cont(f, ht, nextindex, env, cont)
+    w_key, w_value = ht.get_item(index)
+    after = hash_for_each_cont(f, ht, index + 1, env, cont)
     return f.call([w_key, w_value], env, after)
 
 
@@ -79,43 +83,66 @@ def hash_map_cont(f, ht, index, w_acc, env, cont, vals):
     w_val = check_one_val(vals)
     if w_val is not w_missing:
         w_acc = values.W_Cons.make(w_val, w_acc)
-    nextindex = index + 1
-    try:
-        w_key, w_value = ht.get_item(index)
-    except KeyError:
-        return return_value(w_missing, env,
-                hash_map_cont(f, ht, nextindex, w_acc, env, cont))
-    except IndexError:
+    index = ht.next_position(index)
+    if index < 0:
         return return_value(w_acc, env, cont)
-    after = hash_map_cont(f, ht, nextindex, w_acc, env, cont)
+    w_key, w_value = ht.get_item(index)
+    after = hash_map_cont(f, ht, index + 1, w_acc, env, cont)
     return f.call([w_key, w_value], env, after)
 
 
-@expose("make-weak-hasheq", [])
-def make_weak_hasheq():
-    # FIXME: not actually weak
-    return W_EqvHashTable([], [])
-
-@expose("make-immutable-hash", [default(values.W_List, values.w_null)])
-def make_immutable_hash(assocs):
-    # FIXME: Not annotated as immutable
+def unzip_assocs(assocs, name):
+    """ The keys and the values of a list of pairs """
     lsts = values.from_list(assocs)
     keys = []
     vals = []
     for lst in lsts:
         if not isinstance(lst, values.W_Cons):
-            raise SchemeException("make-hash: expected list of pairs")
+            raise SchemeException("%s: expected list of pairs" % name)
         keys.append(lst.car())
         vals.append(lst.cdr())
-    return W_EqualHashTable(keys, vals)
+    return keys, vals
+
+def make_weak_table(kind, pairs, name, env, cont):
+    keys, vals = unzip_assocs(pairs, name)
+    return W_WeakHashTable.make_cps(kind, keys, vals, env, cont)
+
+@expose("make-weak-hash", [default(values.W_List, values.w_null)], simple=False)
+def make_weak_hash(pairs, env, cont):
+    return make_weak_table(EQUAL_KIND, pairs, "make-weak-hash", env, cont)
+
+@expose("make-weak-hasheq", [default(values.W_List, values.w_null)], simple=False)
+def make_weak_hasheq(pairs, env, cont):
+    return make_weak_table(EQ_KIND, pairs, "make-weak-hasheq", env, cont)
+
+@expose("make-weak-hasheqv", [default(values.W_List, values.w_null)], simple=False)
+def make_weak_hasheqv(pairs, env, cont):
+    return make_weak_table(EQV_KIND, pairs, "make-weak-hasheqv", env, cont)
 
-@expose("hash")
-def hash(args):
+def make_immutable_table(kind, assocs, name):
+    keys, vals = unzip_assocs(assocs, name)
+    return W_ImmutableHashTable.make(kind, keys, vals)
+
+@expose("make-immutable-hash", [default(values.W_List, values.w_null)], simple=False)
+def make_immutable_hash(assocs, env, cont):
+    keys, vals = unzip_assocs(assocs, "make-immutable-hash")
+    return W_ImmutableHashTable.make_cps(EQUAL_KIND, keys, vals, env, cont)
+
+@expose("make-immutable-hasheq", [default(values.W_List, values.w_null)])
+def make_immutable_hasheq(assocs):
+    return make_immutable_table(EQ_KIND, assocs, "make-immutable-hasheq")
+
+@expose("make-immutable-hasheqv", [default(values.W_List, values.w_null)])
+def make_immutable_hasheqv(assocs):
+    return make_immutable_table(EQV_KIND, assocs, "make-immutable-hasheqv")
+
+@expose("hash", simple=False)
+def hash(args, env, cont):
     if len(args) % 2 != 0:
         raise SchemeException("hash: key does not have a corresponding value")
     keys = [args[i] for i in range(0, len(args), 2)]
     vals = [args[i] for i in range(1, len(args), 2)]
-    return W_EqualHashTable(keys, vals)
+    return W_ImmutableHashTable.make_cps(EQUAL_KIND, keys, vals, env, cont)
 
 @expose("hasheq")
 def hasheq(args):
@@ -123,7 +150,7 @@ def hasheq(args):
         raise SchemeException("hasheq: key does not have a corresponding value")
     keys = [args[i] for i in range(0, len(args), 2)]
     vals = [args[i] for i in range(1, len(args), 2)]
-    return W_EqHashTable(keys, vals)
+    return W_ImmutableHashTable.make(EQ_KIND, keys, vals)
 
 @expose("hasheqv")
 def hasheqv(args):
@@ -131,49 +158,32 @@ def hasheqv(args):
         raise SchemeException("hasheqv: key does not have a corresponding value")
     keys = [args[i] for i in range(0, len(args), 2)]
     vals = [args[i] for i in range(1, len(args), 2)]
-    return W_EqvHashTable(keys, vals)
+    return W_ImmutableHashTable.make(EQV_KIND, keys, vals)
 
 @expose("make-hash", [default(values.W_List, values.w_null)])
 def make_hash(pairs):
-    lsts = values.from_list(pairs)
-    keys = []
-    vals = []
-    for lst in lsts:
-        if not isinstance(lst, values.W_Cons):
-            raise SchemeException("make-hash: expected list of pairs")
-        keys.append(lst.car())
-        vals.append(lst.cdr())
+    keys, vals = unzip_assocs(pairs, "make-hash")
     return W_EqualHashTable(keys, vals)
 
 @expose("make-hasheq", [default(values.W_List, values.w_null)])
 def make_hasheq(pairs):
-    lsts = values.from_list(pairs)
-    keys = []
-    vals = []
-    for lst in lsts:
-        if not isinstance(lst, values.W_Cons):
-            raise SchemeException("make-hash: expected list of pairs")
-        keys.append(lst.car())
-        vals.append(lst.cdr())
+    keys, vals = unzip_assocs(pairs, "make-hasheq")
     return W_EqHashTable(keys, vals)
 
 @expose("make-hasheqv", [default(values.W_List, values.w_null)])
 def make_hasheqv(pairs):
-    lsts = values.from_list(pairs)
-    keys = []
-    vals = []
-    for lst in lsts:
-        if not isinstance(lst, values.W_Cons):
-            raise SchemeException("make-hash: expected list of pairs")
-        keys.append(lst.car())
-        vals.append(lst.cdr())
+    keys, vals = unzip_assocs(pairs, "make-hasheqv")
     return W_EqvHashTable(keys, vals)
 
 @expose("hash-set!", [W_HashTable, values.W_Object, values.W_Object], simple=False)
 def hash_set_bang(ht, k, v, env, cont):
     return ht.hash_set(k, v, env, cont)
 
-define_nyi("hash-set", [W_HashTable, values.W_Object, values.W_Object], simple=False)
+@expose("hash-set", [W_HashTable, values.W_Object, values.W_Object], simple=False)
+def hash_set(ht, k, v, env, cont):
+    if not isinstance(ht, W_ImmutableHashTable):
+        raise SchemeException("hash-set: contract violation, expected an immutable hash table")
+    return ht.assoc_cps(k, v, env, cont)
 
 @continuation
 def hash_ref_cont(default, env, cont, _vals):
@@ -195,23 +205,36 @@ def hash_ref(ht, k, default, env, cont):
 def hash_remove_bang(ht, k, env, cont):
     return ht.hash_remove(k, env, cont)
 
-define_nyi("hash-remove", [W_HashTable, values.W_Object])
+@expose("hash-remove", [W_HashTable, values.W_Object], simple=False)
+def hash_remove(ht, k, env, cont):
+    if not isinstance(ht, W_ImmutableHashTable):
+        raise SchemeException("hash-remove: contract violation, expected an immutable hash table")
+    return ht.dissoc_cps(k, env, cont)
 
-define_nyi("hash-clear!", [W_HashTable])
+@expose("hash-clear!", [W_HashTable])
+def hash_clear_bang(ht):
+    ht.hash_clear()
+    return values.w_void
 
-define_nyi("hash-clear", [W_HashTable])
+@expose("hash-clear", [W_HashTable])
+def hash_clear(ht):
+    if not isinstance(ht, W_ImmutableHashTable):
+        raise SchemeException("hash-clear: contract violation, expected an immutable hash table")
+    return W_ImmutableHashTable.make(ht.kind, [], [])
 
 @expose("hash-count", [W_HashTable])
 def hash_count(hash):
     return values.W_Fixnum(hash.length())
 
-define_nyi("hash-copy", [W_HashTable])
+@expose("hash-copy", [W_HashTable])
+def hash_copy(ht):
+    return ht.hash_copy()
 
-# FIXME: not implemented
 @expose("equal-hash-code", [values.W_Object])
 def equal_hash_code(v):
-    return values.W_Fixnum(0)
+    return values.W_Fixnum(equal_hash(v))
 
+# FIXME: not implemented
 @expose("equal-secondary-hash-code", [values.W_Object])
 def equal_secondary_hash_code(v):
     return values.W_Fixnum(0)
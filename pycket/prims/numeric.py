@@ -17,7 +17,7 @@ from pycket import arithmetic
 
 def make_cmp(name, op, con):
 
-    @expose(name, simple=True)
+    @expose(name, simple=True, pure=True)
     @jit.unroll_safe
     def do(args):
         if len(args) < 2:
@@ -47,7 +47,7 @@ for args in [
         ]:
     make_cmp(*args)
 
-@expose("integer?", [values.W_Object])
+@expose("integer?", [values.W_Object], pure=True)
 def integerp(n):
     return values.W_Bool.make(isinstance(n, values.W_Fixnum) or
                               isinstance(n, values.W_Bignum) or
@@ -55,12 +55,12 @@ def integerp(n):
                               math.floor(n.value) == n.value)
 
 
-@expose("exact-integer?", [values.W_Object])
+@expose("exact-integer?", [values.W_Object], pure=True)
 def exact_integerp(n):
     return values.W_Bool.make(isinstance(n, values.W_Fixnum) or
                               isinstance(n, values.W_Bignum))
 
-@expose("exact-nonnegative-integer?", [values.W_Object])
+@expose("exact-nonnegative-integer?", [values.W_Object], pure=True)
 def exact_nonneg_integerp(n):
     from rpython.rlib.rbigint import rbigint
     if isinstance(n, values.W_Fixnum):
@@ -69,7 +69,7 @@ def exact_nonneg_integerp(n):
         return values.W_Bool.make(n.value.ge(rbigint.fromint(0)))
     return values.w_false
 
-@expose("exact-positive-integer?", [values.W_Object])
+@expose("exact-positive-integer?", [values.W_Object], pure=True)
 def exact_nonneg_integerp(n):
     from rpython.rlib.rbigint import rbigint
     if isinstance(n, values.W_Fixnum):
@@ -78,25 +78,25 @@ def exact_nonneg_integerp(n):
         return values.W_Bool.make(n.value.gt(rbigint.fromint(0)))
     return values.w_false
 
-@expose("real?", [values.W_Object])
+@expose("real?", [values.W_Object], pure=True)
 def realp(n):
     return values.W_Bool.make(isinstance(n, values.W_Fixnum) or
                               isinstance(n, values.W_Bignum) or
                               isinstance(n, values.W_Flonum))
 
-@expose("inexact-real?", [values.W_Object])
+@expose("inexact-real?", [values.W_Object], pure=True)
 def inexact_real(n):
     return values.W_Bool.make(isinstance(n, values.W_Flonum))
 
-@expose("single-flonum?", [values.W_Object])
+@expose("single-flonum?", [values.W_Object], pure=True)
 def single_flonum(n):
     return values.w_false
 
-@expose("double-flonum?", [values.W_Object])
+@expose("double-flonum?", [values.W_Object], pure=True)
 def double_flonum(n):
     return values.W_Bool.make(isinstance(n, values.W_Flonum))
 
-@expose("rational?", [values.W_Object])
+@expose("rational?", [values.W_Object], pure=True)
 def rationalp(n):
     if isinstance(n, values.W_Fixnum) or isinstance(n, values.W_Bignum):
         return values.w_true
@@ -104,12 +104,12 @@ def rationalp(n):
         v = n.value
         return values.W_Bool.make(not (math.isnan(v) or math.isinf(v)))
 
-@expose("exact?", [values.W_Object])
+@expose("exact?", [values.W_Object], pure=True)
 def exactp(n):
     return values.W_Bool.make(isinstance(n, values.W_Fixnum) or
                               isinstance(n, values.W_Bignum))
 
-@expose("inexact?", [values.W_Object])
+@expose("inexact?", [values.W_Object], pure=True)
 def inexactp(n):
     return values.W_Bool.make(isinstance(n, values.W_Flonum))
 
@@ -118,7 +118,7 @@ def quotient_remainder(a, b):
     return values.Values.make([a.arith_quotient(b), a.arith_mod(b)]) #FIXME
 
 def make_binary_arith(name, methname):
-    @expose(name, [values.W_Number, values.W_Number], simple=True)
+    @expose(name, [values.W_Number, values.W_Number], simple=True, pure=True)
     def do(a, b):
         return getattr(a, methname)(b)
     do.__name__ = methname
@@ -133,7 +133,7 @@ for args in [
 
 
 def make_arith(name, neutral_element, methname, supports_zero_args):
-    @expose(name, simple=True)
+    @expose(name, simple=True, pure=True)
     @jit.unroll_safe
     def do(args):
         # XXX so far (+ '()) returns '(). need better type checking here
@@ -171,13 +171,13 @@ def make_fixedtype_binary_arith(
         name, methname, intversion=True, floatversion=True):
     methname += "_same"
     if floatversion:
-        @expose("fl" + name, [values.W_Flonum] * 2, simple=True)
+        @expose("fl" + name, [values.W_Flonum] * 2, simple=True, pure=True)
         def do(a, b):
             return getattr(a, methname)(b)
         do.__name__ = "fl_" + methname
 
     if intversion:
-        @expose("fx" + name, [values.W_Fixnum] * 2, simple=True)
+        @expose("fx" + name, [values.W_Fixnum] * 2, simple=True, pure=True)
         def do(a, b):
             return getattr(a, methname)(b)
         do.__name__ = "fx_" + methname
@@ -201,13 +201,13 @@ def make_fixedtype_cmps(name, methname):
     def do(a, b):
         return values.W_Bool.make(getattr(a, methname)(b))
     do.__name__ = "fl_" + methname
-    expose("fl" + name, [values.W_Flonum] * 2, simple=True)(do)
+    expose("fl" + name, [values.W_Flonum] * 2, simple=True, pure=True)(do)
     expose("unsafe-fl" + name, [unsafe(values.W_Flonum)] * 2, simple=True)(do)
 
     def do(a, b):
         return values.W_Bool.make(getattr(a, methname)(b))
     do.__name__ = "fx_" + methname
-    expose("fx" + name, [values.W_Fixnum] * 2, simple=True)(do)
+    expose("fx" + name, [values.W_Fixnum] * 2, simple=True, pure=True)(do)
     expose("unsafe-fx" + name, [unsafe(values.W_Fixnum)] * 2, simple=True)(do)
 
 for args in [
@@ -223,7 +223,7 @@ for args in [
 def flsqrt(f):
     return f.arith_sqrt()
 
-@expose("add1", [values.W_Number])
+@expose("add1", [values.W_Number], pure=True)
 def add1(v):
     return v.arith_add(values.W_Fixnum(1))
 
@@ -247,15 +247,15 @@ def make_unary_arith(name, methname, flversion=False, fxversion=False,
     def do(a):
         return getattr(a, methname)()
     do.__name__ = methname
-    expose(name, [unwrap_type], simple=True)(do)
+    expose(name, [unwrap_type], simple=True, pure=True)(do)
     if flversion:
-        @expose("fl" + name, [values.W_Flonum], simple=True)
+        @expose("fl" + name, [values.W_Flonum], simple=True, pure=True)
         def dofl(a):
             return getattr(a, methname)()
         dofl.__name__ = methname
 
     if fxversion:
-        @expose("fx" + name, [values.W_Fixnum], simple=True)
+        @expose("fx" + name, [values.W_Fixnum], simple=True, pure=True)
         def dofx(a):
             return getattr(a, methname)()
         dofx.__name__ = methname
@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A sampling profiler at the level of Racket code.
+#
+# With --profile <file>, the interpreter loop takes a sample every
+# --profile-interval steps (DEFAULT_INTERVAL by default), also in jitted
+# code. A sample walks the chain of continuations and records the lambda of
+# the AST that is executed and of the AST every continuation belongs to, as
+# source locations. Consecutive frames of the same lambda are folded into one,
+# so a recursion shows up as a single frame. At exit the samples are written
+# in the folded stack format of flamegraph.pl, one line per stack, outermost
+# frame first:
+#
+#   <module>;fib.rkt:120;fib.rkt:45 17
+#
+from rpython.rlib import jit, streamio
+
+from pycket.cont import Cont
+
+DEFAULT_INTERVAL = 10000
+
+# only the innermost continuations of deep stacks are walked
+MAX_DEPTH = 500
+
+def location(ast):
+    # spaces and semicolons separate counts and frames in the output
+    return ast.location().replace(" ", "_").replace(";", "_")
+
+class Sampler(object):
+    _immutable_fields_ = ["enabled?"]
+
+    def __init__(self):
+        self.enabled = False
+        self.interval = DEFAULT_INTERVAL
+        self.countdown = DEFAULT_INTERVAL
+        # folded stack -> number of samples
+        self.stacks = {}
+
+    def enable(self, interval=DEFAULT_INTERVAL):
+        if interval < 1:
+            interval = 1
+        self.interval = self.countdown = interval
+        self.enabled = True
+
+    def tick(self, ast, cont):
+        self.countdown -= 1
+        if self.countdown <= 0:
+            self.countdown = self.interval
+            self.sample(ast, cont)
+
+    @jit.dont_look_inside
+    def sample(self, ast, cont):
+        # innermost first
+        frames = [location(ast)]
+        depth = 0
+        while isinstance(cont, Cont) and depth < MAX_DEPTH:
+            cont_ast = cont.get_ast()
+            if cont_ast is not None:
+                frame = location(cont_ast)
+                if frame != frames[-1]:
+                    frames.append(frame)
+            cont = cont.prev
+            depth += 1
+        if depth == MAX_DEPTH:
+            frames.append("[truncated]")
+        frames.reverse()
+        stack = ";".join(frames)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def folded(self):
+        lines = ["%s %d\n" % (stack, count)
+                 for stack, count in self.stacks.iteritems()]
+        return "".join(lines)
+
+    def write(self, fname):
+        f = streamio.open_file_as_stream(fname, "w")
+        f.write(self.folded())
+        f.close()
+
+sampler = Sampler()
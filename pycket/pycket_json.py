@@ -226,6 +226,9 @@ class OwnJSONDecoder(JSONDecoder):
         self.ll_chars = s + chr(0)
         self.pos = 0
         self.last_type = 0
+        # one flag per object or array being walked with the pull interface,
+        # True until its first key or element was read
+        self.first = []
 
     def close(self):
         pass
@@ -260,6 +263,109 @@ class OwnJSONDecoder(JSONDecoder):
             elif ch < '\x20':
                 self._raise("Invalid control character at char %d", self.pos-1)
 
+    # Pull interface: instead of building the whole tree with decode_any,
+    # a client can walk objects and arrays key by key and element by element,
+    # decoding (or skipping) only the values it is interested in.
+
+    def _expect(self, ch):
+        i = self.skip_whitespace(self.pos)
+        if self.ll_chars[i] != ch:
+            self._raise("Expected '%s' at char %d", ch, i)
+        self.pos = i + 1
+
+    def start_object(self):
+        self._expect('{')
+        self.first.append(True)
+
+    def next_key(self):
+        """ Returns the next key of the current object, positioning the
+        decoder at its value, or None at the end of the object. """
+        i = self.skip_whitespace(self.pos)
+        ch = self.ll_chars[i]
+        if ch == '}':
+            self.pos = i + 1
+            self.first.pop()
+            return None
+        if not self.first[-1]:
+            if ch != ',':
+                self._raise("Expected ',' or '}' at char %d", i)
+            i = self.skip_whitespace(i + 1)
+            ch = self.ll_chars[i]
+        self.first[-1] = False
+        if ch != '"':
+            self._raise("Key name must be string at char %d", i)
+        key = self.decode_string(i + 1)
+        self._expect(':')
+        return key.value_string()
+
+    def start_array(self):
+        self._expect('[')
+        self.first.append(True)
+
+    def next_element(self):
+        """ Positions the decoder at the next element of the current array.
+        Returns False at the end of the array. """
+        i = self.skip_whitespace(self.pos)
+        ch = self.ll_chars[i]
+        if ch == ']':
+            self.pos = i + 1
+            self.first.pop()
+            return False
+        if not self.first[-1]:
+            if ch != ',':
+                self._raise("Expected ',' or ']' at char %d", i)
+            i += 1
+        self.first[-1] = False
+        self.pos = i
+        return True
+
+    def decode_value(self):
+        return self.decode_any(self.pos)
+
+    def skip_value(self):
+        """ Skips over the current value without building it """
+        i = self.skip_whitespace(self.pos)
+        ch = self.ll_chars[i]
+        if ch != '{' and ch != '[' and ch != '"':
+            self.decode_any(i)
+            return
+        depth = 0
+        while True:
+            ch = self.ll_chars[i]
+            if ch == '"':
+                i = self._skip_string(i + 1)
+            elif ch == '{' or ch == '[':
+                depth += 1
+                i += 1
+            elif ch == '}' or ch == ']':
+                depth -= 1
+                i += 1
+            elif ch == '\0' and i >= len(self.s):
+                self._raise("Unterminated value starting at char %d", self.pos)
+            else:
+                i += 1
+            if depth == 0:
+                break
+        self.pos = i
+
+    def value_text(self):
+        """ Skips over the current value, returning its json text """
+        start = self.skip_whitespace(self.pos)
+        self.skip_value()
+        return self.getslice(start, self.pos)
+
+    def _skip_string(self, i):
+        while True:
+            ch = self.ll_chars[i]
+            if ch == '"':
+                return i + 1
+            elif ch == '\0' and i >= len(self.s):
+                self._raise("Unterminated string at char %d", i)
+            elif ch == '\\' and i + 1 < len(self.s):
+                i += 2
+            else:
+                i += 1
+
 
 
 def loads(s):
@@ -0,0 +1,696 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compact binary serialization of expanded modules.
+#
+# The format stores the AST that `expand._to_module` builds from the JSON
+# produced by the Racket expander, i.e. the AST *before* assignment
+# conversion. Environment structures, cells and pruning information are
+# derived data and are recomputed by `assign_convert_module` after loading,
+# which is cheap compared to parsing the JSON and walking the JSON tree.
+#
+# Layout:
+#   magic, version
+#   ast flags      (the options that shape the ASTs, see ModTable.ast_flags)
+#   string table   (file names, module paths, symbol names)
+#   symbol table   (index into the string table plus a kind tag)
+#   module
+#
+# Integers are written as zigzag varints, strings as a length followed by
+# the raw bytes. Symbols are referenced by their index in the symbol table,
+# so uninterned (gensym'd) symbols keep their identity within a module.
+# The bodies of lambdas that are converted lazily are stored as their json
+# text. A cache is only loaded by a run with the same ast flags, so that for
+# example a --lazy run does not get the bodies of a cache written without it.
+#
+from rpython.rlib.rstring import StringBuilder
+from rpython.rlib.rbigint import rbigint
+from rpython.rlib.longlong2float import float2longlong, longlong2float
+from rpython.rlib.rarithmetic import r_longlong, r_ulonglong, intmask
+
+from pycket import values, values_string, values_regex, vector, values_hash
+from pycket.env import SymList
+from pycket.error import SchemeException
+from pycket.interpreter import (Module, Require, Quote, QuoteSyntax,
+    VariableReference, WithContinuationMark, App, Begin, Begin0, LexicalVar,
+    CellRef, ModuleVar, ToplevelVar, SetBang, If, CaseLambda, Lambda, Letrec,
+    Let, DefineValues, AlreadyRequired, LazyBody, make_lambda)
+
+MAGIC = "PYCKETAST"
+VERSION = 4
+
+class SerializationError(SchemeException):
+    pass
+
+class DeserializationError(SchemeException):
+    pass
+
+# ___________________________________________________________________________
+# tags
+
+AST_BEGIN           = 1
+AST_BEGIN0          = 2
+AST_WCM             = 3
+AST_DEFINE_VALUES   = 4
+AST_LET             = 5
+AST_LETREC          = 6
+AST_IF              = 7
+AST_APP             = 8
+AST_CASE_LAMBDA     = 9
+AST_QUOTE           = 10
+AST_QUOTE_SYNTAX    = 11
+AST_VARREF          = 12
+AST_VARREF_NONE     = 13
+AST_SET_BANG        = 14
+AST_MODULE_VAR      = 15
+AST_LEXICAL_VAR     = 16
+AST_CELL_REF        = 17
+AST_TOPLEVEL_VAR    = 18
+AST_REQUIRE         = 19
+AST_LAZY_BODY       = 20
+
+VAL_FALSE           = 1
+VAL_TRUE            = 2
+VAL_NULL            = 3
+VAL_VOID            = 4
+VAL_FIXNUM          = 5
+VAL_FLONUM          = 6
+VAL_BIGNUM          = 7
+VAL_RATIONAL        = 8
+VAL_COMPLEX         = 9
+VAL_CHAR            = 10
+VAL_STRING          = 11
+VAL_BYTES           = 12
+VAL_SYMBOL          = 13
+VAL_KEYWORD         = 14
+VAL_PATH            = 15
+VAL_BOX             = 16
+VAL_VECTOR          = 17
+VAL_PAIR            = 18
+VAL_REGEXP          = 19
+VAL_PREGEXP         = 20
+VAL_BYTE_REGEXP     = 21
+VAL_BYTE_PREGEXP    = 22
+VAL_HASH            = 23
+VAL_IMMUTABLE_HASH  = 24
+
+SYM_INTERNED        = 0
+SYM_UNREADABLE      = 1
+SYM_UNINTERNED      = 2
+
+NO_STRING = -1
+
+# ___________________________________________________________________________
+# writing
+
+class Writer(object):
+    def __init__(self, flags=""):
+        self.flags = flags
+        self.out = StringBuilder()
+        self.strings = []
+        self.string_indices = {}
+        self.symbols = []
+        self.symbol_indices = {}
+
+    def write_int(self, n):
+        # zigzag encoding, so that small negative numbers stay small
+        u = r_ulonglong(r_longlong(n) << 1) ^ r_ulonglong(r_longlong(n) >> 63)
+        while u >= 0x80:
+            self.out.append(chr(intmask(u & 0x7f) | 0x80))
+            u = u >> 7
+        self.out.append(chr(intmask(u)))
+
+    def write_byte(self, b):
+        self.out.append(chr(b))
+
+    def write_float(self, f):
+        bits = float2longlong(f)
+        for i in range(8):
+            self.out.append(chr(intmask((bits >> (i * 8)) & 0xff)))
+
+    def string_index(self, s):
+        index = self.string_indices.get(s, -1)
+        if index == -1:
+            index = len(self.strings)
+            self.strings.append(s)
+            self.string_indices[s] = index
+        return index
+
+    def write_string(self, s):
+        if s is None:
+            self.write_int(NO_STRING)
+        else:
+            self.write_int(self.string_index(s))
+
+    def write_symbol(self, w_sym):
+        assert isinstance(w_sym, values.W_Symbol)
+        index = self.symbol_indices.get(w_sym, -1)
+        if index == -1:
+            index = len(self.symbols)
+            self.symbols.append(w_sym)
+            self.symbol_indices[w_sym] = index
+            self.string_index(w_sym.utf8value)
+        self.write_int(index)
+
+    def write_symbols(self, syms):
+        self.write_int(len(syms))
+        for w_sym in syms:
+            self.write_symbol(w_sym)
+
+    def write_asts(self, asts):
+        self.write_int(len(asts))
+        for ast in asts:
+            self.write_ast(ast)
+
+    def write_module(self, module):
+        assert isinstance(module, Module)
+        self.write_string(module.name)
+        keys = module.config.keys()
+        self.write_int(len(keys))
+        for key in keys:
+            self.write_string(key)
+            self.write_string(module.config[key])
+        self.write_asts(module.body)
+
+    def write_ast(self, ast):
+        # requires are redone when loading, the required module might not be
+        # loaded yet (or might have been loaded already)
+        if isinstance(ast, Require):
+            self.write_byte(AST_REQUIRE)
+            self.write_string(ast.modname)
+        elif isinstance(ast, AlreadyRequired):
+            self.write_byte(AST_REQUIRE)
+            self.write_string(ast.modname)
+        elif isinstance(ast, QuoteSyntax):
+            self.write_byte(AST_QUOTE_SYNTAX)
+            self.write_value(ast.w_val)
+        elif isinstance(ast, Quote):
+            self.write_byte(AST_QUOTE)
+            self.write_value(ast.w_val)
+        elif isinstance(ast, LexicalVar):
+            self.write_byte(AST_LEXICAL_VAR)
+            self.write_symbol(ast.sym)
+        elif isinstance(ast, ModuleVar):
+            self.write_byte(AST_MODULE_VAR)
+            self.write_symbol(ast.sym)
+            self.write_string(ast.srcmod)
+            self.write_symbol(ast.srcsym)
+        elif isinstance(ast, CellRef):
+            self.write_byte(AST_CELL_REF)
+            self.write_symbol(ast.sym)
+        elif isinstance(ast, ToplevelVar):
+            self.write_byte(AST_TOPLEVEL_VAR)
+            self.write_symbol(ast.sym)
+        elif isinstance(ast, App):
+            # covers the SimplePrimApp subclasses, which App.make recreates
+            self.write_byte(AST_APP)
+            self.write_ast(ast.rator)
+            self.write_asts(ast.rands)
+        elif isinstance(ast, If):
+            self.write_byte(AST_IF)
+            self.write_ast(ast.tst)
+            self.write_ast(ast.thn)
+            self.write_ast(ast.els)
+        elif isinstance(ast, Let):
+            self.write_byte(AST_LET)
+            self.write_symbols(ast.args.elems)
+            self._write_counts(ast.counts)
+            self.write_asts(ast.rhss)
+            self.write_asts(ast.body)
+        elif isinstance(ast, Letrec):
+            self.write_byte(AST_LETREC)
+            self.write_symbols(ast.args.elems)
+            self._write_counts(ast.counts)
+            self.write_asts(ast.rhss)
+            self.write_asts(ast.body)
+        elif isinstance(ast, Begin):
+            self.write_byte(AST_BEGIN)
+            self.write_asts(ast.body)
+        elif isinstance(ast, Begin0):
+            self.write_byte(AST_BEGIN0)
+            self.write_ast(ast.first)
+            self.write_ast(ast.body)
+        elif isinstance(ast, WithContinuationMark):
+            self.write_byte(AST_WCM)
+            self.write_ast(ast.key)
+            self.write_ast(ast.value)
+            self.write_ast(ast.body)
+        elif isinstance(ast, DefineValues):
+            self.write_byte(AST_DEFINE_VALUES)
+            self.write_symbols(ast.names)
+            self.write_symbols(ast.display_names)
+            self.write_ast(ast.rhs)
+        elif isinstance(ast, CaseLambda):
+            self.write_byte(AST_CASE_LAMBDA)
+            if ast.recursive_sym is None:
+                self.write_int(0)
+            else:
+                self.write_int(1)
+                self.write_symbol(ast.recursive_sym)
+            self.write_int(len(ast.lams))
+            for lam in ast.lams:
+                self._write_lambda(lam)
+        elif isinstance(ast, VariableReference):
+            if ast.var is None:
+                self.write_byte(AST_VARREF_NONE)
+            else:
+                self.write_byte(AST_VARREF)
+                self.write_ast(ast.var)
+            self.write_string(ast.path)
+        elif isinstance(ast, SetBang):
+            self.write_byte(AST_SET_BANG)
+            self.write_ast(ast.var)
+            self.write_ast(ast.rhs)
+        elif isinstance(ast, LazyBody):
+            if ast.json is None:
+                raise SerializationError("cannot serialize a converted lazy body")
+            self.write_byte(AST_LAZY_BODY)
+            self.write_string(ast.json)
+        else:
+            raise SerializationError("cannot serialize %s" % ast.tostring())
+
+    def _write_counts(self, counts):
+        self.write_int(len(counts))
+        for count in counts:
+            self.write_int(count)
+
+    def _write_lambda(self, lam):
+        assert isinstance(lam, Lambda)
+        self.write_symbols(lam.formals)
+        if lam.rest is None:
+            self.write_int(0)
+        else:
+            self.write_int(1)
+            self.write_symbol(lam.rest)
+        self.write_int(lam.srcpos)
+        self.write_string(lam.srcfile)
+        self.write_int(lam.srcline)
+        self.write_asts(lam.body)
+
+    def write_value(self, w_val):
+        if w_val is values.w_false:
+            self.write_byte(VAL_FALSE)
+        elif w_val is values.w_true:
+            self.write_byte(VAL_TRUE)
+        elif w_val is values.w_null:
+            self.write_byte(VAL_NULL)
+        elif w_val is values.w_void:
+            self.write_byte(VAL_VOID)
+        elif isinstance(w_val, values.W_Fixnum):
+            self.write_byte(VAL_FIXNUM)
+            self.write_int(w_val.value)
+        elif isinstance(w_val, values.W_Flonum):
+            self.write_byte(VAL_FLONUM)
+            self.write_float(w_val.value)
+        elif isinstance(w_val, values.W_Bignum):
+            self.write_byte(VAL_BIGNUM)
+            self.write_string(w_val.value.str())
+        elif isinstance(w_val, values.W_Rational):
+            self.write_byte(VAL_RATIONAL)
+            self.write_string(w_val._numerator.str())
+            self.write_string(w_val._denominator.str())
+        elif isinstance(w_val, values.W_Complex):
+            self.write_byte(VAL_COMPLEX)
+            self.write_value(w_val.real)
+            self.write_value(w_val.imag)
+        elif isinstance(w_val, values.W_Character):
+            self.write_byte(VAL_CHAR)
+            self.write_int(ord(w_val.value))
+        elif isinstance(w_val, values_string.W_String):
+            self.write_byte(VAL_STRING)
+            self.write_string(w_val.as_str_utf8())
+        elif isinstance(w_val, values.W_Bytes):
+            self.write_byte(VAL_BYTES)
+            self.write_string(w_val.as_str())
+        elif isinstance(w_val, values.W_Symbol):
+            self.write_byte(VAL_SYMBOL)
+            self.write_symbol(w_val)
+        elif isinstance(w_val, values.W_Keyword):
+            self.write_byte(VAL_KEYWORD)
+            self.write_string(w_val.value)
+        elif isinstance(w_val, values.W_Path):
+            self.write_byte(VAL_PATH)
+            self.write_string(w_val.path)
+        elif isinstance(w_val, values.W_IBox):
+            self.write_byte(VAL_BOX)
+            self.write_value(w_val.value)
+        elif isinstance(w_val, vector.W_Vector):
+            self.write_byte(VAL_VECTOR)
+            self.write_int(w_val.length())
+            for i in range(w_val.length()):
+                self.write_value(w_val.ref(i))
+        elif isinstance(w_val, values.W_Cons):
+            self.write_byte(VAL_PAIR)
+            self.write_value(w_val.car())
+            self.write_value(w_val.cdr())
+        elif isinstance(w_val, values_regex.W_AnyRegexp):
+            if isinstance(w_val, values_regex.W_PRegexp):
+                self.write_byte(VAL_PREGEXP)
+            elif isinstance(w_val, values_regex.W_ByteRegexp):
+                self.write_byte(VAL_BYTE_REGEXP)
+            elif isinstance(w_val, values_regex.W_BytePRegexp):
+                self.write_byte(VAL_BYTE_PREGEXP)
+            else:
+                self.write_byte(VAL_REGEXP)
+            self.write_string(w_val.source)
+        elif isinstance(w_val, values_hash.W_ImmutableHashTable):
+            self.write_byte(VAL_IMMUTABLE_HASH)
+            self.write_int(w_val.kind)
+            items = w_val.hash_items()
+            self.write_int(len(items))
+            for w_key, w_value in items:
+                self.write_value(w_key)
+                self.write_value(w_value)
+        elif isinstance(w_val, values_hash.W_EqualHashTable):
+            self.write_byte(VAL_HASH)
+            items = w_val.hash_items()
+            self.write_int(len(items))
+            for w_key, w_value in items:
+                self.write_value(w_key)
+                self.write_value(w_value)
+        else:
+            raise SerializationError("cannot serialize literal %s" % w_val.tostring())
+
+    def _symbol_kind(self, w_sym):
+        if not w_sym.is_interned():
+            return SYM_UNINTERNED
+        if w_sym.unreadable:
+            return SYM_UNREADABLE
+        return SYM_INTERNED
+
+    def getvalue(self):
+        body = self.out.build()
+        header = Writer()
+        header.out.append(MAGIC)
+        header.write_int(VERSION)
+        header.write_int(len(self.flags))
+        header.out.append(self.flags)
+        header.write_int(len(self.strings))
+        for s in self.strings:
+            header.write_int(len(s))
+            header.out.append(s)
+        header.write_int(len(self.symbols))
+        for w_sym in self.symbols:
+            header.write_int(self.string_indices[w_sym.utf8value])
+            header.write_byte(self._symbol_kind(w_sym))
+        header.out.append(body)
+        return header.out.build()
+
+# ___________________________________________________________________________
+# reading
+
+class Reader(object):
+    def __init__(self, data, modtable):
+        self.data = data
+        self.pos = 0
+        self.modtable = modtable
+        self.strings = []
+        self.symbols = []
+
+    def read_byte(self):
+        pos = self.pos
+        if pos >= len(self.data):
+            raise DeserializationError("unexpected end of AST cache")
+        self.pos = pos + 1
+        return ord(self.data[pos])
+
+    def read_int(self):
+        u = r_ulonglong(0)
+        shift = 0
+        while True:
+            b = self.read_byte()
+            u |= r_ulonglong(b & 0x7f) << shift
+            if b < 0x80:
+                break
+            shift += 7
+            if shift > 63:
+                raise DeserializationError("malformed integer in AST cache")
+        return intmask(r_longlong(u >> 1) ^ -r_longlong(u & 1))
+
+    def read_float(self):
+        bits = r_longlong(0)
+        for i in range(8):
+            bits |= r_longlong(self.read_byte()) << (i * 8)
+        return longlong2float(bits)
+
+    def read_raw_string(self, length):
+        start = self.pos
+        stop = start + length
+        if length < 0 or stop > len(self.data):
+            raise DeserializationError("unexpected end of AST cache")
+        self.pos = stop
+        assert start >= 0
+        assert stop >= 0
+        return self.data[start:stop]
+
+    def read_string(self):
+        index = self.read_int()
+        if index == NO_STRING:
+            return None
+        return self._string_at(index)
+
+    def read_str(self):
+        s = self.read_string()
+        if s is None:
+            raise DeserializationError("unexpected missing string in AST cache")
+        return s
+
+    def _string_at(self, index):
+        if not 0 <= index < len(self.strings):
+            raise DeserializationError("bad string index in AST cache")
+        return self.strings[index]
+
+    def read_symbol(self):
+        index = self.read_int()
+        if not 0 <= index < len(self.symbols):
+            raise DeserializationError("bad symbol index in AST cache")
+        return self.symbols[index]
+
+    def read_symbols(self):
+        n = self.read_int()
+        return [self.read_symbol() for i in range(n)]
+
+    def read_header(self):
+        if self.read_raw_string(len(MAGIC)) != MAGIC:
+            raise DeserializationError("not an AST cache file")
+        if self.read_int() != VERSION:
+            raise DeserializationError("AST cache version mismatch")
+        flags = self.read_raw_string(self.read_int())
+        if self.modtable is not None and flags != self.modtable.ast_flags():
+            raise DeserializationError("AST cache written with other options")
+        n = self.read_int()
+        for i in range(n):
+            length = self.read_int()
+            self.strings.append(self.read_raw_string(length))
+        n = self.read_int()
+        for i in range(n):
+            name = self._string_at(self.read_int())
+            kind = self.read_byte()
+            if kind == SYM_INTERNED:
+                w_sym = values.W_Symbol.make(name)
+            elif kind == SYM_UNREADABLE:
+                w_sym = values.W_Symbol.make_unreadable(name)
+            else:
+                w_sym = values.W_Symbol(name.decode("utf-8"))
+            self.symbols.append(w_sym)
+
+    def read_asts(self):
+        n = self.read_int()
+        return [self.read_ast() for i in range(n)]
+
+    def read_module(self):
+        self.read_header()
+        name = self.read_str()
+        config = {}
+        n = self.read_int()
+        for i in range(n):
+            key = self.read_str()
+            config[key] = self.read_str()
+        body = self.read_asts()
+        if self.pos != len(self.data):
+            raise DeserializationError("trailing data in AST cache")
+        return Module(name, body, config)
+
+    def read_ast(self):
+        from pycket.expand import _to_require
+        tag = self.read_byte()
+        if tag == AST_REQUIRE:
+            return _to_require(self.read_str(), self.modtable)
+        elif tag == AST_QUOTE:
+            return Quote(self.read_literal())
+        elif tag == AST_QUOTE_SYNTAX:
+            return QuoteSyntax(self.read_literal())
+        elif tag == AST_LEXICAL_VAR:
+            return LexicalVar(self.read_symbol())
+        elif tag == AST_MODULE_VAR:
+            sym = self.read_symbol()
+            srcmod = self.read_string()
+            srcsym = self.read_symbol()
+            return ModuleVar(sym, srcmod, srcsym)
+        elif tag == AST_CELL_REF:
+            return CellRef(self.read_symbol())
+        elif tag == AST_TOPLEVEL_VAR:
+            return ToplevelVar(self.read_symbol())
+        elif tag == AST_APP:
+            rator = self.read_ast()
+            rands = self.read_asts()
+            return App.make(rator, rands)
+        elif tag == AST_IF:
+            tst = self.read_ast()
+            thn = self.read_ast()
+            els = self.read_ast()
+            return If(tst, thn, els)
+        elif tag == AST_LET or tag == AST_LETREC:
+            args = SymList(self.read_symbols())
+            counts = self._read_counts()
+            rhss = self.read_asts()
+            body = self.read_asts()
+            if tag == AST_LET:
+                return Let(args, counts, rhss, body)
+            return Letrec(args, counts, rhss, body)
+        elif tag == AST_BEGIN:
+            return Begin(self.read_asts())
+        elif tag == AST_BEGIN0:
+            fst = self.read_ast()
+            rst = self.read_ast()
+            return Begin0(fst, rst)
+        elif tag == AST_WCM:
+            key = self.read_ast()
+            val = self.read_ast()
+            body = self.read_ast()
+            return WithContinuationMark(key, val, body)
+        elif tag == AST_DEFINE_VALUES:
+            names = self.read_symbols()
+            display_names = self.read_symbols()
+            rhs = self.read_ast()
+            return DefineValues(names, rhs, display_names)
+        elif tag == AST_CASE_LAMBDA:
+            recursive_sym = None
+            if self.read_int():
+                recursive_sym = self.read_symbol()
+            n = self.read_int()
+            lams = [self._read_lambda() for i in range(n)]
+            return CaseLambda(lams, recursive_sym)
+        elif tag == AST_VARREF or tag == AST_VARREF_NONE:
+            var = None
+            if tag == AST_VARREF:
+                var = self.read_ast()
+            path = self.read_string()
+            return VariableReference(var, path)
+        elif tag == AST_SET_BANG:
+            var = self.read_ast()
+            rhs = self.read_ast()
+            return SetBang(var, rhs)
+        elif tag == AST_LAZY_BODY:
+            json = self.read_str()
+            if self.modtable is None:
+                raise DeserializationError("lazy body without a module table")
+            return self.modtable.lazy_body(json)
+        raise DeserializationError("unknown AST tag %d in AST cache" % tag)
+
+    def _read_counts(self):
+        n = self.read_int()
+        return [self.read_int() for i in range(n)]
+
+    def _read_lambda(self):
+        formals = self.read_symbols()
+        rest = None
+        if self.read_int():
+            rest = self.read_symbol()
+        srcpos = self.read_int()
+        srcfile = self.read_string()
+        srcline = self.read_int()
+        body = self.read_asts()
+        return make_lambda(formals, rest, body, srcpos, srcfile, srcline)
+
+    def read_literal(self):
+        w_val = self.read_value()
+        if self.modtable is not None:
+            w_val = self.modtable.literals.intern(w_val)
+        return w_val
+
+    def read_value(self):
+        tag = self.read_byte()
+        if tag == VAL_FALSE:
+            return values.w_false
+        elif tag == VAL_TRUE:
+            return values.w_true
+        elif tag == VAL_NULL:
+            return values.w_null
+        elif tag == VAL_VOID:
+            return values.w_void
+        elif tag == VAL_FIXNUM:
+            return values.W_Fixnum.make(self.read_int())
+        elif tag == VAL_FLONUM:
+            return values.W_Flonum.make(self.read_float())
+        elif tag == VAL_BIGNUM:
+            return values.W_Bignum(rbigint.fromdecimalstr(self.read_str()))
+        elif tag == VAL_RATIONAL:
+            num = rbigint.fromdecimalstr(self.read_str())
+            den = rbigint.fromdecimalstr(self.read_str())
+            return values.W_Rational.frombigint(num, den)
+        elif tag == VAL_COMPLEX:
+            re = self.read_value()
+            im = self.read_value()
+            assert isinstance(re, values.W_Number)
+            assert isinstance(im, values.W_Number)
+            return values.W_Complex.make(re, im)
+        elif tag == VAL_CHAR:
+            return values.W_Character.make(unichr(self.read_int()))
+        elif tag == VAL_STRING:
+            return values_string.W_String.make(self.read_str())
+        elif tag == VAL_BYTES:
+            return values.W_Bytes.from_string(self.read_str())
+        elif tag == VAL_SYMBOL:
+            return self.read_symbol()
+        elif tag == VAL_KEYWORD:
+            return values.W_Keyword.make(self.read_str())
+        elif tag == VAL_PATH:
+            return values.W_Path(self.read_str())
+        elif tag == VAL_BOX:
+            return values.W_IBox(self.read_value())
+        elif tag == VAL_VECTOR:
+            n = self.read_int()
+            elems = [self.read_value() for i in range(n)]
+            return vector.W_Vector.fromelements(elems, immutable=True)
+        elif tag == VAL_PAIR:
+            car = self.read_value()
+            cdr = self.read_value()
+            return values.W_Cons.make(car, cdr)
+        elif tag == VAL_REGEXP:
+            return values_regex.W_Regexp(self.read_str())
+        elif tag == VAL_PREGEXP:
+            return values_regex.W_PRegexp(self.read_str())
+        elif tag == VAL_BYTE_REGEXP:
+            return values_regex.W_ByteRegexp(self.read_str())
+        elif tag == VAL_BYTE_PREGEXP:
+            return values_regex.W_BytePRegexp(self.read_str())
+        elif tag == VAL_HASH:
+            n = self.read_int()
+            keys = [None] * n
+            vals = [None] * n
+            for i in range(n):
+                keys[i] = self.read_value()
+                vals[i] = self.read_value()
+            return values_hash.W_EqualHashTable(keys, vals)
+        elif tag == VAL_IMMUTABLE_HASH:
+            kind = self.read_int()
+            n = self.read_int()
+            keys = [None] * n
+            vals = [None] * n
+            for i in range(n):
+                keys[i] = self.read_value()
+                vals[i] = self.read_value()
+            return values_hash.W_ImmutableHashTable.make(kind, keys, vals)
+        raise DeserializationError("unknown value tag %d in AST cache" % tag)
+
+# ___________________________________________________________________________
+# entry points
+
+def serialize_module(module, flags):
+    writer = Writer(flags)
+    writer.write_module(module)
+    return writer.getvalue()
+
+def deserialize_module(data, modtable):
+    return Reader(data, modtable).read_module()
@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# A warm server that runs many programs in one process.
+#
+# Starting pycket is dominated by loading and instantiating the modules a
+# program requires, and by the JIT warming up on them. With --serve, pycket
+# reads requests from stdin and runs them one after the other in the same
+# process, so that later runs find the library modules loaded and possibly
+# already compiled by the JIT.
+#
+# Every request is a single line with the command line arguments of the run
+# separated by tabs, e.g.
+#
+#   fib.rkt<TAB>30
+#   -e<TAB>(display (+ 1 2))
+#
+# The output of the program goes to stdout as usual. When the run is
+# finished, the server writes a line consisting of a NUL byte followed by the
+# exit status of the run. An empty line or the end of stdin stops the server.
+#
+# The loaded modules (ModTable) are shared by all the runs. Every run gets a
+# fresh toplevel environment and ModuleEnv, and instantiates all the modules
+# it requires again, so that no state of library modules carries over. After
+# the run, the ModuleVars of the modules it instantiated, including the ones
+# that failed partway, forget their cached values. The state kept by
+# primitives (parameters, ports, ...) still carries over from one run to the
+# next, and programs reading from their current input port read from the
+# request stream.
+#
+import os
+
+from rpython.rlib.rstring import split
+
+from pycket.env import ToplevelEnv
+from pycket.error import SchemeException
+from pycket.expand import (load_json_ast_rpython, expand_to_ast,
+                           expand_code_to_ast)
+from pycket.interpreter import interpret_module
+from pycket.option_helper import parse_args, ensure_json_ast, _run, _eval
+from pycket.values_string import W_String
+
+class Server(object):
+    def __init__(self, pycketconfig, modtable):
+        self.pycketconfig = pycketconfig
+        self.modtable = modtable
+        # json file of a main module -> (modification time, Module)
+        self.programs = {}
+        self.buffer = ""
+
+    def read_request(self):
+        """ The next line on stdin without the newline, None at the end """
+        while True:
+            i = self.buffer.find("\n")
+            if i >= 0:
+                line = self.buffer[:i]
+                self.buffer = self.buffer[i + 1:]
+                return line
+            data = os.read(0, 4096)
+            if not data:
+                if not self.buffer:
+                    return None
+                line = self.buffer
+                self.buffer = ""
+                return line
+            self.buffer += data
+
+    def serve(self):
+        while True:
+            line = self.read_request()
+            if not line:
+                return 0
+            status = self.run(split(line, "\t"))
+            os.write(1, "\0%d\n" % status)
+
+    def load_program(self, config, names, module_name, json_ast):
+        modtable = self.modtable
+        if json_ast is None and config['mode'] is _eval:
+            return expand_code_to_ast(names['exprs'], modtable, config['stdlib'])
+        if json_ast is None:
+            return expand_to_ast(module_name, modtable)
+        try:
+            mtime = int(os.stat(json_ast).st_mtime)
+        except OSError:
+            mtime = -1
+        entry = self.programs.get(json_ast, None)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        module = load_json_ast_rpython(json_ast, modtable)
+        if config['mode'] is _run:
+            modtable.record_requires(module_name, json_ast)
+        self.programs[json_ast] = (mtime, module)
+        return module
+
+    def run(self, argv):
+        from pycket.prims.input_output import shutdown
+        config, names, args, retval = parse_args(["pycket"] + argv)
+        if retval != 0 or config is None:
+            return retval
+        if config['serve']:
+            print "--serve is not allowed in a request"
+            return 5
+        env = ToplevelEnv(self.pycketconfig)
+        module_env = env.module_env
+        status = 0
+        try:
+            module_name, json_ast = ensure_json_ast(config, names,
+                                                    self.modtable.manifest)
+            ast = self.load_program(config, names, module_name, json_ast)
+            self.modtable.save_manifest()
+            env.globalconfig.load(ast)
+            env.commandline_arguments = [W_String.fromstr_utf8(arg) for arg in args]
+            module_env.add_module(module_name, ast)
+            try:
+                interpret_module(ast, env)
+            finally:
+                # the next run instantiates all of them again
+                for module in module_env.modules.values():
+                    module.reset_vars()
+        except SchemeException, e:
+            print "ERROR:"
+            print e.format_error()
+            status = 1
+        except ValueError:
+            # a file that cannot be read, or json that cannot be parsed
+            print "ERROR:"
+            print "cannot load the program of the request"
+            status = 1
+        except OSError:
+            print "ERROR:"
+            print "cannot read the program of the request"
+            status = 1
+        shutdown(env)
+        return status
@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Simplification of modules before they are converted.
+#
+# Expanded code contains lots of forms that can be decided when the module
+# is loaded: calls of pure primitives on constants, ifs on constants (often
+# the result of such calls), bindings of no values by (let-values ([()
+# (values)]) ...) and nested begins. The pass rewrites the module bottom up:
+#
+#   - calls of primitives exposed with pure=True whose arguments are all
+#     quoted are replaced by their result, unless the call raises,
+#   - ifs on a quoted value are replaced by the branch that is taken,
+#   - let bindings of no values to (values), and bindings of unused
+#     variables to constants or lambdas are removed, a let without bindings
+#     becomes a begin,
+#   - nested begins are spliced into the enclosing body, and constants and
+#     lambdas in non-tail positions of a body are dropped.
+#
+# Like inlining (see inline.py) the pass runs before assign_convert_module,
+# which computes the environment structures of the simplified code.
+#
+from pycket import values
+from pycket.env import SymList
+from pycket.error import SchemeException
+from pycket.inline import ASTVisitor, _map_children, _same
+from pycket.interpreter import (AlreadyRequired, App, Begin, CaseLambda, If,
+                                Lambda, Let, Letrec, Module, ModuleVar, Quote,
+                                QuoteSyntax, make_lambda)
+
+w_values_sym = values.W_Symbol.make("values")
+
+def count_nodes(module):
+    count = 0
+    todo = module.body[:]
+    while todo:
+        ast = todo.pop()
+        count += 1
+        todo.extend(ast.direct_children())
+    return count
+
+def _is_constant(ast):
+    if isinstance(ast, Quote):
+        # evaluating it instantiates a module, see serve.py
+        return not isinstance(ast, AlreadyRequired)
+    return isinstance(ast, QuoteSyntax)
+
+def _effect_free(ast):
+    return _is_constant(ast) or isinstance(ast, CaseLambda)
+
+def _is_no_values(ast):
+    """ Is `ast` the call (values)? """
+    if not isinstance(ast, App) or ast.rands:
+        return False
+    rator = ast.rator
+    return (isinstance(rator, ModuleVar) and rator.is_primitive() and
+            rator.srcsym is w_values_sym)
+
+def _flatten(body):
+    """ The forms of `body` with nested begins spliced in, and the effect free
+    forms dropped apart from the last one """
+    forms = []
+    for form in body:
+        if isinstance(form, Begin):
+            # already flattened, the pass works bottom up
+            forms.extend(form.body)
+        else:
+            forms.append(form)
+    result = []
+    last = len(forms) - 1
+    for i in range(len(forms)):
+        if i == last or not _effect_free(forms[i]):
+            result.append(forms[i])
+    return result
+
+
+class Simplifier(ASTVisitor):
+    def __init__(self):
+        self.folded = 0
+
+    def simplify_module(self, module):
+        body = [self.visit(form) for form in module.body]
+        return Module(module.name, body, module.config)
+
+    def visit(self, ast):
+        ast = _map_children(ast, self)
+        if isinstance(ast, App):
+            return self.fold(ast)
+        elif isinstance(ast, If):
+            tst = ast.tst
+            if isinstance(tst, Quote) and _is_constant(tst):
+                if tst.w_val is values.w_false:
+                    return ast.els
+                return ast.thn
+        elif isinstance(ast, Begin):
+            body = _flatten(ast.body)
+            if len(body) != len(ast.body) or not _same(body, ast.body):
+                return Begin.make(body)
+        elif isinstance(ast, Let):
+            return self.simplify_let(ast)
+        elif isinstance(ast, Letrec):
+            body = _flatten(ast.body)
+            if len(body) != len(ast.body) or not _same(body, ast.body):
+                return Letrec(ast.args, ast.counts, ast.rhss, body)
+        elif isinstance(ast, Lambda):
+            body = _flatten(ast.body)
+            if len(body) != len(ast.body) or not _same(body, ast.body):
+                return make_lambda(ast.formals, ast.rest, body, ast.srcpos,
+                                   ast.srcfile, ast.srcline)
+        return ast
+
+    def fold(self, app):
+        rator = app.rator
+        if not isinstance(rator, ModuleVar) or not rator.is_primitive():
+            return app
+        args_w = [None] * len(app.rands)
+        for i in range(len(app.rands)):
+            rand = app.rands[i]
+            if not isinstance(rand, Quote) or not _is_constant(rand):
+                return app
+            args_w[i] = rand.w_val
+        try:
+            w_prim = rator._lookup_primitive()
+        except SchemeException:
+            return app
+        if not isinstance(w_prim, values.W_Prim) or w_prim.pure_code is None:
+            return app
+        try:
+            w_res = w_prim.pure_code(args_w)
+        except SchemeException:
+            # leave the error to run time
+            return app
+        if w_res is None:
+            w_res = values.w_void
+        if not isinstance(w_res, values.W_Object):
+            return app
+        self.folded += 1
+        return Quote(w_res)
+
+    def simplify_let(self, let):
+        body = _flatten(let.body)
+        used = None
+        args = []
+        counts = []
+        rhss = []
+        j = 0
+        for i in range(len(let.rhss)):
+            count = let.counts[i]
+            rhs = let.rhss[i]
+            keep = True
+            if count == 0:
+                keep = not _is_no_values(rhs)
+            elif count == 1 and _effect_free(rhs):
+                if used is None:
+                    used = {}
+                    for b in body:
+                        used.update(b.free_vars())
+                keep = let.args.elems[j] in used
+            if keep:
+                for k in range(j, j + count):
+                    args.append(let.args.elems[k])
+                counts.append(count)
+                rhss.append(rhs)
+            j += count
+        if not rhss:
+            return Begin.make(body)
+        if (len(rhss) == len(let.rhss) and len(body) == len(let.body) and
+                _same(body, let.body)):
+            return let
+        return Let(SymList(args), counts, rhss, body)
+
+
+def simplify_module(module, report=False):
+    """ `module` with the forms decided at load time simplified, before
+    assign_convert_module """
+    simplifier = Simplifier()
+    result = simplifier.simplify_module(module)
+    if report:
+        print "nodes in %s: %d before simplification, %d after, %d calls folded" % (
+            module.name, count_nodes(module), count_nodes(result),
+            simplifier.folded)
+    return result
@@ -0,0 +1,49 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Stress the incremental recursion tracking of CallGraph (see callgraph.py)
+# with a call graph of many lambdas, untranslated.
+#
+#   python test/bench_callgraph.py [number of lambdas]
+#
+# Most calls go to lambdas defined later, like the helpers of a big program,
+# some calls go back and close cycles. The calls are discovered roughly in
+# the order of their callers, shuffled a bit. Reports the time per call.
+#
+import random
+import sys
+import time
+
+from pycket.callgraph import CallGraph
+
+class FakeLambda(object):
+    pass
+
+def main(argv):
+    n = 50000
+    if len(argv) > 1:
+        n = int(argv[1])
+    rnd = random.Random(42)
+    lams = [FakeLambda() for i in range(n)]
+    calls = []
+    for i in range(n - 1):
+        for j in range(3):
+            calls.append((i + rnd.randrange(200), i,
+                          rnd.randrange(i + 1, min(n, i + 100))))
+    for i in range(n // 10):
+        callee = rnd.randrange(n)
+        caller = rnd.randrange(callee, min(n, callee + 1000))
+        calls.append((caller + rnd.randrange(200), caller, callee))
+    calls.sort()
+    calls = [(lams[caller], lams[callee]) for _, caller, callee in calls]
+    graph = CallGraph()
+    start = time.time()
+    for caller, callee in calls:
+        graph.add_call(caller, callee)
+    duration = time.time() - start
+    print "%d lambdas, %d calls, %d recursive lambdas" % (
+        n, len(calls), len(graph.recursive))
+    print "%.3fs, %.1fus per call" % (duration, duration * 1e6 / len(calls))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,51 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare running benchmarks with and without the inlining pass (--inline).
+#
+# Run from the pycket directory with a translated pycket:
+#
+#   python test/bench_inline.py [--pycket ../pycket-c] [file.rkt ...]
+#
+# Every benchmark is run a few times in both modes, the best wall clock time
+# of each mode is reported.
+#
+import os
+import subprocess
+import sys
+import time
+
+DEFAULT_FILES = ["ack.rkt", "ctak.rkt", "earley.rkt", "fannkuch-redux.rkt",
+                 "nbody.rkt", "nqueens.rkt", "nucleic2.rkt", "puzzle.rkt",
+                 "spectral-norm.rkt", "triangle.rkt"]
+RUNS = 3
+
+def best_time(cmd):
+    best = float("inf")
+    with open(os.devnull, "w") as null:
+        for i in range(RUNS):
+            start = time.time()
+            subprocess.check_call(cmd, stdout=null)
+            best = min(best, time.time() - start)
+    return best
+
+def main(argv):
+    pycket = os.path.join(os.path.dirname(__file__), "..", "..", "pycket-c")
+    if len(argv) > 2 and argv[1] == "--pycket":
+        pycket = argv[2]
+        argv = argv[2:]
+    files = argv[1:]
+    if not files:
+        here = os.path.dirname(os.path.abspath(__file__))
+        files = [os.path.join(here, f) for f in DEFAULT_FILES]
+    print "%-24s %9s %9s" % ("benchmark", "plain", "--inline")
+    for f in files:
+        # expand first, so that neither mode pays for it
+        subprocess.check_call([pycket, f], stdout=open(os.devnull, "w"))
+        plain = best_time([pycket, f])
+        inlined = best_time([pycket, "--inline", f])
+        print "%-24s %8.3fs %8.3fs  (%.2fx)" % (
+            os.path.basename(f), plain, inlined, plain / inlined)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,95 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare the ways of loading an expanded module:
+#
+#   tree:   pycket_json.loads followed by _to_module
+#   stream: _to_module_streaming, converting body forms while parsing
+#   binary: the binary AST cache (serialize.py)
+#
+# Run from the pycket directory:
+#
+#   python test/bench_startup.py [file.rkt ...]
+#
+# The modules are expanded first if needed. Every mode is measured in a fresh
+# process, which reports the best of several runs and how much its peak
+# memory (maxrss) grew while loading. Requires are not loaded, the module
+# table starts out with all of them.
+#
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from pycket import pycket_json
+from pycket.expand import (ensure_json_ast_run, readfile_rpython, _to_module,
+                           _to_module_streaming, ModTable)
+from pycket.serialize import serialize_module, deserialize_module
+from pycket.parallel_expand import json_file_requires
+
+DEFAULT_FILES = ["nucleic2.rkt", "earley.rkt"]
+MODES = ["tree", "stream", "binary"]
+
+def best_of(n, f):
+    best = float("inf")
+    for i in range(n):
+        start = time.time()
+        f()
+        best = min(best, time.time() - start)
+    return best
+
+def measure(mode, json_file, runs=5):
+    # the requires are only marked as loaded, so that they are neither
+    # loaded nor counted
+    loaded = dict.fromkeys(json_file_requires(json_file))
+    modtable = ModTable()
+    if mode == "binary":
+        data = readfile_rpython(json_file + ".ast")
+    else:
+        data = readfile_rpython(json_file)
+
+    def run():
+        modtable.table = loaded.copy()
+        if mode == "tree":
+            m = _to_module(pycket_json.loads(data), modtable)
+        elif mode == "stream":
+            m = _to_module_streaming(data, modtable)
+        else:
+            m = deserialize_module(data, modtable)
+        m.assign_convert_module()
+
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t = best_of(runs, run)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base
+    print "%s %d %f %d" % (mode, len(data), t, peak)
+
+def bench(rkt_file):
+    json_file = ensure_json_ast_run(rkt_file)
+    modtable = ModTable()
+    modtable.table = dict.fromkeys(json_file_requires(json_file))
+    module = _to_module(pycket_json.loads(readfile_rpython(json_file)), modtable)
+    with open(json_file + ".ast", "wb") as f:
+        f.write(serialize_module(module, modtable.ast_flags()))
+    print "%s" % os.path.basename(rkt_file)
+    results = {}
+    for mode in MODES:
+        out = subprocess.check_output([sys.executable, __file__, "--measure", mode, json_file])
+        _, size, t, peak = out.split()[-4:]
+        results[mode] = float(t)
+        print "  %-6s %9s bytes  %.3fs  peak +%6d KiB  (%.1fx)" % (
+            mode, size, float(t), int(peak), results["tree"] / float(t))
+
+def main(argv):
+    if len(argv) == 4 and argv[1] == "--measure":
+        measure(argv[2], argv[3])
+        return
+    files = argv[1:]
+    if not files:
+        here = os.path.dirname(os.path.abspath(__file__))
+        files = [os.path.join(here, f) for f in DEFAULT_FILES]
+    for f in files:
+        bench(os.path.abspath(f))
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -198,3 +198,87 @@ def test_simple_prim_calls_are_simple_expressions():
     p = expr_ast("(car (cons 1 2))")
     assert isinstance(p, SimplePrimApp1)
 
+
+def test_inline_cache():
+    from pycket.interpreter import ic_stats
+    from pycket.test.testhelper import run_mod_defs
+    ic_stats.enabled = True
+    try:
+        m = run_mod_defs("""
+        (define f (case-lambda [(x) 1] [(x y) 2]))
+        (define g (case-lambda [(x y) 3] [x 4]))
+        (define (call h) (h 1 2))
+        (define r (list (call f) (call f) (call g) (call g) (call f)))
+        """)
+    finally:
+        ic_stats.enabled = False
+        ic_stats.sites = []
+    assert m.defs[W_Symbol.make("r")].tostring() == "(2 2 3 3 2)"
+    app = m.defs[W_Symbol.make("call")].closure.caselam.lams[0].body[0]
+    assert isinstance(app, App)
+    assert app.ic_misses == 2
+    assert app.ic_hits == 3
+    assert app.ic_index1 == 0
+    assert app.ic_index2 == 1
+
+def test_inline_cache_counts_only_with_stats():
+    from pycket.test.testhelper import run_mod_defs
+    m = run_mod_defs("""
+    (define f (case-lambda [(x) 1] [(x y) 2]))
+    (define (g x y) 3)
+    (define (call h) (h 1 2))
+    (define r (list (call f) (call f) (call g)))
+    """)
+    assert m.defs[W_Symbol.make("r")].tostring() == "(2 2 3)"
+    app = m.defs[W_Symbol.make("call")].closure.caselam.lams[0].body[0]
+    assert app.ic_hits == 0
+    assert app.ic_misses == 0
+    # g has a single case, it does not enter the cache
+    assert app.ic_caselam1 is m.defs[W_Symbol.make("f")].closure.caselam
+    assert app.ic_caselam2 is None
+
+def test_superinstructions():
+    from pycket import config
+    from pycket.interpreter import (IfSimplePrimApp2, LetSimple1, PrimApp,
+                                    ast_shape)
+    from pycket.test.testhelper import run_mod_defs
+    config.superinstructions = True
+    try:
+        m = run_mod_defs("""
+        (define (f x n) (if (< x n) (let ([y (+ x 1)]) (list y y y)) 0))
+        (define r (f 1 2))
+        """)
+    finally:
+        config.superinstructions = False
+    assert m.defs[W_Symbol.make("r")].tostring() == "(2 2 2)"
+    ast = m.defs[W_Symbol.make("f")].closure.caselam.lams[0].body[0]
+    assert isinstance(ast, IfSimplePrimApp2)
+    assert ast_shape(ast) == "IfSimplePrimApp2(SimplePrimApp2(LexicalVar LexicalVar))"
+    let = ast.thn
+    assert isinstance(let, LetSimple1)
+    assert ast_shape(let) == "LetSimple1(SimplePrimApp2(LexicalVar Quote))"
+    assert isinstance(let.body[0], PrimApp)
+    assert ast_shape(let.body[0]) == "PrimApp(ModuleVar LexicalVar LexicalVar LexicalVar)"
+
+def test_direct_evaluation():
+    from pycket import config
+    from pycket.interpreter import LetDirect, direct_depth, MAX_DIRECT_DEPTH
+    from pycket.test.testhelper import run_mod_defs
+    config.direct_let = True
+    try:
+        m = run_mod_defs("""
+        (define (f x y)
+          (let ([a (if (< x y) (let ([d (- y x)]) (* d d)) 0)]
+                [b (begin (+ x 1) (if (= x 0) 1 2))])
+            (g a b)))
+        (define (g a b) (list a b))
+        (define r (f 1 4))
+        """)
+    finally:
+        config.direct_let = False
+    assert m.defs[W_Symbol.make("r")].tostring() == "(9 2)"
+    let = m.defs[W_Symbol.make("f")].closure.caselam.lams[0].body[0]
+    assert isinstance(let, LetDirect)
+    assert direct_depth(let.rhss[0], MAX_DIRECT_DEPTH) == 2
+    assert direct_depth(let.body[0], MAX_DIRECT_DEPTH) == -1
+    assert direct_depth(let, 1) == -1
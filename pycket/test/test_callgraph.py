@@ -0,0 +1,123 @@
+import random
+from pycket.callgraph import CallGraph
+
+class FakeLambda(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+def lambdas(n):
+    return [FakeLambda("l%s" % i) for i in range(n)]
+
+def test_self_call():
+    a, b = lambdas(2)
+    g = CallGraph()
+    g.add_call(a, b)
+    assert not g.is_recursive(a)
+    g.add_call(b, b)
+    assert g.is_recursive(b)
+    assert not g.is_recursive(a)
+
+def test_cycle():
+    a, b, c, d = lambdas(4)
+    g = CallGraph()
+    g.add_call(a, b)
+    g.add_call(b, c)
+    g.add_call(c, d)
+    assert g.recursive == {}
+    g.add_call(c, a)
+    assert g.recursive == {a: None, b: None, c: None}
+    assert g.components[a] is g.components[b] is g.components[c]
+    g.add_call(d, b)
+    assert g.is_recursive(d)
+
+def test_order_is_topological():
+    a, b, c, d = lambdas(4)
+    g = CallGraph()
+    # added in reverse, every call goes against the initial order
+    g.add_call(d, c)
+    g.add_call(c, b)
+    g.add_call(b, a)
+    assert g.recursive == {}
+    order = [g.components[lam].order for lam in [d, c, b, a]]
+    assert order == sorted(order)
+
+def reachable(calls, lam):
+    seen = {}
+    todo = [lam]
+    while todo:
+        for callee in calls.get(todo.pop(), []):
+            if callee not in seen:
+                seen[callee] = None
+                todo.append(callee)
+    return seen
+
+def test_random_graphs():
+    rnd = random.Random(1)
+    for trial in range(100):
+        lams = lambdas(rnd.randrange(2, 20))
+        g = CallGraph()
+        calls = {}
+        for i in range(rnd.randrange(1, 50)):
+            caller = rnd.choice(lams)
+            callee = rnd.choice(lams)
+            calls.setdefault(caller, []).append(callee)
+            g.add_call(caller, callee)
+            for lam in lams:
+                assert g.is_recursive(lam) == (lam in reachable(calls, lam))
+            for caller in calls:
+                for callee in calls[caller]:
+                    c1 = g.components[caller]
+                    c2 = g.components[callee]
+                    assert c1 is c2 or c1.order < c2.order
+
+class FakeConfig(object):
+    log_callgraph = False
+
+class FakeEnv(object):
+    def pycketconfig(self):
+        return FakeConfig()
+
+class FakeAst(object):
+    def __init__(self, surrounding_lambda):
+        self.surrounding_lambda = surrounding_lambda
+        self.should_enter = False
+
+    def set_should_enter(self):
+        self.should_enter = True
+        return True
+
+class FakeApp(object):
+    def __init__(self, surrounding_lambda):
+        self.surrounding_lambda = surrounding_lambda
+
+class FakeCont(object):
+    def __init__(self, ast):
+        self.ast = ast
+
+    def get_next_executed_ast(self):
+        return self.ast
+
+class JittableLambda(FakeLambda):
+    jitting = False
+
+    def enable_jitting(self):
+        self.jitting = True
+
+def test_downrecursion_after_calls_from_recursive_lambdas():
+    rec = JittableLambda("rec")
+    leaf = JittableLambda("leaf")
+    g = CallGraph()
+    env = FakeEnv()
+    after_rec = FakeAst(rec)
+    after_leaf = FakeAst(rec)
+    g.register_call(rec, FakeApp(rec), FakeCont(after_rec), env)
+    g.register_call(leaf, FakeApp(rec), FakeCont(after_leaf), env)
+    assert rec.jitting
+    assert after_rec.should_enter
+    # as before the incremental call graph, every call of a recursive
+    # lambda marks its continuation, also the calls of leaf lambdas
+    assert after_leaf.should_enter
+    assert not g.is_recursive(leaf)
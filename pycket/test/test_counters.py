@@ -0,0 +1,34 @@
+from pycket import config
+from pycket.counters import collect_counts, report_counts
+from pycket.env import ToplevelEnv
+from pycket.expand import expand_string, parse_module
+from pycket.interpreter import interpret_module
+from pycket.values import W_Symbol
+
+CODE = """
+#lang pycket
+(define (loop n acc) (if (zero? n) acc (loop (- n 1) (+ acc n))))
+(define (f x) (loop x 0))
+(define x (+ (f 10) (f 20)))
+"""
+
+def test_counts(monkeypatch, capsys):
+    monkeypatch.setattr(config, "count_calls", True)
+    env = ToplevelEnv()
+    m = interpret_module(parse_module(expand_string(CODE)), env)
+    env.module_env.add_module("main.rkt", m)
+    f = m.defs[W_Symbol.make("f")].closure.caselam.lams[0]
+    loop = m.defs[W_Symbol.make("loop")].closure.caselam.lams[0]
+    assert f.call_count == 2
+    assert loop.call_count == 11 + 21
+    lambdas, apps = collect_counts(env.module_env)
+    assert sorted([n for n, _ in lambdas])[-1] >= loop.call_count
+    report_counts(env.module_env)
+    out, err = capsys.readouterr()
+    assert "hot lambdas:" in out
+    assert "32 calls" in out
+
+def test_no_counts_by_default():
+    env = ToplevelEnv()
+    m = interpret_module(parse_module(expand_string(CODE)), env)
+    assert m.defs[W_Symbol.make("f")].closure.caselam.lams[0].call_count == 0
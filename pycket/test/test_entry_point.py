@@ -93,6 +93,46 @@ class TestOptions(object):
         assert config['mode'] == option_helper._eval
         assert names['exprs'] == code
 
+    def test_cache_dir(self, empty_json):
+        argv = ['arg0', "--cache-dir", "/tmp/cache", empty_json]
+        config, names, args, retval = parse_args(argv)
+        assert retval == 0
+        assert names['cache-dir'] == "/tmp/cache"
+        assert names['file'] == empty_json
+        config, names, args, retval = parse_args(['arg0', "--cache-dir"])
+        assert retval == 5
+
+    def test_eval_in_memory(self):
+        config, names, args, retval = parse_args(['arg0', '-e', '(+ 1 2)'])
+        assert option_helper.ensure_json_ast(config, names) == (
+            option_helper.EVAL_MODULE_NAME, None)
+
+    def test_profile_interval(self, empty_json):
+        config, names, args, retval = parse_args(
+            ['arg0', "--profile-interval", "100", empty_json])
+        assert retval == 0
+        assert names['profile-interval'] == "100"
+        for bad in ["abc", "-1", "12345678901"]:
+            config, names, args, retval = parse_args(
+                ['arg0', "--profile-interval", bad, empty_json])
+            assert retval == 5
+
+    def test_expand_jobs(self, empty_json):
+        config, names, args, retval = parse_args(
+            ['arg0', "--expand-jobs", "4", empty_json])
+        assert retval == 0
+        assert names['expand-jobs'] == "4"
+        for bad in ["abc", "-1", "12345678901"]:
+            config, names, args, retval = parse_args(
+                ['arg0', "--expand-jobs", bad, empty_json])
+            assert retval == 5
+
+    def test_serve(self):
+        config, names, args, retval = parse_args(['arg0', "--serve"])
+        assert retval == 0
+        assert config['serve']
+        assert 'file' not in names
+
     def test_f(self, empty_json):
         pytest.skip("re-enable when -f works again")
         argv = ['arg0', "-f", empty_json]
@@ -176,3 +216,27 @@ class TestCommandline(object):
         assert entry_point(['arg0', '-f', racket_file]) == 0
         out, err = capfd.readouterr()
         assert out == "42"
+
+def test_serve_bad_request(tmpdir):
+    from pycket.expand import ModTable
+    from pycket.serve import Server
+    server = Server(None, ModTable())
+    assert server.run([str(tmpdir.join("missing.rkt"))]) != 0
+    bad_json = tmpdir.join("bad.json")
+    bad_json.write('{"language": "#%kernel", "body-forms": []} extra')
+    assert server.run([str(bad_json)]) != 0
+
+def test_serve_fresh_library_state(tmpdir, capfd):
+    from pycket.expand import ModTable
+    from pycket.serve import Server
+    lib = tmpdir.join("lib.rkt")
+    lib.write("#lang pycket\n(provide counter)\n(define counter (box 0))\n")
+    main = tmpdir.join("main.rkt")
+    main.write('#lang pycket\n(require "lib.rkt")\n'
+               '(set-box! counter (add1 (unbox counter)))\n'
+               '(display (unbox counter))\n')
+    server = Server(None, ModTable())
+    assert server.run([str(main)]) == 0
+    assert server.run([str(main)]) == 0
+    out, err = capfd.readouterr()
+    assert out.endswith("11")
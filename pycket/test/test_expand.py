@@ -0,0 +1,183 @@
+import os
+import socket
+import threading
+import pytest
+from pycket import expand
+from pycket.expand import expand_with_server, ExpandException
+
+class StubServer(object):
+    """ Speaks the expander server protocol, answering every request with a
+    canned response, and records the requests. """
+    def __init__(self, path, status="ok", body='{"answer": 42}'):
+        self.path = path
+        self.status = status
+        self.body = body
+        self.requests = []
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(1)
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            f = conn.makefile()
+            command, length = f.readline().split()
+            self.requests.append((command, f.read(int(length))))
+            f.write("%s %d\n%s" % (self.status, len(self.body), self.body))
+            f.close()
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+@pytest.fixture
+def socket_name(tmpdir, monkeypatch):
+    name = str(tmpdir.join("expander.sock"))
+    monkeypatch.setenv(expand.EXPANDER_SOCKET_VAR, name)
+    return name
+
+def test_no_server(socket_name):
+    assert expand_with_server("file", "/foo.rkt") is None
+
+def test_no_default_server(monkeypatch):
+    monkeypatch.delenv(expand.EXPANDER_SOCKET_VAR, raising=False)
+    assert expand.expander_socket_name() == ""
+    assert expand_with_server("file", "/foo.rkt") is None
+
+def test_stale_socket(socket_name):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.bind(socket_name)
+    s.close()
+    assert expand_with_server("file", "/foo.rkt") is None
+
+def test_file_request(socket_name):
+    server = StubServer(socket_name)
+    try:
+        assert expand_with_server("file", "/foo.rkt") == '{"answer": 42}'
+        assert expand_with_server("code", "#lang s-exp pycket\n1") == '{"answer": 42}'
+    finally:
+        server.close()
+    assert server.requests == [("file", "/foo.rkt"),
+                               ("code", "#lang s-exp pycket\n1")]
+
+def test_error_response(socket_name):
+    server = StubServer(socket_name, status="error", body="bad syntax")
+    try:
+        with pytest.raises(ExpandException) as e:
+            expand_with_server("file", "/foo.rkt")
+        assert "bad syntax" in e.value.msg
+    finally:
+        server.close()
+
+def test_expand_file_uses_server(socket_name, tmpdir):
+    server = StubServer(socket_name)
+    rkt = tmpdir.join("m.rkt")
+    rkt.write("#lang pycket\n1\n")
+    try:
+        assert expand.expand_file_rpython(str(rkt)) == '{"answer": 42}'
+        json_file = str(rkt) + ".json"
+        assert expand.expand_file_to_json(str(rkt), json_file) == json_file
+        assert open(json_file).read() == '{"answer": 42}'
+    finally:
+        server.close()
+    assert server.requests == [("file", str(rkt))] * 2
+
+def test_streaming_module_key_order():
+    from pycket.pycket_json import loads
+    from pycket.expand import _to_module, _to_module_streaming, ModTable
+    body = '[{"quote": {"number": {"integer": "1"}}}, {"quote": {"string": "two"}}]'
+    orders = [
+        '{"module-name": "m", "language": "", "config": {"a": "b"}, "body-forms": %s}',
+        '{"body-forms": %s, "config": {"a": "b"}, "language": "", "module-name": "m"}',
+        '{"config": {"a": "b"}, "body-forms": %s, "module-name": "m", "language": "",  "extra": [1, {"x": "]"}]}',
+    ]
+    expected = _to_module(loads(orders[0] % body), ModTable()).tostring()
+    for order in orders:
+        m = _to_module_streaming(order % body, ModTable())
+        assert m.tostring() == expected
+        assert m.config == {"a": "b"}
+
+def _lazy_module(rhs):
+    return ('{"module-name": "m", "language": "", "body-forms": ['
+            '{"define-values-body": %s, "define-values": ["f"], '
+            '"define-values-names": ["f"]}, '
+            '{"quote": {"number": {"integer": "1"}}}]}' % rhs)
+
+def test_lazy_lambda():
+    from pycket.expand import _to_module_streaming, ModTable
+    from pycket.interpreter import CaseLambda, DefineValues, LazyBody
+    rhs = ('{"body": [{"operator": {"source-name": "car"}, '
+           '"operands": [{"lexical": "x"}]}], "lambda": [{"lexical": "x"}]}')
+    eager = _to_module_streaming(_lazy_module(rhs), ModTable()).assign_convert_module()
+    modtable = ModTable()
+    modtable.lazy = True
+    m = _to_module_streaming(_lazy_module(rhs), modtable).assign_convert_module()
+    assert len(m.body) == 2
+    define = m.body[0]
+    assert isinstance(define, DefineValues)
+    assert isinstance(define.rhs, CaseLambda)
+    lam = define.rhs.lams[0]
+    body = lam.body[0]
+    assert isinstance(body, LazyBody)
+    assert modtable.lazy_lambdas == 1
+    assert modtable.lazy_converted == 0
+    converted = body.convert()
+    assert modtable.lazy_converted == 1
+    assert converted.tostring() == eager.body[0].rhs.lams[0].body[0].tostring()
+    assert converted.surrounding_lambda is lam
+
+def test_lazy_case_lambda():
+    from pycket.expand import _to_module_streaming, ModTable
+    from pycket.interpreter import LazyBody
+    rhs = ('{"case-lambda": ['
+           '{"lambda": [], "body": [{"quote": {"number": {"integer": "0"}}}]}, '
+           '{"lambda": [{"lexical": "x"}], "body": [{"lexical": "x"}]}]}')
+    modtable = ModTable()
+    modtable.lazy = True
+    m = _to_module_streaming(_lazy_module(rhs), modtable)
+    lams = m.body[0].rhs.lams
+    assert [len(lam.formals) for lam in lams] == [0, 1]
+    assert all(isinstance(lam.body[0], LazyBody) for lam in lams)
+    assert modtable.lazy_lambdas == 2
+
+def test_lazy_set_bang_is_eager():
+    from pycket.expand import _to_module_streaming, ModTable
+    from pycket.interpreter import LazyBody
+    rhs = ('{"lambda": [], "body": [[{"source-name": "set!"}, '
+           '{"source-name": "g", "module": "g", "source-module": null}, '
+           '{"quote": {"number": {"integer": "0"}}}]]}')
+    modtable = ModTable()
+    modtable.lazy = True
+    m = _to_module_streaming(_lazy_module(rhs), modtable)
+    assert not isinstance(m.body[0].rhs.lams[0].body[0], LazyBody)
+    assert modtable.lazy_lambdas == 0
+
+def test_run_with_input():
+    # longer than what a single command line argument can hold
+    data = "(display \"x\") '$HOME `x` \\n\n" * 20000
+    status, out = expand._run_with_input("cat", data)
+    assert status == 0
+    assert out == data
+    status, out = expand._run_with_input("cat > /dev/null; echo no >&2; exit 3", "x")
+    assert os.WEXITSTATUS(status) == 3
+    assert out == "no\n"
+
+def test_expand_code_cached(tmpdir, monkeypatch):
+    calls = []
+    def fake_expand(source):
+        calls.append(source)
+        return "{}"
+    monkeypatch.setattr(expand, "expand_code_rpython", fake_expand)
+    modtable = expand.ModTable()
+    modtable.use_cache_dir(str(tmpdir.join("cache")))
+    assert expand.expand_code_cached("(+ 1 2)", modtable) == "{}"
+    assert expand.expand_code_cached("(+ 1 2)", modtable) == "{}"
+    assert len(calls) == 1
+    json_file = modtable.manifest.code_path("(+ 1 2)") + ".json"
+    assert open(json_file).read() == "{}"
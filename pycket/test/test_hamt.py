@@ -0,0 +1,61 @@
+import random
+
+from pycket.hamt import make_persistent_map
+
+class Key(object):
+    def __init__(self, value, hash):
+        self.value = value
+        self.hash = hash
+
+def make_map(hash_mod):
+    return make_persistent_map("TestMap", lambda k: k.hash % hash_mod,
+                               lambda a, b: a.value == b.value)
+
+def check_random_updates(hash_mod):
+    Map = make_map(hash_mod)
+    rnd = random.Random(hash_mod)
+    m = Map.EMPTY
+    expected = {}
+    snapshots = []
+    for step in range(2000):
+        i = rnd.randrange(300)
+        key = Key(i, i * 2654435761)
+        if rnd.random() < 0.6:
+            m = m.assoc(key, step)
+            expected[i] = step
+        else:
+            m = m.dissoc(key)
+            expected.pop(i, None)
+        assert m.size == len(expected)
+        if step % 400 == 0:
+            snapshots.append((m, dict(expected)))
+    snapshots.append((m, expected))
+    # the old versions are unchanged
+    for m, expected in snapshots:
+        for i in range(300):
+            assert m.get(Key(i, i * 2654435761), None) == expected.get(i)
+        items = sorted([(k.value, v) for k, v in m.items()])
+        assert items == sorted(expected.items())
+
+def test_random_updates():
+    check_random_updates(1 << 40)
+
+def test_collisions():
+    check_random_updates(7)
+
+def test_unchanged():
+    Map = make_map(1 << 40)
+    key = Key(1, 1)
+    m = Map.EMPTY.assoc(key, "a")
+    assert m.assoc(key, "a") is m
+    assert m.dissoc(Key(2, 2)) is m
+    assert m.dissoc(Key(1, 1)).size == 0
+
+def test_candidates():
+    Map = make_map(7)
+    m = Map.EMPTY
+    for i in range(100):
+        m = m.assoc(Key(i, i), i)
+    found = sorted([v for k, v in m.candidates(Key(-1, 3))])
+    assert found == [i for i in range(100) if i % 7 == 3]
+    assert Map.EMPTY.candidates(Key(1, 1)) == []
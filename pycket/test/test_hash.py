@@ -1,5 +1,5 @@
 from pycket.test.testhelper import run_mod_expr, run_mod
-from pycket.values_hash import get_dict_item, StringHashmapStrategy
+from pycket.values_hash import get_dict_item, get_dict_next_index, StringHashmapStrategy
 from pycket.values_hash import ByteHashmapStrategy
 from pycket import values
 
@@ -199,6 +199,87 @@ def test_get_item():
     tg("1", 2, "3", 4)
     interpret(tg, [1, 2, 334, 4])
 
+def test_get_dict_next_index():
+    from rpython.rtyper.test.test_llinterp import interpret
+    def tg(n, removed):
+        dct = {}
+        for i in range(n):
+            dct[i] = i * 2
+        del dct[removed]
+        total = 0
+        count = 0
+        i = get_dict_next_index(dct, 0)
+        while i >= 0:
+            k, v = get_dict_item(dct, i)
+            assert v == k * 2
+            total += k
+            count += 1
+            i = get_dict_next_index(dct, i + 1)
+        assert count == n - 1
+        return total
+    assert tg(10, 3) == 45 - 3
+    assert interpret(tg, [10, 3]) == 45 - 3
+
+def test_get_dict_next_index_remove_add():
+    dct = {1: 1, 2: 2}
+    def keys():
+        result = []
+        i = get_dict_next_index(dct, 0)
+        while i >= 0:
+            result.append(get_dict_item(dct, i)[0])
+            i = get_dict_next_index(dct, i + 1)
+        return sorted(result)
+    assert keys() == [1, 2]
+    del dct[1]
+    dct[3] = 3
+    assert keys() == [2, 3]
+
+def test_hash_remove(doctest):
+    """
+    ! (define (count-after-remove ht k) (hash-remove! ht k) (hash-count ht))
+    > (count-after-remove (make-hash '((1 . a) (2 . b))) 1)
+    1
+    > (count-after-remove (make-hash '((a . 1) (b . 2))) 'a)
+    1
+    > (count-after-remove (make-hash (list (cons "a" 1) (cons "b" 2))) (string #\a))
+    1
+    > (count-after-remove (make-hash '(((1 2) . a) ((3) . b))) (list 1 2))
+    1
+    > (count-after-remove (make-hash '((1 . a) (x . b))) 'y)
+    2
+    > (count-after-remove (make-hash) 1)
+    0
+    > (count-after-remove (make-hasheq '((1 . a))) 2)
+    1
+    ! (define ht (make-hash '(((1) . a) ((2) . b) ((3) . c))))
+    ! (hash-remove! ht (list 2))
+    ! (hash-set! ht (list 4) 'd)
+    > (hash-ref ht (list 2) #f)
+    #f
+    > (list (hash-ref ht (list 1)) (hash-ref ht (list 3)) (hash-ref ht (list 4)))
+    '(a c d)
+    > (sort (hash-map ht (lambda (k v) (car k))) <)
+    '(1 3 4)
+    """
+
+def test_hash_iterate_removed(doctest):
+    """
+    ! (define ht (make-hash))
+    ! (hash-set! ht 1 'a)
+    ! (hash-set! ht 2 'b)
+    ! (hash-set! ht 3 'c)
+    ! (hash-remove! ht (hash-iterate-key ht (hash-iterate-first ht)))
+    > (hash-count ht)
+    2
+    > (let loop ([i (hash-iterate-first ht)] [n 0])
+        (if i (loop (hash-iterate-next ht i) (+ n 1)) n))
+    2
+    > (length (hash-map ht cons))
+    2
+    > (let ([n 0]) (hash-for-each ht (lambda (k v) (set! n (+ n k)))) (< 2 n 6))
+    #t
+    """
+
 
 def test_whitebox_str(source):
     r"""
@@ -267,3 +348,261 @@ def test_hash_for(doctest):
     > (for/sum ([(k v) ht]) v)
     6
     """
+
+def test_equal_hash_code(doctest):
+    """
+    ! (define-values (struct:p p p? p-ref p-set!) (make-struct-type 'p #f 2 0 #f '() #f))
+    ! (define-values (struct:q q q? q-ref q-set!) (make-struct-type 'q #f 2 0))
+    > (= (equal-hash-code (list 1 "ab" #\\c)) (equal-hash-code (list 1 (string #\\a #\\b) #\\c)))
+    #t
+    > (= (equal-hash-code (vector 1 (box 2.5))) (equal-hash-code (vector 1 (box 2.5))))
+    #t
+    > (= (equal-hash-code (p 1 '(2))) (equal-hash-code (p 1 (list 2))))
+    #t
+    > (= (equal-hash-code (mcons 1 2)) (equal-hash-code (mcons 1 2)))
+    #t
+    > (= (equal-hash-code 12345678901234567890) (equal-hash-code (* 1234567890123456789 10)))
+    #t
+    > (= (equal-hash-code (list 1 2)) (equal-hash-code (list 2 1)))
+    #f
+    > (let ([v (q 1 2)]) (= (equal-hash-code v) (equal-hash-code v)))
+    #t
+    """
+
+def test_equal_hash_structured_keys(doctest):
+    """
+    ! (define-values (struct:p p p? p-ref p-set!) (make-struct-type 'p #f 2 0 #f '() #f))
+    ! (define ht (make-hash))
+    ! (for-each (lambda (i) (hash-set! ht (list i (p i "x")) i)) '(0 1 2 3 4 5 6 7 8 9))
+    ! (hash-set! ht (vector 1 2) 'vec)
+    ! (hash-set! ht (list 3 (p 3 "x")) 'three)
+    > (hash-count ht)
+    11
+    > (hash-ref ht (list 7 (p 7 (string #\\x))))
+    7
+    > (hash-ref ht (list 3 (p 3 "x")))
+    'three
+    > (hash-ref ht (vector 1 2))
+    'vec
+    > (hash-ref ht (list 3 (p 4 "x")) #f)
+    #f
+    """
+
+def test_equal_hash_buckets():
+    from pycket.values_hash import ObjectHashmapStrategy, equal_hash
+    keys = [values.to_list([values.W_Fixnum(i), values.W_Symbol.make("a")])
+            for i in range(20)]
+    copies = [values.to_list([values.W_Fixnum(i), values.W_Symbol.make("a")])
+              for i in range(20)]
+    for k, c in zip(keys, copies):
+        assert equal_hash(k) == equal_hash(c)
+    storage = ObjectHashmapStrategy.singleton.create_storage(
+        keys, [values.W_Fixnum(i) for i in range(20)])
+    storage = ObjectHashmapStrategy.singleton.unerase(storage)
+    assert len(storage.buckets) > 10
+
+def test_equal_hash_long_vector():
+    from pycket.values_hash import (equal_hash, needs_cps_equal,
+                                    EQUAL_HASH_MAX_NODES)
+    from pycket.vector import W_Vector
+    n = 100000
+    w_v = W_Vector.fromelements([values.W_Fixnum(i) for i in range(n)])
+    w_copy = W_Vector.fromelements([values.W_Fixnum(i) for i in range(n)])
+    w_other = W_Vector.fromelements([values.W_Fixnum(i + 1) for i in range(n)])
+    assert equal_hash(w_v) == equal_hash(w_copy)
+    assert equal_hash(w_v) != equal_hash(w_other)
+    # the elements past the budget of nodes are not looked at
+    w_v.set(n - 1, values.W_Fixnum(-1))
+    assert equal_hash(w_v) == equal_hash(w_copy)
+    assert needs_cps_equal(w_v)
+
+def test_immutable_hash(doctest):
+    """
+    ! (define h0 (hash 'a 1 'b 2))
+    ! (define h1 (hash-set h0 'c 3))
+    ! (define h2 (hash-remove h1 'a))
+    > (list (hash-count h0) (hash-count h1) (hash-count h2))
+    '(2 3 2)
+    > (hash-ref h1 'c)
+    3
+    > (hash-ref h0 'c #f)
+    #f
+    > (hash-ref h2 'a #f)
+    #f
+    > (immutable? h1)
+    #t
+    > (hash-ref (hash-set (hash-set (hasheqv) 1 'one) 1.5 'x) 1.5)
+    'x
+    > (hash-ref (hash-set h0 (list 1 "a") 'l) (list 1 (string #\\a)))
+    'l
+    > (hash-ref (make-immutable-hasheq '((1 . 2))) 1)
+    2
+    > (let loop ([h (hasheq)] [i 0])
+        (if (= i 100) (hash-count (hash-remove h 50)) (loop (hash-set h i i) (+ i 1))))
+    99
+    E (hash-set! (hash) 1 2)
+    E (hash-set (make-hash) 1 2)
+    """
+
+def test_immutable_hash_strategies():
+    from pycket.values_hash import (W_ImmutableHashTable, EQUAL_KIND,
+        FixnumImmutableHashmapStrategy, EqualImmutableHashmapStrategy)
+    w_h = W_ImmutableHashTable.make(EQUAL_KIND, [values.W_Fixnum(1)],
+                                    [values.W_Fixnum(2)])
+    assert w_h.strategy is FixnumImmutableHashmapStrategy.singleton
+    w_h2 = w_h.assoc(values.W_Symbol.make("a"), values.w_true)
+    assert w_h2.strategy is EqualImmutableHashmapStrategy.singleton
+    assert w_h.length() == 1
+    assert w_h2.length() == 2
+
+def test_immutable_hash_cps_keys(doctest):
+    """
+    ! (struct p (x y) #:property prop:equal+hash (list (lambda (a b r) (r (p-x a) (p-x b))) (lambda (a r) (r (p-x a))) (lambda (a r) 1)))
+    ! (define v (vector 1 2))
+    ! (define c (chaperone-vector v (lambda (v i x) x) (lambda (v i x) x)))
+    > (hash-ref (hash (p 1 2) 'a) (p 1 3))
+    'a
+    > (hash-ref (hash-set (hash 'k 0) (p 1 2) 'a) (p 1 3) #f)
+    'a
+    > (hash-count (hash-set (hash (p 1 2) 'a) (p 1 3) 'b))
+    1
+    > (hash-ref (hash-set (hash (p 1 2) 'a) (p 1 3) 'b) (p 1 4))
+    'b
+    > (hash-count (hash-remove (hash (p 1 2) 'a 'k 0) (p 1 3)))
+    1
+    > (hash-ref (hash c 'c) (vector 1 2))
+    'c
+    > (hash-ref (hash (vector 1 2) 'v) c)
+    'v
+    > (hash-ref (make-immutable-hash (list (cons (p 1 2) 'a))) (p 1 5))
+    'a
+    """
+
+def test_weak_hash(doctest):
+    """
+    ! (define h (make-weak-hasheq))
+    ! (define k (list 1 2))
+    ! (hash-set! h k 'v)
+    ! (hash-set! h 1 'one)
+    > (hash-ref h k)
+    'v
+    > (hash-ref h 1)
+    'one
+    > (hash-count h)
+    2
+    > (hash-weak? h)
+    #t
+    > (hash-weak? (make-hasheq))
+    #f
+    > (hash-ref (make-weak-hash (list (cons (list 1) 2))) (list 1))
+    2
+    > (let ([h (make-weak-hasheqv)]) (hash-set! h 1.5 'x) (hash-remove! h 1.5) (hash-count h))
+    0
+    """
+
+def test_weak_hash_cps_keys(doctest):
+    """
+    ! (struct p (x y) #:property prop:equal+hash (list (lambda (a b r) (r (p-x a) (p-x b))) (lambda (a r) (r (p-x a))) (lambda (a r) 1)))
+    ! (define k (p 1 2))
+    ! (define h (make-weak-hash (list (cons k 'a))))
+    > (hash-ref h (p 1 3))
+    'a
+    ! (hash-set! h (p 1 4) 'b)
+    > (list (hash-count h) (hash-ref h k))
+    '(1 b)
+    ! (hash-remove! h (p 1 5))
+    > (hash-count h)
+    0
+    ! (define v (vector 1 2))
+    ! (hash-set! h (chaperone-vector v (lambda (v i x) x) (lambda (v i x) x)) 'c)
+    > (hash-ref h v)
+    'c
+    > (hash-ref h (vector 1 2))
+    'c
+    """
+
+def test_weak_hash_memory():
+    import gc
+    from pycket.values_hash import W_WeakHashTable, EQ_KIND
+    w_h = W_WeakHashTable(EQ_KIND, [], [])
+    kept = [values.W_MBox(values.W_Fixnum(i)) for i in range(10)]
+    for w_key in kept:
+        w_h.set(w_key, values.w_true)
+    for i in range(10000):
+        w_h.set(values.W_MBox(values.W_Fixnum(i)), values.w_false)
+        if i % 100 == 0:
+            gc.collect()
+    gc.collect()
+    assert len(w_h.entries) < 1000
+    assert w_h.length() == 10
+    for w_key in kept:
+        assert w_h.get(w_key) is values.w_true
+    w_h.set(values.W_Fixnum(12345), values.w_true)
+    gc.collect()
+    assert w_h.get(values.W_Fixnum(12345)) is values.w_true
+
+def test_hash_copy_clear(doctest):
+    """
+    ! (define h (make-hash '((1 . a) (2 . b))))
+    ! (define c (hash-copy h))
+    ! (hash-set! c 3 'c)
+    > (list (hash-count h) (hash-count c) (hash-ref c 1))
+    '(2 3 a)
+    ! (hash-clear! h)
+    > (list (hash-count h) (hash-count c) (hash-ref h 1 #f))
+    '(0 3 #f)
+    ! (hash-set! h 5 'e)
+    > (hash-ref h 5)
+    'e
+    ! (define e (make-hash (list (cons (list 1) 'l))))
+    > (hash-ref (hash-copy e) (list 1))
+    'l
+    ! (define q (hash-copy (hasheq 'x 1)))
+    ! (hash-set! q 'y 2)
+    > (list (hash-count q) (immutable? q) (hash-ref q 'x))
+    '(2 #f 1)
+    > (hash-count (hash-copy (make-hasheqv '((1.5 . 2)))))
+    1
+    > (hash-count (hash-clear (hash 'a 1 'b 2)))
+    0
+    E (hash-clear! (hash 'a 1))
+    E (hash-clear (make-hash))
+    """
+
+def test_chaperone_hash_unsupported(doctest):
+    """
+    ! (define h (make-hash '((1 . a))))
+    ! (define c (chaperone-hash h (lambda (h k) (values k (lambda (h k v) v))) (lambda (h k v) (values k v)) (lambda (h k) k) (lambda (h k) k)))
+    > (hash-ref c 1)
+    'a
+    > (hash-count c)
+    1
+    > (hash-iterate-first c)
+    0
+    E (hash-copy c)
+    E (hash-clear! c)
+    E (hash-iterate-key c 0)
+    E (hash-set! c 2 'b)
+    """
+
+def test_hash_copy_keeps_strategy():
+    from pycket.values_hash import (W_EqualHashTable, FixnumHashmapStrategy,
+        StringHashmapStrategy, ObjectHashmapStrategy)
+    from pycket.values_string import W_String
+    keys = [values.W_Fixnum(i) for i in range(100)]
+    w_h = W_EqualHashTable(keys, keys)
+    w_copy = w_h.hash_copy()
+    assert w_copy.strategy is FixnumHashmapStrategy.singleton
+    assert w_copy.hstorage is not w_h.hstorage
+    assert w_copy.length() == 100
+    w_h.hash_clear()
+    assert w_h.strategy is FixnumHashmapStrategy.singleton
+    assert w_h.length() == 0
+    assert w_copy.length() == 100
+    w_s = W_EqualHashTable([W_String.fromascii("a")], [values.w_true])
+    assert w_s.hash_copy().strategy is StringHashmapStrategy.singleton
+    w_o = W_EqualHashTable([values.W_Cons.make(values.w_true, values.w_null)],
+                           [values.w_true])
+    w_o_copy = w_o.hash_copy()
+    assert w_o_copy.strategy is ObjectHashmapStrategy.singleton
+    assert w_o_copy.length() == 1
@@ -0,0 +1,125 @@
+from pycket import values
+from pycket.expand import expand_string, _to_module, ModTable
+from pycket.inline import Inliner, INLINE_MAX_SIZE
+from pycket.interpreter import interpret_module, App, Lambda, ModuleVar
+from pycket.pycket_json import loads
+from pycket.test.testhelper import format_pycket_mod
+
+def inline(s):
+    json = loads(expand_string(format_pycket_mod(s)))
+    m = _to_module(json, ModTable())
+    inliner = Inliner(m)
+    return inliner, inliner.inline_module(m).assign_convert_module()
+
+def lookup(m, name):
+    interpret_module(m)
+    return m.defs[values.W_Symbol.make(name)]
+
+def definition(m, name):
+    sym = values.W_Symbol.make(name)
+    for form in m.body:
+        if getattr(form, "names", None) == [sym]:
+            return form.rhs
+    assert 0, name
+
+def calls(ast, name):
+    """ The calls of the module variable `name` in `ast` """
+    result = []
+    todo = [ast]
+    while todo:
+        ast = todo.pop()
+        if (isinstance(ast, App) and isinstance(ast.rator, ModuleVar) and
+                ast.rator.srcsym is values.W_Symbol.make(name)):
+            result.append(ast)
+        todo.extend(ast.direct_children())
+    return result
+
+def test_inline_id():
+    inliner, m = inline("""
+    (define (id x) x)
+    (define (f n) (id (id (id n))))
+    (define x (f 5))
+    """)
+    # the three calls in f, and f in the definition of x
+    assert inliner.inlined == 4
+    assert calls(definition(m, "f"), "id") == []
+    assert lookup(m, "x").value == 5
+
+def test_inline_keeps_evaluation_order():
+    inliner, m = inline("""
+    (define (sub a b) (- a b))
+    (define (f x) (sub (* x 2) x))
+    (define x (f 7))
+    """)
+    assert inliner.inlined == 2
+    assert lookup(m, "x").value == 7
+
+def test_no_inline_recursive_or_mutated():
+    inliner, m = inline("""
+    (define (loop n) (if (zero? n) 0 (loop (- n 1))))
+    (define (g x) x)
+    (set! g (lambda (x) (+ x 1)))
+    (define x (+ (loop 3) (g 1)))
+    """)
+    assert inliner.inlined == 0
+    assert len(calls(definition(m, "loop"), "loop")) == 1
+    assert len(calls(definition(m, "x"), "loop")) == 1
+    assert lookup(m, "x").value == 2
+
+def test_no_inline_before_definition():
+    inliner, m = inline("""
+    (define (h) (f 1))
+    (define (f x) (+ x 1))
+    (define x (f 2))
+    """)
+    # only the calls after the definition and inside lambdas
+    assert inliner.inlined == 2
+    assert lookup(m, "x").value == 3
+
+def test_no_inline_big():
+    body = "(+ x " * INLINE_MAX_SIZE + "1" + ")" * INLINE_MAX_SIZE
+    inliner, m = inline("""
+    (define (big x) %s)
+    (define x (big 1))
+    """ % body)
+    assert inliner.inlined == 0
+    assert lookup(m, "x").value == INLINE_MAX_SIZE + 1
+
+def test_inline_let_bound():
+    inliner, m = inline("""
+    (define (f y)
+      (let ([add (lambda (z) (+ y z))])
+        (add (add 1))))
+    (define x (f 10))
+    """)
+    # both calls of add, and f in the definition of x
+    assert inliner.inlined == 3
+    assert lookup(m, "x").value == 21
+
+def test_inline_assigned_parameter():
+    inliner, m = inline("""
+    (define (inc! x) (set! x (+ x 1)) x)
+    (define (f a) (let ([r (inc! a)]) (+ r a)))
+    (define x (f 1))
+    """)
+    assert inliner.inlined == 2
+    assert lookup(m, "x").value == 3
+
+def test_inlined_copies_are_fresh():
+    inliner, m = inline("""
+    (define (twice x) (* x 2))
+    (define (f a) (+ (twice a) (twice a)))
+    (define x (f 3))
+    """)
+    assert inliner.inlined == 3
+    lam = definition(m, "f").lams[0]
+    seen = set()
+    todo = list(lam.body)
+    while todo:
+        ast = todo.pop()
+        assert id(ast) not in seen
+        seen.add(id(ast))
+        assert ast.surrounding_lambda is lam
+        if not isinstance(ast, Lambda):
+            todo.extend(ast.direct_children())
+    assert lookup(m, "x").value == 12
@@ -0,0 +1,93 @@
+from pycket.env import ToplevelEnv
+from pycket.expand import expand_string, _to_module, ModTable
+from pycket.jit_hints import (ASTWalker, walk_module, load_jit_hints,
+                              save_jit_hints)
+from pycket.pycket_json import loads
+from pycket.test.testhelper import format_pycket_mod
+
+CODE = """
+(define (loop n acc) (if (zero? n) acc (loop (- n 1) (+ acc n))))
+(define (f x) (lambda (y) (+ x y)))
+(define x (loop 100 0))
+"""
+
+def load_module(s):
+    json = loads(expand_string(format_pycket_mod(s)))
+    return _to_module(json, ModTable()).assign_convert_module()
+
+class Collector(ASTWalker):
+    def __init__(self):
+        self.keys = []
+        self.entered = []
+
+    def visit(self, key, ast):
+        self.keys.append(key)
+        if ast.should_enter:
+            self.entered.append(key)
+
+def collect(m):
+    collector = Collector()
+    walk_module(m, collector)
+    return collector
+
+def test_keys_are_stable():
+    keys = collect(load_module(CODE)).keys
+    assert len(keys) == len(set(keys))
+    assert keys == collect(load_module(CODE)).keys
+
+def test_save_and_apply(tmpdir):
+    lib = tmpdir.join("lib.rkt")
+    lib.write("#lang pycket\n")
+    m = load_module(CODE)
+    env = ToplevelEnv()
+    env.module_env.add_module(str(lib), m)
+    m.interpret_mod(env)
+    entered = collect(m).entered
+    assert entered
+    fname = str(tmpdir.join("hints"))
+    save_jit_hints(fname, env.module_env, "")
+
+    # a fresh copy gets the same marks when it is added
+    m2 = load_module(CODE)
+    assert collect(m2).entered != entered
+    env = ToplevelEnv()
+    env.module_env.jit_hints = load_jit_hints(fname, "")
+    env.module_env.add_module(str(lib), m2)
+    assert collect(m2).entered == entered
+
+    # not after the module changed
+    lib.write("#lang pycket\n;changed\n")
+    m3 = load_module(CODE)
+    assert load_jit_hints(fname, "").apply(str(lib), m3) == 0
+
+def test_other_ast_flags(tmpdir):
+    lib = tmpdir.join("lib.rkt")
+    lib.write("#lang pycket\n")
+    m = load_module(CODE)
+    env = ToplevelEnv()
+    env.module_env.add_module(str(lib), m)
+    m.interpret_mod(env)
+    fname = str(tmpdir.join("hints"))
+    save_jit_hints(fname, env.module_env, "inline")
+    assert load_jit_hints(fname, "inline").apply(str(lib), load_module(CODE))
+    assert load_jit_hints(fname, "").apply(str(lib), load_module(CODE)) == 0
+    assert load_jit_hints(fname, "lazy,inline").apply(
+        str(lib), load_module(CODE)) == 0
+
+def test_keep_hints_of_other_programs(tmpdir):
+    fname = str(tmpdir.join("hints"))
+    libs = [tmpdir.join("lib1.rkt"), tmpdir.join("lib2.rkt")]
+    for lib in libs:
+        lib.write("#lang pycket\n")
+        env = ToplevelEnv()
+        env.module_env.jit_hints = load_jit_hints(fname, "")
+        m = load_module(CODE)
+        env.module_env.add_module(str(lib), m)
+        m.interpret_mod(env)
+        save_jit_hints(fname, env.module_env, "")
+    modules = load_jit_hints(fname, "").modules
+    assert sorted(modules.keys()) == sorted([str(lib) for lib in libs])
+    assert modules[str(libs[0])][2]
+
+def test_missing_file(tmpdir):
+    assert load_jit_hints(str(tmpdir.join("missing")), "").modules == {}
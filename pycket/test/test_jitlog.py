@@ -0,0 +1,62 @@
+from StringIO import StringIO
+
+from pycket.expand import expand_string, parse_module
+from pycket.interpreter import printable_location
+from pycket.jitlog import JitLog, location_of, report
+
+LOG = """\
+[1a] {jit-log-opt-loop
+# Loop 0 (fib.rkt:3 If from fib.rkt:3 App) : loop with 40 ops
+[p0, p1]
+debug_merge_point(0, 0, 'fib.rkt:3 If from fib.rkt:3 App')
++100: guard_class(p0, 1234, descr=<Guard0x10>) [p0, p1]
+debug_merge_point(0, 0, 'fib.rkt:5 App from fib.rkt:3 App')
++120: guard_true(i3, descr=<Guard0x11>) [p0, p1]
++130: guard_value(p1, ConstPtr(ptr2), descr=<Guard0x12>) [p0, p1]
++140: jump(p0, p1, descr=TargetToken(5))
+[1b] jit-log-opt-loop}
+[1c] {jit-log-opt-bridge
+# bridge out of Guard 0x11 with 10 ops
+[p0, p1]
++10: guard_false(i4, descr=<Guard0x20>) [p0]
+debug_merge_point(0, 0, 'main.rkt:1 Let')
++20: guard_true(i5, descr=<Guard0x21>) [p0]
+[1d] jit-log-opt-bridge}
+[1e] {jit-backend-counts
+entry 0:7
+TargetToken(5):1000
+bridge 17:250
+bridge 32:3
+[1f] jit-backend-counts}
+"""
+
+def test_location_of():
+    assert location_of("fib.rkt:3 If from fib.rkt:3 App") == "fib.rkt:3"
+    assert location_of("<module> Let") == "<module>"
+    assert location_of("<module>") == "<module>"
+
+def test_summary():
+    jitlog = JitLog()
+    jitlog.parse(StringIO(LOG))
+    fib3 = jitlog.stats["fib.rkt:3"]
+    assert (fib3.loops, fib3.guards, fib3.bridges, fib3.entries) == (1, 1, 0, 7)
+    fib5 = jitlog.stats["fib.rkt:5"]
+    # the first guard of the bridge is at the guard it comes out of
+    assert (fib5.guards, fib5.bridges, fib5.failures) == (3, 1, 253)
+    assert jitlog.stats["main.rkt:1"].guards == 1
+    assert [s.location for s in jitlog.summary()][0] == "fib.rkt:5"
+    out = StringIO()
+    report(jitlog, out=out)
+    assert out.getvalue().splitlines()[1].startswith("fib.rkt:5")
+
+def test_printable_location():
+    m = parse_module(expand_string("""
+#lang pycket
+(define (f x)
+  (+ x 1))
+"""))
+    lam = m.body[0].rhs.lams[0]
+    assert lam.srcline > 0
+    assert lam.srcloc().endswith(":%d" % lam.srcline)
+    assert printable_location(lam.body[0]).startswith(lam.srcloc() + " ")
+    assert printable_location(m.body[0]) == "<module> DefineValues"
@@ -44,3 +44,44 @@ def test_bug():
             [{"quote" : { "string": "\\" }},{"quote" : { "string": "Hi" }}])
 
     _compare(r'{"string" : "\\\\"}', {"string": "\\\\"})
+
+def test_pull_object():
+    from pycket.pycket_json import OwnJSONDecoder
+    d = OwnJSONDecoder('{"a": 1, "b": [1, {"c": "}"}], "d" : "x\\"]", "e": {}}')
+    d.start_object()
+    assert d.next_key() == "a"
+    assert d.decode_value().value_int() == 1
+    assert d.next_key() == "b"
+    d.skip_value()
+    assert d.next_key() == "d"
+    d.skip_value()
+    assert d.next_key() == "e"
+    d.start_object()
+    assert d.next_key() is None
+    assert d.next_key() is None
+    assert d.pos == len(d.s)
+
+def test_pull_array():
+    from pycket.pycket_json import OwnJSONDecoder
+    d = OwnJSONDecoder(' [ 1, [], "two" ,{"three": 3}] ')
+    d.start_array()
+    res = []
+    while d.next_element():
+        res.append(d.decode_value()._unpack_deep())
+    assert res == [1, [], "two", {"three": 3}]
+
+def test_pull_errors():
+    from pycket.pycket_json import OwnJSONDecoder
+    d = OwnJSONDecoder('{"a": 1 "b": 2}')
+    d.start_object()
+    d.next_key()
+    d.decode_value()
+    with pytest.raises(ValueError):
+        d.next_key()
+    d = OwnJSONDecoder('[1, [2, 3]')
+    d.start_array()
+    d.next_element()
+    d.decode_value()
+    d.next_element()
+    with pytest.raises(ValueError):
+        d.skip_value()
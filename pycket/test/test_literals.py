@@ -0,0 +1,61 @@
+from pycket import values
+from pycket.values_string import W_String
+from pycket.vector import W_Vector
+from pycket.literals import LiteralTable
+
+def test_numbers():
+    t = LiteralTable()
+    w_a = t.intern(values.W_Flonum(1.5))
+    assert t.intern(values.W_Flonum(1.5)) is w_a
+    assert t.intern(values.W_Flonum(-1.5)) is not w_a
+    w_nan = t.intern(values.W_Flonum(float("nan")))
+    assert t.intern(values.W_Flonum(float("nan"))) is w_nan
+    w_fix = values.W_Fixnum(1)
+    assert t.intern(w_fix) is w_fix
+    assert t.intern(values.W_Flonum(1.0)) is not t.intern(values.W_Fixnum.make(1))
+
+def test_lists():
+    t = LiteralTable()
+    def make():
+        return values.to_list([values.W_Flonum(2.5), W_String.make("a"),
+                               values.to_list([values.W_Fixnum(1)])])
+    w_a = t.intern(make())
+    w_b = t.intern(make())
+    assert w_a is w_b
+    assert w_a.tostring() == make().tostring()
+    # shared tails
+    w_tail = t.intern(make().cdr())
+    assert w_tail is w_a.cdr()
+    w_improper = values.to_improper([values.W_Fixnum(1)], values.W_Flonum(0.5))
+    assert t.intern(w_improper).tostring() == w_improper.tostring()
+
+def test_long_list():
+    t = LiteralTable()
+    w_list = values.to_list([values.W_Fixnum(i) for i in range(100000)])
+    assert t.intern(w_list) is w_list
+
+def test_vectors_and_boxes():
+    t = LiteralTable()
+    def make():
+        return W_Vector.fromelements([values.W_Flonum(1.0),
+                                      values.W_IBox(values.W_Flonum(2.0))],
+                                     immutable=True)
+    w_a = t.intern(make())
+    assert t.intern(make()) is w_a
+    w_mutable = W_Vector.fromelements([values.W_Fixnum(1)])
+    assert t.intern(w_mutable) is w_mutable
+    assert t.intern(W_Vector.fromelements([values.W_Fixnum(1)])) is not w_mutable
+
+def test_stats(capsys):
+    t = LiteralTable()
+    t.report = True
+    t.begin_module()
+    t.intern(values.W_Flonum(1.5))
+    t.begin_module()
+    t.intern(values.W_Flonum(1.5))
+    t.end_module("inner")
+    t.intern(values.W_Flonum(1.5))
+    t.end_module("outer")
+    out, err = capsys.readouterr()
+    assert out == ("literals in inner: 1, 1 shared (100%)\n"
+                   "literals in outer: 2, 1 shared (50%)\n")
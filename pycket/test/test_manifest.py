@@ -0,0 +1,103 @@
+import os
+import pytest
+from pycket.manifest import Manifest
+
+@pytest.fixture
+def files(tmpdir):
+    d = {}
+    for name in ["a.rkt", "b.rkt", "c.rkt"]:
+        f = tmpdir.join(name)
+        f.write("#lang pycket\n; %s\n" % name)
+        d[name] = str(f)
+    return d
+
+def make_manifest(tmpdir):
+    m = Manifest(str(tmpdir.join("cache")))
+    m.load()
+    return m
+
+def expand(manifest, path, requires):
+    json_file = manifest.json_name(path)
+    manifest.ensure_cache_dir()
+    open(json_file, "w").write("{}")
+    manifest.record(path, json_file, requires)
+    return json_file
+
+def test_empty(tmpdir, files):
+    m = make_manifest(tmpdir)
+    assert m.lookup(files["a.rkt"]) is None
+    m.save()
+    assert not os.path.exists(m.manifest_file())
+
+def test_roundtrip(tmpdir, files):
+    m = make_manifest(tmpdir)
+    json_c = expand(m, files["c.rkt"], [])
+    json_b = expand(m, files["b.rkt"], [files["c.rkt"]])
+    json_a = expand(m, files["a.rkt"], [files["b.rkt"], files["c.rkt"]])
+    assert m.lookup(files["a.rkt"]) == json_a
+    m.save()
+    m = make_manifest(tmpdir)
+    assert m.lookup(files["a.rkt"]) == json_a
+    assert m.lookup(files["b.rkt"]) == json_b
+    assert m.lookup(files["c.rkt"]) == json_c
+    assert not m.dirty
+
+def test_transitive_change(tmpdir, files):
+    m = make_manifest(tmpdir)
+    expand(m, files["c.rkt"], [])
+    expand(m, files["b.rkt"], [files["c.rkt"]])
+    expand(m, files["a.rkt"], [files["b.rkt"]])
+    m.save()
+    with open(files["c.rkt"], "a") as f:
+        f.write("(define x 1)\n")
+    m = make_manifest(tmpdir)
+    assert m.lookup(files["c.rkt"]) is None
+    assert m.lookup(files["b.rkt"]) is None
+    assert m.lookup(files["a.rkt"]) is None
+
+def test_mtime_irrelevant(tmpdir, files):
+    m = make_manifest(tmpdir)
+    json_a = expand(m, files["a.rkt"], [])
+    m.save()
+    os.utime(files["a.rkt"], (0, 2 ** 31 - 1))
+    m = make_manifest(tmpdir)
+    assert m.lookup(files["a.rkt"]) == json_a
+
+def test_missing_json(tmpdir, files):
+    m = make_manifest(tmpdir)
+    json_a = expand(m, files["a.rkt"], [])
+    os.remove(json_a)
+    assert m.lookup(files["a.rkt"]) is None
+
+def test_same_contents_other_directory(tmpdir, files):
+    m = make_manifest(tmpdir)
+    other = tmpdir.mkdir("other").join("a.rkt")
+    other.write(open(files["a.rkt"]).read())
+    json_a = expand(m, files["a.rkt"], [])
+    json_other = expand(m, str(other), [files["b.rkt"]])
+    assert json_a != json_other
+    assert m.lookup(files["a.rkt"]) == json_a
+    assert m.lookup(str(other)) == json_other
+
+def test_code(tmpdir, files):
+    m = make_manifest(tmpdir)
+    source = "#lang pycket\n(display 1)"
+    path = m.code_path(source)
+    assert path != m.code_path(source + " ")
+    old_cwd = os.getcwd()
+    os.chdir(str(tmpdir))
+    try:
+        assert path != m.code_path(source)
+    finally:
+        os.chdir(old_cwd)
+    json_file = path + ".json"
+    m.ensure_cache_dir()
+    open(json_file, "w").write("{}")
+    m.record(path, json_file, [files["a.rkt"]])
+    m.save()
+    m = make_manifest(tmpdir)
+    assert m.lookup(m.code_path(source)) == json_file
+    with open(files["a.rkt"], "a") as f:
+        f.write("(define x 1)\n")
+    m = make_manifest(tmpdir)
+    assert m.lookup(m.code_path(source)) is None
@@ -0,0 +1,92 @@
+import os
+import pytest
+from pycket.pycket_json import loads
+from pycket.expand import ModTable
+from pycket.parallel_expand import (json_requires, ParallelExpander,
+                                    expand_requires_parallel)
+
+def test_json_requires():
+    json = loads('''{"language": "/lang.rkt",
+                     "body-forms": [{"require": ["/a.rkt", "#%kernel"]},
+                                    {"begin": [{"require": ["/b.rkt", "/a.rkt"]}]}]}''')
+    assert sorted(json_requires(json)) == ["/a.rkt", "/b.rkt", "/lang.rkt"]
+    assert json_requires(loads('{"language": "#%kernel", "body-forms": []}')) == []
+
+@pytest.fixture
+def fake_racket(tmpdir, monkeypatch):
+    """ A 'racket' that expands a file by copying it, so the test modules are
+    written as the json they expand to. """
+    bindir = tmpdir.mkdir("bin")
+    racket = bindir.join("racket")
+    racket.write('#!/bin/sh\n'
+                 'while [ "$1" != "--output" ]; do shift; done\n'
+                 'cat "$3" > "$2"\n')
+    racket.chmod(0755)
+    monkeypatch.setenv("PATH", "%s:%s" % (bindir, os.environ["PATH"]))
+    monkeypatch.setenv("PYCKET_EXPANDER_SOCKET", str(tmpdir.join("none")))
+    return racket
+
+def write_module(tmpdir, name, requires):
+    f = tmpdir.join(name)
+    f.write('{"language": "", "body-forms": [{"require": [%s]}]}' %
+            ", ".join(['"%s"' % tmpdir.join(r) for r in requires]))
+    return str(f)
+
+def test_expand_closure(tmpdir, fake_racket):
+    main = write_module(tmpdir, "main.rkt", ["a.rkt", "b.rkt"])
+    write_module(tmpdir, "a.rkt", ["c.rkt"])
+    write_module(tmpdir, "b.rkt", ["c.rkt", "d.rkt"])
+    write_module(tmpdir, "c.rkt", [])
+    write_module(tmpdir, "d.rkt", ["a.rkt"])
+    expander = ParallelExpander(ModTable(), 3)
+    expander.run(json_requires(loads(open(main).read())))
+    assert expander.expanded == 4
+    assert expander.failed == 0
+    for name in "abcd":
+        json_file = str(tmpdir.join("%s.rkt.json" % name))
+        assert open(json_file).read() == open(json_file[:-5]).read()
+    # everything is cached now
+    expander = ParallelExpander(ModTable(), 3)
+    expander.run(json_requires(loads(open(main).read())))
+    assert expander.expanded == 0
+
+def test_expand_with_manifest(tmpdir, fake_racket):
+    main = write_module(tmpdir, "main.rkt", ["a.rkt"])
+    a = write_module(tmpdir, "a.rkt", ["b.rkt"])
+    b = write_module(tmpdir, "b.rkt", [])
+    modtable = ModTable()
+    modtable.use_cache_dir(str(tmpdir.join("cache")))
+    main_json = str(tmpdir.join("main.json"))
+    open(main_json, "w").write(open(main).read())
+    expand_requires_parallel(main_json, modtable, 2)
+    manifest = modtable.manifest
+    assert manifest.lookup(a) is not None
+    assert manifest.lookup(b) is not None
+    assert manifest.entries[a].requires == [b]
+
+def test_expansion_without_output(tmpdir, fake_racket):
+    # a racket that succeeds without writing the expansion
+    fake_racket.write('#!/bin/sh\nexit 0\n')
+    main = write_module(tmpdir, "main.rkt", ["a.rkt"])
+    write_module(tmpdir, "a.rkt", [])
+    expander = ParallelExpander(ModTable(), 2)
+    expander.run(json_requires(loads(open(main).read())))
+    assert expander.expanded == 0
+    assert expander.failed == 1
+
+def test_other_children_are_left_alone(tmpdir, fake_racket):
+    main = write_module(tmpdir, "main.rkt", ["a.rkt", "b.rkt"])
+    write_module(tmpdir, "a.rkt", [])
+    write_module(tmpdir, "b.rkt", [])
+    # a child that is not a racket process, and exits first
+    other = os.fork()
+    if other == 0:
+        os._exit(3)
+    try:
+        expander = ParallelExpander(ModTable(), 2)
+        expander.run(json_requires(loads(open(main).read())))
+        assert expander.expanded == 2
+    finally:
+        pid, status = os.waitpid(other, 0)
+    assert pid == other
+    assert os.WEXITSTATUS(status) == 3
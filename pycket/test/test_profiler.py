@@ -0,0 +1,38 @@
+from pycket.env import ToplevelEnv
+from pycket.expand import expand_string, parse_module
+from pycket.interpreter import interpret_module
+from pycket.profiler import Sampler, sampler
+
+CODE = """
+#lang pycket
+(define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))
+(define x (fib 10))
+"""
+
+def test_profile(monkeypatch, tmpdir):
+    monkeypatch.setattr(sampler, "enabled", True)
+    monkeypatch.setattr(sampler, "interval", 1)
+    monkeypatch.setattr(sampler, "countdown", 1)
+    monkeypatch.setattr(sampler, "stacks", {})
+    interpret_module(parse_module(expand_string(CODE)), ToplevelEnv())
+    assert sampler.stacks
+    fib = [stack for stack in sampler.stacks if stack.count(";") == 1]
+    assert fib
+    for stack in fib:
+        # recursive calls are folded into one frame
+        assert stack.startswith("<module>;")
+    fname = str(tmpdir.join("profile.folded"))
+    sampler.write(fname)
+    lines = open(fname).read().splitlines()
+    assert len(lines) == len(sampler.stacks)
+    total = sum([int(line.rsplit(" ", 1)[1]) for line in lines])
+    assert total == sum(sampler.stacks.values())
+
+def test_interval():
+    s = Sampler()
+    s.enable(3)
+    for i in range(2):
+        s.tick(None, None)
+    # the ast is only looked at when a sample is taken
+    assert s.countdown == 1
+    assert not s.stacks
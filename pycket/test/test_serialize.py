@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import pytest
+from pycket import values
+from pycket.expand import expand_string, _to_module, ModTable
+from pycket.pycket_json import loads
+from pycket.serialize import (serialize_module, deserialize_module,
+                              Writer, Reader, DeserializationError)
+from pycket.test.testhelper import format_pycket_mod
+
+def roundtrip(s, stdlib=False):
+    json = loads(expand_string(format_pycket_mod(s, stdlib=stdlib)))
+    m1 = _to_module(json, ModTable())
+    data = serialize_module(m1, "")
+    m2 = deserialize_module(data, ModTable())
+    assert m1.name == m2.name
+    assert m1.config == m2.config
+    assert m1.tostring() == m2.tostring()
+    assert (m1.assign_convert_module().tostring() ==
+            m2.assign_convert_module().tostring())
+    return m2
+
+def value_roundtrip(w_val):
+    writer = Writer()
+    writer.write_value(w_val)
+    data = writer.getvalue()
+    reader = Reader(data, ModTable())
+    reader.read_header()
+    w_res = reader.read_value()
+    assert reader.pos == len(data)
+    return w_res
+
+def test_ints():
+    for n in [0, 1, -1, 63, 64, -64, -65, 127, 128, 2 ** 31, -2 ** 63, 2 ** 63 - 1]:
+        writer = Writer()
+        writer.write_int(n)
+        reader = Reader(writer.out.build(), None)
+        assert reader.read_int() == n
+
+def test_values():
+    from rpython.rlib.rbigint import rbigint
+    from pycket.values_string import W_String
+    from pycket.vector import W_Vector
+    for w_val in [values.w_true, values.w_false, values.w_null, values.w_void]:
+        assert value_roundtrip(w_val) is w_val
+    assert value_roundtrip(values.W_Fixnum(-17)).value == -17
+    assert value_roundtrip(values.W_Flonum(-0.5)).value == -0.5
+    big = rbigint.fromdecimalstr("1" * 40)
+    assert value_roundtrip(values.W_Bignum(big)).value.eq(big)
+    w_rat = value_roundtrip(values.W_Rational.fromint(2, 3))
+    assert w_rat.tostring() == "2/3"
+    assert value_roundtrip(values.W_Character(u"λ")).value == u"λ"
+    assert value_roundtrip(W_String.make("abc")).as_str_utf8() == "abc"
+    assert value_roundtrip(values.W_Bytes.from_string("a\x00b")).as_str() == "a\x00b"
+    w_sym = values.W_Symbol.make("foo")
+    assert value_roundtrip(w_sym) is w_sym
+    w_kw = values.W_Keyword.make("bar")
+    assert value_roundtrip(w_kw) is w_kw
+    w_list = values.to_list([values.W_Fixnum(1), W_String.make("x"), w_sym])
+    assert value_roundtrip(w_list).tostring() == w_list.tostring()
+    w_vec = W_Vector.fromelements([values.W_Fixnum(1), values.W_Flonum(2.0)])
+    assert value_roundtrip(w_vec).tostring() == w_vec.tostring()
+
+def test_uninterned_symbols():
+    w_sym = values.W_Symbol(u"gensym")
+    w_unread = values.W_Symbol.make_unreadable("unreadable")
+    w_list = values.to_list([w_sym, w_sym, w_unread])
+    w_res = value_roundtrip(w_list)
+    w_first = w_res.car()
+    assert w_first is not w_sym
+    assert not w_first.is_interned()
+    assert w_res.cdr().car() is w_first
+    assert w_res.cdr().cdr().car() is w_unread
+
+def test_bad_data():
+    with pytest.raises(DeserializationError):
+        deserialize_module("garbage", ModTable())
+    json = loads(expand_string(format_pycket_mod("(define x 1)")))
+    data = serialize_module(_to_module(json, ModTable()), "")
+    with pytest.raises(DeserializationError):
+        deserialize_module(data[:-1], ModTable())
+
+def test_roundtrip_module():
+    roundtrip("""
+    (define (f x . rest) (if (null? rest) x (apply f rest)))
+    (define-values (a b) (values 1 2.5))
+    (define c (let loop ([i 0] [acc '()]) (if (= i 3) acc (loop (+ i 1) (cons i acc)))))
+    (define d (case-lambda [(x) x] [(x y) (+ x y)]))
+    (define e (let ([y 1]) (set! y 2) (begin0 y (set! y 3))))
+    (define g (letrec ([even? (lambda (n) (if (= n 0) #t (odd? (- n 1))))]
+                       [odd? (lambda (n) (if (= n 0) #f (even? (- n 1))))])
+                (even? 10)))
+    (define h '(1 "two" #\\3 #(4 5) #"six" 7/8 #:nine 1.5+2i))
+    (define i (with-continuation-mark 'k 'v (#%variable-reference)))
+    (define j #rx"a|b")
+    """)
+
+def test_roundtrip_run():
+    m = roundtrip("""
+    (define (fib n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))
+    (define x (fib 10))
+    """)
+    ov = m.assign_convert_module()
+    from pycket.env import ToplevelEnv
+    env = ToplevelEnv()
+    ov.interpret_mod(env)
+    assert ov.defs[values.W_Symbol.make("x")].value == 55
+
+def test_lazy_body():
+    from pycket.expand import _to_module_streaming
+    from pycket.interpreter import LazyBody
+    data = ('{"module-name": "m", "language": "", "body-forms": ['
+            '{"define-values": ["f"], "define-values-names": ["f"], '
+            '"define-values-body": {"lambda": [{"lexical": "x"}], '
+            '"body": [{"lexical": "x"}]}}]}')
+    modtable = ModTable()
+    modtable.lazy = True
+    m1 = _to_module_streaming(data, modtable)
+    data = serialize_module(m1, modtable.ast_flags())
+    modtable = ModTable()
+    modtable.lazy = True
+    m2 = deserialize_module(data, modtable)
+    body = m2.body[0].rhs.lams[0].body[0]
+    assert isinstance(body, LazyBody)
+    assert body.json == '[{"lexical": "x"}]'
+    assert modtable.lazy_lambdas == 1
+
+def test_other_ast_flags():
+    json = loads(expand_string(format_pycket_mod("(define (f x) x)")))
+    modtable = ModTable()
+    modtable.lazy = True
+    data = serialize_module(_to_module(json, modtable), modtable.ast_flags())
+    with pytest.raises(DeserializationError):
+        deserialize_module(data, ModTable())
+    modtable = ModTable()
+    modtable.lazy = True
+    modtable.inline = True
+    with pytest.raises(DeserializationError):
+        deserialize_module(data, modtable)
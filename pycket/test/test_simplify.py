@@ -0,0 +1,82 @@
+import pytest
+
+from pycket import values
+from pycket.error import SchemeException
+from pycket.expand import expand_string, _to_module, ModTable
+from pycket.simplify import Simplifier, count_nodes
+from pycket.interpreter import interpret_module, App, If, Quote, Let
+from pycket.pycket_json import loads
+from pycket.test.testhelper import format_pycket_mod
+
+def simplify(s):
+    json = loads(expand_string(format_pycket_mod(s)))
+    m = _to_module(json, ModTable())
+    simplifier = Simplifier()
+    simplified = simplifier.simplify_module(m)
+    assert count_nodes(simplified) <= count_nodes(m)
+    return simplifier, simplified.assign_convert_module()
+
+def lookup(m, name):
+    interpret_module(m)
+    return m.defs[values.W_Symbol.make(name)]
+
+def definition(m, name):
+    sym = values.W_Symbol.make(name)
+    for form in m.body:
+        if getattr(form, "names", None) == [sym]:
+            return form.rhs
+    assert 0, name
+
+def contains(ast, cls):
+    todo = [ast]
+    while todo:
+        ast = todo.pop()
+        if isinstance(ast, cls):
+            return True
+        todo.extend(ast.direct_children())
+    return False
+
+def test_fold_constants():
+    simplifier, m = simplify("""
+    (define x (+ (* 2 3) (- 10 4)))
+    (define y (not (eq? 'a 'a)))
+    """)
+    assert simplifier.folded == 5
+    assert isinstance(definition(m, "x"), Quote)
+    assert lookup(m, "x").value == 12
+    assert lookup(m, "y") is values.w_false
+
+def test_no_fold_errors_or_impure():
+    simplifier, m = simplify("""
+    (define (f) (car '()))
+    (define v (vector 1 2))
+    (define x (f))
+    """)
+    assert simplifier.folded == 0
+    assert contains(definition(m, "f"), App)
+    assert not isinstance(definition(m, "v"), Quote)
+    # primitive errors are not turned into Racket exceptions here, so
+    # with-handlers cannot catch them; the call still has to raise
+    with pytest.raises(SchemeException):
+        interpret_module(m)
+
+def test_dead_branches():
+    simplifier, m = simplify("""
+    (define (f x) (if (< 1 2) (+ x 1) (error 'f "dead")))
+    (define (g x) (if (zero? 1) 'dead x))
+    (define x (+ (f 1) (g 3)))
+    """)
+    assert not contains(definition(m, "f"), If)
+    assert not contains(definition(m, "g"), If)
+    assert lookup(m, "x").value == 5
+
+def test_unused_bindings():
+    simplifier, m = simplify("""
+    (define (f x)
+      (let ([unused 1] [h (lambda (y) y)])
+        (let-values ([() (values)])
+          (+ x 2))))
+    (define x (f 1))
+    """)
+    assert not contains(definition(m, "f"), Let)
+    assert lookup(m, "x").value == 3
@@ -663,8 +663,8 @@ class W_Complex(W_Number):
         return self.real.eqv(other.real) and self.imag.eqv(other.imag)
 
     def hash_equal(self):
-        hash1 = compute_hash(self.real)
-        hash2 = compute_hash(self.imag)
+        hash1 = self.real.hash_equal()
+        hash2 = self.imag.hash_equal()
         return rarithmetic.intmask(hash1 + 1000003 * hash2)
 
     def tostring(self):
@@ -1007,15 +1007,18 @@ class W_ThunkProcCMK(W_Procedure):
 
 
 class W_Prim(W_Procedure):
-    _immutable_fields_ = ["name", "code", "arity", "simple1", "simple2"]
+    _immutable_fields_ = ["name", "code", "arity", "simple1", "simple2", "pure_code"]
 
-    def __init__ (self, name, code, arity=Arity.unknown, simple1=None, simple2=None):
+    def __init__ (self, name, code, arity=Arity.unknown, simple1=None, simple2=None,
+                  pure_code=None):
         self.name = name
         self.code = code
         assert isinstance(arity, Arity)
         self.arity = arity
         self.simple1 = simple1
         self.simple2 = simple2
+        # for pure primitives: the function taking the list of arguments
+        self.pure_code = pure_code
 
     def get_arity(self):
         return self.arity
@@ -1106,8 +1109,15 @@ class W_Closure(W_Procedure):
         return self.caselam.get_arity()
 
     @jit.unroll_safe
-    def _find_lam(self, args):
+    def _find_lam(self, args, calling_app=None):
         jit.promote(self.caselam)
+        # with a single case the cache would save nothing
+        if (not jit.we_are_jitted() and calling_app is not None and
+                len(self.caselam.lams) > 1):
+            i = calling_app.lambda_index(self.caselam, args)
+            if i >= 0:
+                lam = self.caselam.lams[i]
+                return (lam.match_args(args), self._get_list(i), lam)
         for (i, lam) in enumerate(self.caselam.lams):
             try:
                 actuals = lam.match_args(args)
@@ -1125,7 +1135,9 @@ class W_Closure(W_Procedure):
             env_structure = calling_app.env_structure
         jit.promote(self.caselam)
         jit.promote(env_structure)
-        (actuals, frees, lam) = self._find_lam(args)
+        (actuals, frees, lam) = self._find_lam(args, calling_app)
+        if config.count_calls:
+            lam.call_count += 1
         if not jit.we_are_jitted() and env.pycketconfig().callgraph:
             env.toplevel_env().callgraph.register_call(lam, calling_app, cont, env)
         # specialize on the fact that often we end up executing in the
@@ -1178,6 +1190,8 @@ class W_Closure1AsEnv(ConsEnv):
         jit.promote(self.caselam)
         jit.promote(env_structure)
         lam = self.caselam.lams[0]
+        if config.count_calls:
+            lam.call_count += 1
         if not jit.we_are_jitted() and env.pycketconfig().callgraph:
             env.toplevel_env().callgraph.register_call(lam, calling_app, cont, env)
         actuals = lam.match_args(args)
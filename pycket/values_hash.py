@@ -1,10 +1,15 @@
 from pycket.base import W_Object, SingletonMeta
-from pycket import values, values_string
+from pycket import values, values_string, values_struct
+from pycket import vector as values_vector
 from pycket.cont import continuation, label, loop_label
+from pycket.error import SchemeException
+from pycket.hamt import make_persistent_map
 from pycket import config
 
 from rpython.rlib.objectmodel import r_dict, compute_hash, import_from_mixin
+from rpython.rlib.rarithmetic import intmask
 from rpython.rlib import rerased
+import rpython.rlib.rweakref as weakref
 
 
 class W_Missing(W_Object):
@@ -36,10 +41,24 @@ class W_HashTable(W_Object):
     def length(self):
         raise NotImplementedError("abstract method")
 
+    def hash_copy(self):
+        """ A mutable table with the same keys and values, as hash-copy """
+        raise NotImplementedError("abstract method")
+
+    def hash_clear(self):
+        """ Remove all the keys, as hash-clear! """
+        raise NotImplementedError("abstract method")
+
     def get_item(self, i):
         # see get_dict_item at the bottom of the file for the interface
         raise NotImplementedError("abstract method")
 
+    def next_position(self, i):
+        # the first position from i on that get_item accepts, or -1. The
+        # positions stay valid while no key is added or removed, see
+        # get_dict_next_index at the bottom of the file
+        raise NotImplementedError("abstract method")
+
 
 class W_SimpleHashTable(W_HashTable):
     _attrs_ = ['data']
@@ -58,6 +77,9 @@ class W_SimpleHashTable(W_HashTable):
         for i, k in enumerate(keys):
             self.data[k] = vals[i]
 
+    def make_empty(self):
+        raise NotImplementedError("abstract method")
+
     def hash_items(self):
         return self.data.items()
 
@@ -74,7 +96,8 @@ class W_SimpleHashTable(W_HashTable):
     @label
     def hash_remove(self, k, env, cont):
         from pycket.interpreter import return_value
-        del self.data[k]
+        if k in self.data:
+            del self.data[k]
         return return_value(values.w_void, env, cont)
 
     @label
@@ -85,6 +108,14 @@ class W_SimpleHashTable(W_HashTable):
     def length(self):
         return len(self.data)
 
+    def hash_copy(self):
+        w_copy = self.make_empty()
+        w_copy.data = self.data.copy()
+        return w_copy
+
+    def hash_clear(self):
+        self.data = r_dict(self.cmp_value, self.hash_value, force_non_null=True)
+
 class W_EqvHashTable(W_SimpleHashTable):
     @staticmethod
     def hash_value(k):
@@ -94,9 +125,15 @@ class W_EqvHashTable(W_SimpleHashTable):
     def cmp_value(a, b):
         return a.eqv(b)
 
+    def make_empty(self):
+        return W_EqvHashTable([], [])
+
     def get_item(self, i):
         return get_dict_item(self.data, i)
 
+    def next_position(self, i):
+        return get_dict_next_index(self.data, i)
+
 class W_EqHashTable(W_SimpleHashTable):
     @staticmethod
     def hash_value(k):
@@ -112,47 +149,350 @@ class W_EqHashTable(W_SimpleHashTable):
         from pycket.prims.equal import eqp_logic
         return eqp_logic(a, b)
 
+    def make_empty(self):
+        return W_EqHashTable([], [])
+
     def get_item(self, i):
         return get_dict_item(self.data, i)
 
+    def next_position(self, i):
+        return get_dict_next_index(self.data, i)
+
+# Hashing for equal?: values that are equal? have the same equal_hash. The
+# hash follows the structure of conses, mutable conses, vectors, boxes and
+# transparent or prefab structs, like equal_func in prims/equal.py, and uses
+# hash_equal for the other values (numbers, strings, bytes, characters, and
+# the identity of everything else). Only the first EQUAL_HASH_MAX_NODES
+# values are looked at, which bounds the time for long lists and makes
+# cyclic values hash in finite time.
+#
+# Chaperones and impersonators are hashed as the value they wrap, without
+# running their interposition procedures. Structs with prop:equal+hash all
+# hash the same, as their hash procedure needs to be called in CPS.
+
+EQUAL_HASH_MAX_NODES = 64
+
+TAG_CONS    = 0x2c3f1
+TAG_MCONS   = 0x4e9d7
+TAG_VECTOR  = 0x61a05
+TAG_BOX     = 0x1b6c3
+TAG_STRUCT  = 0x5d2e9
+TAG_CUSTOM  = 0x3a7b5
+
+def _mix(h, x):
+    return intmask((h ^ x) * 1000003)
+
+def equal_hash(w_value):
+    h = 0x345678
+    todo = [w_value]
+    nodes = 0
+    while todo and nodes < EQUAL_HASH_MAX_NODES:
+        w_obj = todo.pop()
+        nodes += 1
+        while w_obj.is_proxy():
+            w_obj = w_obj.get_proxied()
+        if isinstance(w_obj, values.W_Cons):
+            h = _mix(h, TAG_CONS)
+            todo.append(w_obj.cdr())
+            todo.append(w_obj.car())
+        elif isinstance(w_obj, values.W_MCons):
+            h = _mix(h, TAG_MCONS)
+            todo.append(w_obj.cdr())
+            todo.append(w_obj.car())
+        elif isinstance(w_obj, values_vector.W_Vector):
+            h = _mix(h, _mix(TAG_VECTOR, w_obj.length()))
+            # only the elements that fit in the budget of nodes
+            n = _budget(w_obj.length(), nodes, todo)
+            for i in range(n - 1, -1, -1):
+                todo.append(w_obj.ref(i))
+        elif isinstance(w_obj, values_vector.W_FlVector):
+            h = _mix(h, _mix(TAG_VECTOR, w_obj.length()))
+            n = _budget(w_obj.length(), nodes, todo)
+            for i in range(n - 1, -1, -1):
+                todo.append(w_obj.ref(i))
+        elif isinstance(w_obj, values.W_MBox):
+            h = _mix(h, TAG_BOX)
+            todo.append(w_obj.value)
+        elif isinstance(w_obj, values.W_IBox):
+            h = _mix(h, TAG_BOX)
+            todo.append(w_obj.value)
+        elif isinstance(w_obj, values_struct.W_RootStruct):
+            struct_type = w_obj.struct_type()
+            if struct_type.read_prop(values_struct.w_prop_equal_hash):
+                h = _mix(h, TAG_CUSTOM)
+            elif struct_type.isopaque:
+                h = _mix(h, w_obj.hash_equal())
+            else:
+                # compared as the vector of struct2vector
+                h = _mix(h, _mix(TAG_STRUCT, compute_hash(struct_type.name)))
+                fields = w_obj.vals()
+                n = _budget(len(fields), nodes, todo)
+                for i in range(n - 1, -1, -1):
+                    todo.append(fields[i])
+        else:
+            h = _mix(h, w_obj.hash_equal())
+    return h
+
+def _budget(length, nodes, todo):
+    """ How many of `length` parts fit in the nodes left to look at """
+    left = EQUAL_HASH_MAX_NODES - nodes - len(todo)
+    if left < 0:
+        return 0
+    return min(length, left)
+
+# equal? on chaperones, impersonators and structs with prop:equal+hash can
+# call back into Racket code, so it needs equal_func in prims/equal.py, which
+# is written in CPS. The immutable and weak tables compare the other keys
+# directly with equal_keys, and go through equal_index_loop as soon as one of
+# the keys involved needs the CPS version.
+
+DIRECT_EQUAL_MAX_NODES = 256
+
+def needs_cps_equal(w_value):
+    """ Can equal? on `w_value` run Racket code? Values with more than
+    DIRECT_EQUAL_MAX_NODES parts (cyclic ones, for example) count as such. """
+    todo = [w_value]
+    nodes = 0
+    while todo:
+        if nodes >= DIRECT_EQUAL_MAX_NODES:
+            return True
+        w_obj = todo.pop()
+        nodes += 1
+        if w_obj.is_proxy():
+            return True
+        if isinstance(w_obj, values.W_Cons):
+            todo.append(w_obj.cdr())
+            todo.append(w_obj.car())
+        elif isinstance(w_obj, values.W_MCons):
+            todo.append(w_obj.cdr())
+            todo.append(w_obj.car())
+        elif isinstance(w_obj, values_vector.W_Vector):
+            if nodes + len(todo) + w_obj.length() > DIRECT_EQUAL_MAX_NODES:
+                return True
+            for i in range(w_obj.length()):
+                todo.append(w_obj.ref(i))
+        elif isinstance(w_obj, values.W_Box):
+            todo.append(_box_value(w_obj))
+        elif isinstance(w_obj, values_struct.W_RootStruct):
+            struct_type = w_obj.struct_type()
+            if struct_type.read_prop(values_struct.w_prop_equal_hash):
+                return True
+            if not struct_type.isopaque:
+                fields = w_obj.vals()
+                if nodes + len(todo) + len(fields) > DIRECT_EQUAL_MAX_NODES:
+                    return True
+                todo.extend(fields)
+    return False
+
+def equal_keys(w_a, w_b):
+    """ equal? without CPS, for keys that needs_cps_equal accepts. Unlike
+    equal_func in prims/equal.py, chaperones, impersonators and structs with
+    prop:equal+hash are only equal to themselves. """
+    todo_a = [w_a]
+    todo_b = [w_b]
+    while todo_a:
+        a = todo_a.pop()
+        b = todo_b.pop()
+        if a.eqv(b):
+            continue
+        if a.is_proxy() or b.is_proxy():
+            return False
+        if isinstance(a, values.W_Cons) and isinstance(b, values.W_Cons):
+            todo_a.append(a.cdr())
+            todo_b.append(b.cdr())
+            todo_a.append(a.car())
+            todo_b.append(b.car())
+        elif isinstance(a, values.W_MCons) and isinstance(b, values.W_MCons):
+            todo_a.append(a.cdr())
+            todo_b.append(b.cdr())
+            todo_a.append(a.car())
+            todo_b.append(b.car())
+        elif isinstance(a, values.W_Box) and isinstance(b, values.W_Box):
+            todo_a.append(_box_value(a))
+            todo_b.append(_box_value(b))
+        elif (isinstance(a, values_vector.W_Vector) and
+              isinstance(b, values_vector.W_Vector)):
+            if a.length() != b.length():
+                return False
+            for i in range(a.length()):
+                todo_a.append(a.ref(i))
+                todo_b.append(b.ref(i))
+        elif (isinstance(a, values_struct.W_RootStruct) and
+              isinstance(b, values_struct.W_RootStruct)):
+            a_type = a.struct_type()
+            b_type = b.struct_type()
+            if (a_type.read_prop(values_struct.w_prop_equal_hash) or
+                    b_type.read_prop(values_struct.w_prop_equal_hash) or
+                    a_type.isopaque or b_type.isopaque):
+                return False
+            # compared as the vectors of struct2vector
+            a_fields = a.vals()
+            b_fields = b.vals()
+            if a_type.name != b_type.name or len(a_fields) != len(b_fields):
+                return False
+            todo_a.extend(a_fields)
+            todo_b.extend(b_fields)
+        elif not a.equal(b):
+            return False
+    return True
+
+def _box_value(w_box):
+    if isinstance(w_box, values.W_MBox):
+        return w_box.value
+    assert isinstance(w_box, values.W_IBox)
+    return w_box.value
+
+# The storage of ObjectHashmapStrategy: the entries in the order they were
+# added, and the positions of the entries of every equal_hash. Lookups only
+# compare the keys with the same hash with equal_func. Removed entries leave
+# a deleted slot behind, so that the positions of hash-iterate-* stay valid.
+# The slots are dropped when an entry is added to a list that is more than
+# half deleted.
+class EqualBuckets(object):
+    def __init__(self):
+        self.items = []
+        self.buckets = {}
+        self.deleted = 0
+
+    def add(self, key, val, hash):
+        if self.deleted > len(self.items) / 2:
+            self.compact()
+        bucket = self.buckets.get(hash, None)
+        if bucket is None:
+            bucket = self.buckets[hash] = []
+        bucket.append(len(self.items))
+        self.items.append((key, val))
+
+    def remove(self, hash, idx):
+        """ Remove the entry at `idx` in the bucket of `hash` """
+        bucket = self.buckets[hash]
+        self.items[bucket[idx]] = _deleted_item
+        self.deleted += 1
+        if len(bucket) == 1:
+            del self.buckets[hash]
+        else:
+            del bucket[idx]
+
+    def compact(self):
+        positions = [-1] * len(self.items)
+        items = []
+        for i in range(len(self.items)):
+            item = self.items[i]
+            if item[0] is not None:
+                positions[i] = len(items)
+                items.append(item)
+        for hash, bucket in self.buckets.iteritems():
+            self.buckets[hash] = [positions[i] for i in bucket]
+        self.items = items
+        self.deleted = 0
+
+    def length(self):
+        return len(self.items) - self.deleted
+
+    def live_items(self):
+        if not self.deleted:
+            return self.items
+        return [item for item in self.items if item[0] is not None]
+
+    def copy(self):
+        """ A copy that does not hash the keys again """
+        storage = EqualBuckets()
+        storage.items = self.items[:]
+        storage.deleted = self.deleted
+        for hash, bucket in self.buckets.iteritems():
+            storage.buckets[hash] = bucket[:]
+        return storage
+
+_deleted_item = (None, None)
+
+_no_bucket = []
+
+@loop_label
+def equal_index_loop(keys_w, idx, w_key, env, cont):
+    """ Return the index of the first of `keys_w` from `idx` on that is
+    equal? to `w_key`, as a fixnum, -1 if there is none """
+    from pycket.interpreter import return_value
+    from pycket.prims.equal import equal_func, EqualInfo
+    if idx >= len(keys_w):
+        return return_value(values.W_Fixnum(-1), env, cont)
+    info = EqualInfo.BASIC_SINGLETON
+    return equal_func(keys_w[idx], w_key, info, env,
+            equal_index_cont(keys_w, idx, w_key, env, cont))
+
+@continuation
+def equal_index_cont(keys_w, idx, w_key, env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    if check_one_val(_vals) is not values.w_false:
+        return return_value(values.W_Fixnum(idx), env, cont)
+    return equal_index_loop(keys_w, idx + 1, w_key, env, cont)
+
+def _found_index(_vals):
+    from pycket.interpreter import check_one_val
+    w_index = check_one_val(_vals)
+    assert isinstance(w_index, values.W_Fixnum)
+    return w_index.value
+
 @loop_label
-def equal_hash_ref_loop(data, idx, key, env, cont):
+def equal_hash_ref_loop(storage, bucket, idx, key, env, cont):
     from pycket.interpreter import return_value
     from pycket.prims.equal import equal_func, EqualInfo
-    if idx >= len(data):
+    if idx >= len(bucket):
         return return_value(w_missing, env, cont)
-    k, v = data[idx]
+    k, v = storage.items[bucket[idx]]
     info = EqualInfo.BASIC_SINGLETON
     return equal_func(k, key, info, env,
-            catch_ref_is_equal_cont(data, idx, key, v, env, cont))
+            catch_ref_is_equal_cont(storage, bucket, idx, key, v, env, cont))
 
 @continuation
-def catch_ref_is_equal_cont(data, idx, key, v, env, cont, _vals):
+def catch_ref_is_equal_cont(storage, bucket, idx, key, v, env, cont, _vals):
     from pycket.interpreter import check_one_val, return_value
     val = check_one_val(_vals)
     if val is not values.w_false:
         return return_value(v, env, cont)
-    return equal_hash_ref_loop(data, idx + 1, key, env, cont)
+    return equal_hash_ref_loop(storage, bucket, idx + 1, key, env, cont)
 
-def equal_hash_set_loop(data, idx, key, val, env, cont):
+def equal_hash_set_loop(storage, hash, idx, key, val, env, cont):
     from pycket.interpreter import check_one_val, return_value
     from pycket.prims.equal import equal_func, EqualInfo
-    if idx >= len(data):
-        data.append((key, val))
+    bucket = storage.buckets.get(hash, _no_bucket)
+    if idx >= len(bucket):
+        storage.add(key, val, hash)
         return return_value(values.w_void, env, cont)
-    k, _ = data[idx]
+    k, _ = storage.items[bucket[idx]]
     info = EqualInfo.BASIC_SINGLETON
     return equal_func(k, key, info, env,
-            catch_set_is_equal_cont(data, idx, key, val, env, cont))
+            catch_set_is_equal_cont(storage, hash, idx, key, val, env, cont))
 
 @continuation
-def catch_set_is_equal_cont(data, idx, key, val, env, cont, _vals):
+def catch_set_is_equal_cont(storage, hash, idx, key, val, env, cont, _vals):
     from pycket.interpreter import check_one_val, return_value
     cmp = check_one_val(_vals)
     if cmp is not values.w_false:
-        data[idx] = (key, val)
+        bucket = storage.buckets[hash]
+        storage.items[bucket[idx]] = (key, val)
         return return_value(values.w_void, env, cont)
-    return equal_hash_set_loop(data, idx + 1, key, val, env, cont)
+    return equal_hash_set_loop(storage, hash, idx + 1, key, val, env, cont)
+
+@loop_label
+def equal_hash_remove_loop(storage, hash, idx, key, env, cont):
+    from pycket.interpreter import return_value
+    from pycket.prims.equal import equal_func, EqualInfo
+    bucket = storage.buckets.get(hash, _no_bucket)
+    if idx >= len(bucket):
+        return return_value(values.w_void, env, cont)
+    k, _ = storage.items[bucket[idx]]
+    info = EqualInfo.BASIC_SINGLETON
+    return equal_func(k, key, info, env,
+            catch_remove_is_equal_cont(storage, hash, idx, key, env, cont))
+
+@continuation
+def catch_remove_is_equal_cont(storage, hash, idx, key, env, cont, _vals):
+    from pycket.interpreter import check_one_val, return_value
+    cmp = check_one_val(_vals)
+    if cmp is not values.w_false:
+        storage.remove(hash, idx)
+        return return_value(values.w_void, env, cont)
+    return equal_hash_remove_loop(storage, hash, idx + 1, key, env, cont)
 
 
 class HashmapStrategy(object):
@@ -164,18 +504,31 @@ class HashmapStrategy(object):
     def set(self, w_dict, w_key, w_val, env, cont):
         raise NotImplementedError("abstract base class")
 
+    def remove(self, w_dict, w_key, env, cont):
+        raise NotImplementedError("abstract base class")
+
     def items(self, w_dict):
         raise NotImplementedError("abstract base class")
 
     def get_item(self, w_dict, i):
         raise NotImplementedError("abstract base class")
 
+    def next_position(self, w_dict, i):
+        raise NotImplementedError("abstract base class")
+
     def length(self, w_dict):
         raise NotImplementedError("abstract base class")
 
     def create_storage(self, keys, vals):
         raise NotImplementedError("abstract base class")
 
+    def copy_storage(self, w_dict):
+        """ A copy of the storage of w_dict, for the same strategy """
+        raise NotImplementedError("abstract base class")
+
+    def clear(self, w_dict):
+        raise NotImplementedError("abstract base class")
+
 
 def _find_strategy_class(keys):
     if not config.strategies:
@@ -219,6 +572,16 @@ class UnwrappedHashmapStrategyMixin(object):
         self.switch_to_object_strategy(w_dict)
         return w_dict.hash_set(w_key, w_val, env, cont)
 
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        # keys of another type are not equal? to any of the keys
+        if self.is_correct_type(w_key):
+            d = self.unerase(w_dict.hstorage)
+            key = self.unwrap(w_key)
+            if key in d:
+                del d[key]
+        return return_value(values.w_void, env, cont)
+
     def items(self, w_dict):
         return [(self.wrap(key), w_val) for key, w_val in self.unerase(w_dict.hstorage).iteritems()]
 
@@ -226,6 +589,9 @@ class UnwrappedHashmapStrategyMixin(object):
         key, w_val = get_dict_item(self.unerase(w_dict.hstorage), i)
         return self.wrap(key), w_val
 
+    def next_position(self, w_dict, i):
+        return get_dict_next_index(self.unerase(w_dict.hstorage), i)
+
     def length(self, w_dict):
         return len(self.unerase(w_dict.hstorage))
 
@@ -240,6 +606,13 @@ class UnwrappedHashmapStrategyMixin(object):
     def _create_empty_dict(self):
         return {}
 
+    def copy_storage(self, w_dict):
+        # copies the unwrapped keys as they are, without rehashing them
+        return self.erase(self.unerase(w_dict.hstorage).copy())
+
+    def clear(self, w_dict):
+        w_dict.hstorage = self.erase(self._create_empty_dict())
+
     def switch_to_object_strategy(self, w_dict):
         d = self.unerase(w_dict.hstorage)
         keys = [self.wrap(key) for key in d.keys()]
@@ -261,12 +634,19 @@ class EmptyHashmapStrategy(HashmapStrategy):
         self.switch_to_correct_strategy(w_dict, w_key)
         return w_dict.hash_set(w_key, w_val, env, cont)
 
+    def remove(self, w_dict, w_key, env, cont):
+        from pycket.interpreter import return_value
+        return return_value(values.w_void, env, cont)
+
     def items(self, w_dict):
         return []
 
     def get_item(self, w_dict, i):
         raise IndexError
 
+    def next_position(self, w_dict, i):
+        return -1
+
     def length(self, w_dict):
         return 0
 
@@ -275,6 +655,12 @@ class EmptyHashmapStrategy(HashmapStrategy):
         assert not vals
         return self.erase(None)
 
+    def copy_storage(self, w_dict):
+        return self.erase(None)
+
+    def clear(self, w_dict):
+        pass
+
     def switch_to_correct_strategy(self, w_dict, w_key):
         if type(w_key) is values.W_Fixnum:
             strategy = FixnumHashmapStrategy.singleton
@@ -295,25 +681,51 @@ class ObjectHashmapStrategy(HashmapStrategy):
     erase, unerase = rerased.new_static_erasing_pair("object-hashmap-strategry")
 
     def get(self, w_dict, w_key, env, cont):
-        return equal_hash_ref_loop(self.unerase(w_dict.hstorage), 0, w_key, env, cont)
+        storage = self.unerase(w_dict.hstorage)
+        bucket = storage.buckets.get(equal_hash(w_key), _no_bucket)
+        return equal_hash_ref_loop(storage, bucket, 0, w_key, env, cont)
 
     def set(self, w_dict, w_key, w_val, env, cont):
-        return equal_hash_set_loop(self.unerase(w_dict.hstorage), 0, w_key, w_val, env, cont)
+        storage = self.unerase(w_dict.hstorage)
+        return equal_hash_set_loop(storage, equal_hash(w_key), 0, w_key,
+                                   w_val, env, cont)
+
+    def remove(self, w_dict, w_key, env, cont):
+        storage = self.unerase(w_dict.hstorage)
+        return equal_hash_remove_loop(storage, equal_hash(w_key), 0, w_key,
+                                      env, cont)
 
     def items(self, w_dict):
-        return self.unerase(w_dict.hstorage)
+        return self.unerase(w_dict.hstorage).live_items()
 
     def get_item(self, w_dict, i):
-        try:
-            return self.unerase(w_dict.hstorage)[i]
-        except IndexError:
-            raise
+        item = self.unerase(w_dict.hstorage).items[i]
+        if item[0] is None:
+            raise KeyError
+        return item
+
+    def next_position(self, w_dict, i):
+        items = self.unerase(w_dict.hstorage).items
+        while i < len(items):
+            if items[i][0] is not None:
+                return i
+            i += 1
+        return -1
 
     def length(self, w_dict):
-        return len(self.unerase(w_dict.hstorage))
+        return self.unerase(w_dict.hstorage).length()
 
     def create_storage(self, keys, vals):
-        return self.erase([(k, vals[i]) for i, k in enumerate(keys)])
+        storage = EqualBuckets()
+        for i, k in enumerate(keys):
+            storage.add(k, vals[i], equal_hash(k))
+        return self.erase(storage)
+
+    def copy_storage(self, w_dict):
+        return self.erase(self.unerase(w_dict.hstorage).copy())
+
+    def clear(self, w_dict):
+        w_dict.hstorage = self.erase(EqualBuckets())
 
 
 class FixnumHashmapStrategy(HashmapStrategy):
@@ -419,26 +831,844 @@ class W_EqualHashTable(W_HashTable):
     def hash_set(self, key, val, env, cont):
         return self.strategy.set(self, key, val, env, cont)
 
+    def hash_remove(self, key, env, cont):
+        return self.strategy.remove(self, key, env, cont)
+
     def hash_ref(self, key, env, cont):
         return self.strategy.get(self, key, env, cont)
 
     def get_item(self, i):
         return self.strategy.get_item(self, i)
 
+    def next_position(self, i):
+        return self.strategy.next_position(self, i)
+
     def length(self):
         return self.strategy.length(self)
 
+    def hash_copy(self):
+        w_copy = W_EqualHashTable([], [])
+        w_copy.strategy = self.strategy
+        w_copy.hstorage = self.strategy.copy_storage(self)
+        return w_copy
+
+    def hash_clear(self):
+        # keeps the strategy, the table is likely filled with the same keys
+        self.strategy.clear(self)
+
     def tostring(self):
         lst = [values.W_Cons.make(k, v).tostring() for k, v in self.hash_items()]
         return "#hash(%s)" % " ".join(lst)
 
 
+# Immutable hash tables, made by hash, hasheq, hasheqv, make-immutable-hash*
+# and the literals, are persistent maps (see hamt.py): hash-set and
+# hash-remove return a new table that shares most of its structure with the
+# old one. Like the mutable tables they have strategies for tables whose
+# keys are all fixnums or all symbols, which store unwrapped fixnums and
+# compare the keys without dispatching. The keys of the other tables are
+# compared with eqp_logic, eqv or equal_keys, depending on the kind of the
+# table.
+
+EQ_KIND = 0
+EQV_KIND = 1
+EQUAL_KIND = 2
+
+def _hash_eq(w_key):
+    return W_EqHashTable.hash_value(w_key)
+
+def _eq_eq(w_a, w_b):
+    return W_EqHashTable.cmp_value(w_a, w_b)
+
+def _hash_eqv(w_key):
+    return w_key.hash_eqv()
+
+def _eq_eqv(w_a, w_b):
+    return w_a.eqv(w_b)
+
+def _hash_identity(w_key):
+    return compute_hash(w_key)
+
+def _eq_identity(w_a, w_b):
+    return w_a is w_b
+
+def _hash_int(i):
+    return i
+
+def _eq_int(a, b):
+    return a == b
+
+FixnumMap = make_persistent_map("FixnumMap", _hash_int, _eq_int)
+SymbolMap = make_persistent_map("SymbolMap", _hash_identity, _eq_identity)
+EqMap = make_persistent_map("EqMap", _hash_eq, _eq_eq)
+EqvMap = make_persistent_map("EqvMap", _hash_eqv, _eq_eqv)
+EqualMap = make_persistent_map("EqualMap", equal_hash, equal_keys)
+
+
+class ImmutableHashmapStrategy(object):
+    __metaclass__ = SingletonMeta
+
+    # do all the lookups need equal_index_loop?
+    cps = False
+
+    def get(self, w_dict, w_key):
+        raise NotImplementedError("abstract base class")
+
+    def assoc(self, w_dict, w_key, w_val):
+        raise NotImplementedError("abstract base class")
+
+    def dissoc(self, w_dict, w_key):
+        raise NotImplementedError("abstract base class")
+
+    def items(self, w_dict):
+        raise NotImplementedError("abstract base class")
+
+    def length(self, w_dict):
+        raise NotImplementedError("abstract base class")
+
+    def empty_storage(self):
+        raise NotImplementedError("abstract base class")
+
+    def equal_map(self, w_dict):
+        """ The EqualMap of w_dict, None for the strategies that store
+        something else """
+        return None
+
+
+def _immutable_strategy_for(w_key, kind):
+    if not config.strategies:
+        return _object_strategy(kind)
+    if type(w_key) is values.W_Fixnum:
+        return FixnumImmutableHashmapStrategy.singleton
+    if type(w_key) is values.W_Symbol:
+        return SymbolImmutableHashmapStrategy.singleton
+    return _object_strategy(kind)
+
+def _object_strategy(kind):
+    if kind == EQ_KIND:
+        return EqImmutableHashmapStrategy.singleton
+    if kind == EQV_KIND:
+        return EqvImmutableHashmapStrategy.singleton
+    return EqualImmutableHashmapStrategy.singleton
+
+class EmptyImmutableHashmapStrategy(ImmutableHashmapStrategy):
+    erase, unerase = rerased.new_static_erasing_pair("empty-immutable-hashmap-strategy")
+
+    def get(self, w_dict, w_key):
+        return w_missing
+
+    def assoc(self, w_dict, w_key, w_val):
+        strategy = _immutable_strategy_for(w_key, w_dict.kind)
+        w_empty = W_ImmutableHashTable(w_dict.kind, strategy,
+                                       strategy.empty_storage())
+        return strategy.assoc(w_empty, w_key, w_val)
+
+    def dissoc(self, w_dict, w_key):
+        return w_dict
+
+    def items(self, w_dict):
+        return []
+
+    def length(self, w_dict):
+        return 0
+
+    def empty_storage(self):
+        return self.erase(None)
+
+class PersistentMapStrategyMixin(object):
+    # the concrete class needs to define Map, erase, unerase, is_correct_type,
+    # wrap and unwrap
+
+    def get(self, w_dict, w_key):
+        if not self.is_correct_type(w_key):
+            return w_missing
+        return self.unerase(w_dict.hstorage).get(self.unwrap(w_key), w_missing)
+
+    def assoc(self, w_dict, w_key, w_val):
+        if not self.is_correct_type(w_key):
+            return self.to_object_strategy(w_dict).assoc(w_key, w_val)
+        m = self.unerase(w_dict.hstorage)
+        new_m = m.assoc(self.unwrap(w_key), w_val)
+        if new_m is m:
+            return w_dict
+        return W_ImmutableHashTable(w_dict.kind, self, self.erase(new_m))
+
+    def dissoc(self, w_dict, w_key):
+        if not self.is_correct_type(w_key):
+            return w_dict
+        m = self.unerase(w_dict.hstorage)
+        new_m = m.dissoc(self.unwrap(w_key))
+        if new_m is m:
+            return w_dict
+        return W_ImmutableHashTable(w_dict.kind, self, self.erase(new_m))
+
+    def items(self, w_dict):
+        return [(self.wrap(key), w_val)
+                for key, w_val in self.unerase(w_dict.hstorage).items()]
+
+    def length(self, w_dict):
+        return self.unerase(w_dict.hstorage).size
+
+    def empty_storage(self):
+        return self.erase(self.Map.EMPTY)
+
+    def to_object_strategy(self, w_dict):
+        strategy = _object_strategy(w_dict.kind)
+        w_result = W_ImmutableHashTable(w_dict.kind, strategy,
+                                        strategy.empty_storage())
+        for key, w_val in self.unerase(w_dict.hstorage).items():
+            w_result = strategy.assoc(w_result, self.wrap(key), w_val)
+        return w_result
+
+class FixnumImmutableHashmapStrategy(ImmutableHashmapStrategy):
+    import_from_mixin(PersistentMapStrategyMixin)
+
+    Map = FixnumMap
+    erase, unerase = rerased.new_static_erasing_pair("fixnum-immutable-hashmap-strategy")
+
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values.W_Fixnum)
+
+    def wrap(self, val):
+        assert isinstance(val, int)
+        return values.W_Fixnum(val)
+
+    def unwrap(self, w_val):
+        assert isinstance(w_val, values.W_Fixnum)
+        return w_val.value
+
+class SymbolImmutableHashmapStrategy(ImmutableHashmapStrategy):
+    import_from_mixin(PersistentMapStrategyMixin)
+
+    Map = SymbolMap
+    erase, unerase = rerased.new_static_erasing_pair("symbol-immutable-hashmap-strategy")
+
+    def is_correct_type(self, w_obj):
+        return isinstance(w_obj, values.W_Symbol)
+
+    def wrap(self, val):
+        assert isinstance(val, values.W_Symbol)
+        return val
+
+    def unwrap(self, w_val):
+        assert isinstance(w_val, values.W_Symbol)
+        return w_val
+
+class ObjectImmutableHashmapStrategyMixin(object):
+    def is_correct_type(self, w_obj):
+        return True
+
+    def wrap(self, val):
+        return val
+
+    def unwrap(self, w_val):
+        return w_val
+
+class EqImmutableHashmapStrategy(ImmutableHashmapStrategy):
+    import_from_mixin(PersistentMapStrategyMixin)
+    import_from_mixin(ObjectImmutableHashmapStrategyMixin)
+
+    Map = EqMap
+    erase, unerase = rerased.new_static_erasing_pair("eq-immutable-hashmap-strategy")
+
+class EqvImmutableHashmapStrategy(ImmutableHashmapStrategy):
+    import_from_mixin(PersistentMapStrategyMixin)
+    import_from_mixin(ObjectImmutableHashmapStrategyMixin)
+
+    Map = EqvMap
+    erase, unerase = rerased.new_static_erasing_pair("eqv-immutable-hashmap-strategy")
+
+class EqualImmutableHashmapStrategy(ImmutableHashmapStrategy):
+    import_from_mixin(PersistentMapStrategyMixin)
+    import_from_mixin(ObjectImmutableHashmapStrategyMixin)
+
+    Map = EqualMap
+    erase, unerase = rerased.new_static_erasing_pair("equal-immutable-hashmap-strategy")
+
+    def equal_map(self, w_dict):
+        return self.unerase(w_dict.hstorage)
+
+class EqualCPSImmutableHashmapStrategy(ImmutableHashmapStrategy):
+    """ For the equal? tables with keys that need_cps_equal. The map is the
+    same as for EqualImmutableHashmapStrategy, but all the lookups compare
+    the keys with equal_index_loop """
+    import_from_mixin(PersistentMapStrategyMixin)
+    import_from_mixin(ObjectImmutableHashmapStrategyMixin)
+
+    Map = EqualMap
+    cps = True
+    erase, unerase = rerased.new_static_erasing_pair("equal-cps-immutable-hashmap-strategy")
+
+    def equal_map(self, w_dict):
+        return self.unerase(w_dict.hstorage)
+
+
+class W_ImmutableHashTable(W_HashTable):
+    _attrs_ = ['kind', 'strategy', 'hstorage', 'items_cache']
+    _immutable_fields_ = ['kind', 'strategy', 'hstorage']
+
+    def __init__(self, kind, strategy, hstorage):
+        self.kind = kind
+        self.strategy = strategy
+        self.hstorage = hstorage
+        # for iterating by position, made on demand
+        self.items_cache = None
+
+    @staticmethod
+    def make(kind, keys, vals):
+        """ The table of keys and vals, which must not need_cps_equal if kind
+        is EQUAL_KIND, see make_cps """
+        strategy = EmptyImmutableHashmapStrategy.singleton
+        w_dict = W_ImmutableHashTable(kind, strategy, strategy.empty_storage())
+        for i in range(len(keys)):
+            w_dict = w_dict.assoc(keys[i], vals[i])
+        return w_dict
+
+    @staticmethod
+    def make_cps(kind, keys, vals, env, cont):
+        from pycket.interpreter import return_value
+        if kind == EQUAL_KIND:
+            for i in range(len(keys)):
+                if needs_cps_equal(keys[i]):
+                    w_dict = W_ImmutableHashTable.make(kind, keys[:i], vals[:i])
+                    return immutable_make_loop(w_dict, keys, vals, i, env, cont)
+        return return_value(W_ImmutableHashTable.make(kind, keys, vals), env, cont)
+
+    def needs_cps(self, w_key):
+        """ Does looking up w_key need equal_index_loop? """
+        if self.strategy.cps:
+            return True
+        return self.kind == EQUAL_KIND and needs_cps_equal(w_key)
+
+    def _equal_map(self):
+        m = self.strategy.equal_map(self)
+        if m is None:
+            # fixnums or symbols, they can stay in the map
+            m = EqualMap.EMPTY
+            for w_key, w_val in self.hash_items():
+                m = m.assoc(w_key, w_val)
+        return m
+
+    def assoc_cps(self, w_key, w_val, env, cont):
+        """ assoc for keys that may need the equal? of CPS """
+        from pycket.interpreter import return_value
+        if not self.needs_cps(w_key):
+            return return_value(self.assoc(w_key, w_val), env, cont)
+        m = self._equal_map()
+        keys_w = [k for k, _ in m.candidates(w_key)]
+        return equal_index_loop(keys_w, 0, w_key, env,
+                immutable_assoc_cont(m, keys_w, w_key, w_val, env, cont))
+
+    def dissoc_cps(self, w_key, env, cont):
+        """ dissoc for keys that may need the equal? of CPS """
+        from pycket.interpreter import return_value
+        if not self.needs_cps(w_key):
+            return return_value(self.dissoc(w_key), env, cont)
+        m = self.strategy.equal_map(self)
+        if m is None:
+            # there are no keys that equal? can call Racket code for
+            return return_value(self, env, cont)
+        keys_w = [k for k, _ in m.candidates(w_key)]
+        return equal_index_loop(keys_w, 0, w_key, env,
+                immutable_dissoc_cont(self, m, keys_w, env, cont))
+
+    def immutable(self):
+        return True
+
+    def assoc(self, w_key, w_val):
+        """ This table with `w_key` mapped to `w_val`, as hash-set """
+        return self.strategy.assoc(self, w_key, w_val)
+
+    def dissoc(self, w_key):
+        """ This table without `w_key`, as hash-remove """
+        return self.strategy.dissoc(self, w_key)
+
+    def hash_items(self):
+        return self.strategy.items(self)
+
+    @label
+    def hash_set(self, key, val, env, cont):
+        raise SchemeException("hash-set!: contract violation, expected a mutable hash table")
+
+    @label
+    def hash_remove(self, key, env, cont):
+        raise SchemeException("hash-remove!: contract violation, expected a mutable hash table")
+
+    @label
+    def hash_ref(self, key, env, cont):
+        from pycket.interpreter import return_value
+        if self.needs_cps(key):
+            m = self.strategy.equal_map(self)
+            if m is not None:
+                entries = m.candidates(key)
+                keys_w = [k for k, _ in entries]
+                vals_w = [v for _, v in entries]
+                return equal_index_loop(keys_w, 0, key, env,
+                        found_value_cont(vals_w, env, cont))
+        return return_value(self.strategy.get(self, key), env, cont)
+
+    def length(self):
+        return self.strategy.length(self)
+
+    def hash_copy(self):
+        keys = []
+        vals = []
+        for w_key, w_val in self.hash_items():
+            keys.append(w_key)
+            vals.append(w_val)
+        if self.kind == EQ_KIND:
+            return W_EqHashTable(keys, vals)
+        if self.kind == EQV_KIND:
+            return W_EqvHashTable(keys, vals)
+        return W_EqualHashTable(keys, vals)
+
+    def hash_clear(self):
+        raise SchemeException("hash-clear!: contract violation, expected a mutable hash table")
+
+    def _items(self):
+        items = self.items_cache
+        if items is None:
+            items = self.items_cache = self.hash_items()
+        return items
+
+    def get_item(self, i):
+        return self._items()[i]
+
+    def next_position(self, i):
+        if i < self.length():
+            return i
+        return -1
+
+    def tostring(self):
+        lst = [values.W_Cons.make(k, v).tostring() for k, v in self.hash_items()]
+        if self.kind == EQ_KIND:
+            prefix = "#hasheq"
+        elif self.kind == EQV_KIND:
+            prefix = "#hasheqv"
+        else:
+            prefix = "#hash"
+        return "%s(%s)" % (prefix, " ".join(lst))
+
+
+
+def _cps_table(m):
+    strategy = EqualCPSImmutableHashmapStrategy.singleton
+    return W_ImmutableHashTable(EQUAL_KIND, strategy, strategy.erase(m))
+
+@continuation
+def found_value_cont(vals_w, env, cont, _vals):
+    from pycket.interpreter import return_value
+    i = _found_index(_vals)
+    if i < 0:
+        return return_value(w_missing, env, cont)
+    return return_value(vals_w[i], env, cont)
+
+@continuation
+def immutable_assoc_cont(m, keys_w, w_key, w_val, env, cont, _vals):
+    from pycket.interpreter import return_value
+    i = _found_index(_vals)
+    if i >= 0:
+        m = m.dissoc(keys_w[i])
+    return return_value(_cps_table(m.assoc(w_key, w_val)), env, cont)
+
+@continuation
+def immutable_dissoc_cont(w_dict, m, keys_w, env, cont, _vals):
+    from pycket.interpreter import return_value
+    i = _found_index(_vals)
+    if i < 0:
+        return return_value(w_dict, env, cont)
+    return return_value(_cps_table(m.dissoc(keys_w[i])), env, cont)
+
+def immutable_make_loop(w_dict, keys, vals, i, env, cont):
+    from pycket.interpreter import return_value
+    if i >= len(keys):
+        return return_value(w_dict, env, cont)
+    return w_dict.assoc_cps(keys[i], vals[i], env,
+            immutable_make_cont(keys, vals, i + 1, env, cont))
+
+@continuation
+def immutable_make_cont(keys, vals, i, env, cont, _vals):
+    from pycket.interpreter import check_one_val
+    w_dict = check_one_val(_vals)
+    assert isinstance(w_dict, W_ImmutableHashTable)
+    return immutable_make_loop(w_dict, keys, vals, i, env, cont)
+
+
+# Weak hash tables, made by make-weak-hash*, hold their keys with weakrefs,
+# like W_WeakBox. The values are held strongly, as in Racket. An entry whose
+# key died is dropped from its bucket when the bucket is looked at by
+# hash-ref, hash-set! or hash-remove!, and all of them are dropped by
+# hash-count, which needs the exact size, and when the list of entries grew to
+# twice the number of entries that were alive after the last purge (which
+# renumbers the positions of hash-iterate-*), so that tables that are only
+# added to, like memoization caches, do not grow without bound.
+#
+# Fixnums, characters and flonums are compared by value and would die
+# while equal keys are still reachable, so the entries hold them strongly.
+#
+# Once a key that needs_cps_equal was added to an equal? table, cps_keys is
+# set and all the lookups compare the keys with equal_index_loop.
+
+class WeakEntry(object):
+    _attrs_ = ['key', 'strong_key', 'hash', 'value', 'index']
+    _immutable_fields_ = ['key', 'strong_key', 'hash']
+
+    def __init__(self, w_key, hash, w_val, index):
+        self.key = weakref.ref(w_key)
+        # to find the bucket once the key died
+        self.hash = hash
+        if (isinstance(w_key, values.W_Fixnum) or
+                isinstance(w_key, values.W_Character) or
+                isinstance(w_key, values.W_Flonum)):
+            self.strong_key = w_key
+        else:
+            self.strong_key = None
+        self.value = w_val
+        # position in W_WeakHashTable.entries
+        self.index = index
+
+    def get_key(self):
+        return self.key()
+
+MIN_PURGE_SIZE = 16
+
+class W_WeakHashTable(W_HashTable):
+    _attrs_ = ['kind', 'entries', 'buckets', 'purge_size', 'cps_keys']
+    _immutable_fields_ = ['kind']
+
+    def __init__(self, kind, keys, vals):
+        """ keys must not need_cps_equal if kind is EQUAL_KIND, see make_cps """
+        self.kind = kind
+        # in the order they were added, None for the removed ones
+        self.entries = []
+        # hash -> entries
+        self.buckets = {}
+        self.purge_size = MIN_PURGE_SIZE
+        self.cps_keys = False
+        for i in range(len(keys)):
+            self.set(keys[i], vals[i])
+
+    @staticmethod
+    def make_cps(kind, keys, vals, env, cont):
+        from pycket.interpreter import return_value
+        if kind == EQUAL_KIND:
+            for i in range(len(keys)):
+                if needs_cps_equal(keys[i]):
+                    w_dict = W_WeakHashTable(kind, keys[:i], vals[:i])
+                    return weak_make_loop(w_dict, keys, vals, i, env, cont)
+        return return_value(W_WeakHashTable(kind, keys, vals), env, cont)
+
+    def needs_cps(self, w_key):
+        """ Does looking up w_key need equal_index_loop? """
+        if self.kind != EQUAL_KIND:
+            return False
+        return self.cps_keys or needs_cps_equal(w_key)
+
+    def candidates(self, hash):
+        """ The live entries with `hash` and their keys """
+        entries = []
+        keys_w = []
+        bucket = self.live_bucket(hash)
+        if bucket is not None:
+            for entry in bucket:
+                w_other = entry.get_key()
+                if w_other is not None:
+                    entries.append(entry)
+                    keys_w.append(w_other)
+        return entries, keys_w
+
+    def key_hash(self, w_key):
+        if self.kind == EQ_KIND:
+            return W_EqHashTable.hash_value(w_key)
+        if self.kind == EQV_KIND:
+            return w_key.hash_eqv()
+        return equal_hash(w_key)
+
+    def keys_equal(self, w_a, w_b):
+        if self.kind == EQ_KIND:
+            return W_EqHashTable.cmp_value(w_a, w_b)
+        if self.kind == EQV_KIND:
+            return w_a.eqv(w_b)
+        return equal_keys(w_a, w_b)
+
+    def live_bucket(self, hash):
+        """ The entries with `hash`, after dropping the dead ones """
+        bucket = self.buckets.get(hash, None)
+        if bucket is None:
+            return None
+        live = []
+        for entry in bucket:
+            if entry.get_key() is None:
+                self.entries[entry.index] = None
+            else:
+                live.append(entry)
+        if len(live) != len(bucket):
+            if not live:
+                del self.buckets[hash]
+                return None
+            self.buckets[hash] = live
+        return live
+
+    def find(self, w_key, hash):
+        bucket = self.live_bucket(hash)
+        if bucket is None:
+            return None
+        for entry in bucket:
+            w_other = entry.get_key()
+            if w_other is not None and self.keys_equal(w_other, w_key):
+                return entry
+        return None
+
+    def purge(self):
+        """ Drop all the dead entries and renumber the others """
+        entries = []
+        buckets = {}
+        for entry in self.entries:
+            if entry is None:
+                continue
+            w_key = entry.get_key()
+            if w_key is None:
+                continue
+            entry.index = len(entries)
+            entries.append(entry)
+            hash = entry.hash
+            bucket = buckets.get(hash, None)
+            if bucket is None:
+                buckets[hash] = [entry]
+            else:
+                bucket.append(entry)
+        self.entries = entries
+        self.buckets = buckets
+        self.purge_size = max(MIN_PURGE_SIZE, 2 * len(entries))
+
+    def get(self, w_key):
+        entry = self.find(w_key, self.key_hash(w_key))
+        if entry is None:
+            return w_missing
+        return entry.value
+
+    def set(self, w_key, w_val):
+        hash = self.key_hash(w_key)
+        entry = self.find(w_key, hash)
+        if entry is not None:
+            entry.value = w_val
+            return
+        self.insert(w_key, hash, w_val)
+
+    def insert(self, w_key, hash, w_val):
+        """ Add an entry for a key that is not in the table """
+        if len(self.entries) >= self.purge_size:
+            self.purge()
+        self.add_entry(WeakEntry(w_key, hash, w_val, len(self.entries)))
+
+    def add_entry(self, entry):
+        self.entries.append(entry)
+        bucket = self.buckets.get(entry.hash, None)
+        if bucket is None:
+            self.buckets[entry.hash] = [entry]
+        else:
+            bucket.append(entry)
+
+    def remove(self, w_key):
+        entry = self.find(w_key, self.key_hash(w_key))
+        if entry is not None:
+            self.remove_entry(entry)
+
+    def remove_entry(self, entry):
+        # the equal? of a CPS lookup can run Racket code that removed the
+        # entry already
+        index = entry.index
+        if index < len(self.entries) and self.entries[index] is entry:
+            self.entries[index] = None
+        bucket = self.buckets.get(entry.hash, None)
+        if bucket is None or entry not in bucket:
+            return
+        if len(bucket) == 1:
+            del self.buckets[entry.hash]
+        else:
+            bucket.remove(entry)
+
+    def hash_items(self):
+        items = []
+        for entry in self.entries:
+            if entry is None:
+                continue
+            w_key = entry.get_key()
+            if w_key is not None:
+                items.append((w_key, entry.value))
+        return items
+
+    @label
+    def hash_set(self, key, val, env, cont):
+        from pycket.interpreter import return_value
+        if self.needs_cps(key):
+            self.cps_keys = True
+            hash = self.key_hash(key)
+            entries, keys_w = self.candidates(hash)
+            return equal_index_loop(keys_w, 0, key, env,
+                    weak_set_cont(self, entries, key, hash, val, env, cont))
+        self.set(key, val)
+        return return_value(values.w_void, env, cont)
+
+    @label
+    def hash_remove(self, key, env, cont):
+        from pycket.interpreter import return_value
+        if self.needs_cps(key):
+            entries, keys_w = self.candidates(self.key_hash(key))
+            return equal_index_loop(keys_w, 0, key, env,
+                    weak_remove_cont(self, entries, env, cont))
+        self.remove(key)
+        return return_value(values.w_void, env, cont)
+
+    @label
+    def hash_ref(self, key, env, cont):
+        from pycket.interpreter import return_value
+        if self.needs_cps(key):
+            entries, keys_w = self.candidates(self.key_hash(key))
+            return equal_index_loop(keys_w, 0, key, env,
+                    weak_ref_cont(entries, env, cont))
+        return return_value(self.get(key), env, cont)
+
+    def hash_copy(self):
+        # the live entries, with their hashes
+        w_copy = W_WeakHashTable(self.kind, [], [])
+        for entry in self.entries:
+            if entry is None:
+                continue
+            w_key = entry.get_key()
+            if w_key is None:
+                continue
+            w_copy.add_entry(WeakEntry(w_key, entry.hash, entry.value,
+                                       len(w_copy.entries)))
+        w_copy.purge_size = max(MIN_PURGE_SIZE, 2 * len(w_copy.entries))
+        w_copy.cps_keys = self.cps_keys
+        return w_copy
+
+    def hash_clear(self):
+        self.entries = []
+        self.buckets = {}
+        self.purge_size = MIN_PURGE_SIZE
+        self.cps_keys = False
+
+    def length(self):
+        # drops the dead entries, but leaves the positions of the others
+        count = 0
+        for i in range(len(self.entries)):
+            entry = self.entries[i]
+            if entry is None:
+                continue
+            if entry.get_key() is None:
+                self.live_bucket(entry.hash)
+            else:
+                count += 1
+        return count
+
+    def get_item(self, i):
+        entry = self.entries[i]
+        if entry is None:
+            raise KeyError
+        w_key = entry.get_key()
+        if w_key is None:
+            raise KeyError
+        return w_key, entry.value
+
+    def next_position(self, i):
+        while i < len(self.entries):
+            entry = self.entries[i]
+            if entry is not None and entry.get_key() is not None:
+                return i
+            i += 1
+        return -1
+
+    def tostring(self):
+        lst = [values.W_Cons.make(k, v).tostring() for k, v in self.hash_items()]
+        return "#<weak-hash(%s)>" % " ".join(lst)
+
+@continuation
+def weak_ref_cont(entries, env, cont, _vals):
+    from pycket.interpreter import return_value
+    i = _found_index(_vals)
+    if i < 0:
+        return return_value(w_missing, env, cont)
+    return return_value(entries[i].value, env, cont)
+
+@continuation
+def weak_set_cont(w_dict, entries, w_key, hash, w_val, env, cont, _vals):
+    from pycket.interpreter import return_value
+    i = _found_index(_vals)
+    if i >= 0:
+        entries[i].value = w_val
+    else:
+        w_dict.insert(w_key, hash, w_val)
+    return return_value(values.w_void, env, cont)
+
+@continuation
+def weak_remove_cont(w_dict, entries, env, cont, _vals):
+    from pycket.interpreter import return_value
+    i = _found_index(_vals)
+    if i >= 0:
+        w_dict.remove_entry(entries[i])
+    return return_value(values.w_void, env, cont)
+
+def weak_make_loop(w_dict, keys, vals, i, env, cont):
+    from pycket.interpreter import return_value
+    if i >= len(keys):
+        return return_value(w_dict, env, cont)
+    return w_dict.hash_set(keys[i], vals[i], env,
+            weak_make_cont(w_dict, keys, vals, i + 1, env, cont))
+
+@continuation
+def weak_make_cont(w_dict, keys, vals, i, env, cont, _vals):
+    return weak_make_loop(w_dict, keys, vals, i, env, cont)
+
+
+# Untranslated, the positions of a dict are indexes into a list of its keys,
+# kept for the last few dicts so that iterating is not quadratic. Keys are
+# only ever appended to the list: the removed ones are invalid positions like
+# the deleted entries of a translated dict, and the added ones are appended
+# when an iteration starts at position 0.
+_UNTRANSLATED_DICTS = 16
+_untranslated_keys = {}
+
+def _keys_of(d, refresh=False):
+    entry = _untranslated_keys.get(id(d), None)
+    if entry is None or entry[0] is not d:
+        if len(_untranslated_keys) >= _UNTRANSLATED_DICTS:
+            _untranslated_keys.clear()
+        keys = d.keys()
+        _untranslated_keys[id(d)] = (d, keys)
+        return keys
+    keys = entry[1]
+    if refresh:
+        # the keys of d that are in the list, compared like d does
+        listed = d.copy()
+        listed.clear()
+        for key in keys:
+            if key in d:
+                listed[key] = None
+        if len(listed) != len(d):
+            keys.extend([key for key in d.keys() if key not in listed])
+    return keys
 
 def get_dict_item(d, i):
     """ return item of dict d at position i. Raises a KeyError if the index
     carries no valid entry. Raises IndexError if the index is beyond the end of
     the dict. """
-    return d.items()[i]
+    keys = _keys_of(d)
+    key = keys[i]
+    if key not in d:
+        raise KeyError
+    return key, d[key]
+
+def get_dict_next_index(d, i):
+    """ return the first position from i on that carries a valid entry of dict
+    d, or -1 if there is none. """
+    keys = _keys_of(d, refresh=(i == 0))
+    while i < len(keys):
+        if keys[i] in d:
+            return i
+        i += 1
+    return -1
 
 def ll_get_dict_item(RES, dict, i):
     from rpython.rtyper.lltypesystem import lltype
@@ -456,6 +1686,16 @@ def ll_get_dict_item(RES, dict, i):
     else:
         raise KeyError
 
+def ll_get_dict_next_index(dict, i):
+    entries = dict.entries
+    entries_len = len(entries)
+    assert i >= 0
+    while i < entries_len:
+        if entries.valid(i):
+            return i
+        i += 1
+    return -1
+
 from rpython.rtyper.extregistry import ExtRegistryEntry
 
 
@@ -479,4 +1719,16 @@ class Entry(ExtRegistryEntry):
         v_res = hop.gendirectcall(ll_get_dict_item, cTUPLE, v_dict, v_index)
         return v_res
 
+class NextIndexEntry(ExtRegistryEntry):
+    _about_ = get_dict_next_index
+
+    def compute_result_annotation(self, s_d, s_i):
+        from rpython.annotator.model import SomeInteger
+        return SomeInteger()
 
+    def specialize_call(self, hop):
+        from rpython.rtyper.lltypesystem import lltype
+        dictrepr = hop.rtyper.getrepr(hop.args_s[0])
+        v_dict, v_index = hop.inputargs(dictrepr, lltype.Signed)
+        hop.exception_cannot_occur()
+        return hop.gendirectcall(ll_get_dict_next_index, v_dict, v_index)